@@ -5,16 +5,20 @@ class AlgoConfig:
         self.share_optimizer = False # if True, lr for actor and critic will be the same
         self.action_type = "continuous" # continuous action space
         self.gamma = 0.99 # discount factor
+        self.return_type = "mc" # "mc": normalized monte carlo returns, "gae": generalized advantage estimation with TD(lambda) critic targets
+        self.gae_lambda = 0.95 # lambda for gae
+        self.vectorized_returns = True # compute mc returns with the vectorized scan in algos/base/returns.py, False for the python loop
         self.k_epochs = 4 # update policy for K epochs
         self.lr = 0.0001 # for shared optimizer
         self.actor_lr = 0.0003 # learning rate for actor, must be specified if share_optimizer is False
         self.critic_lr = 0.001 # learning rate for critic, must be specified if share_optimizer is False
         self.critic_loss_coef = 0.5 # critic loss coefficient
         self.entropy_coef = 0.01 # entropy coefficient
-        self.buffer_type = "ONPOLICY_QUE" # buffer type
+        self.buffer_type = "ONPOLICY_QUE" # buffer type, "ONPOLICY_ROLLOUT" writes transitions of all interactors into preallocated arrays
         self.batch_size = 256 # ppo train batch size
         # self.batch_episode = -1 # ppo train batch episode, -1 means not using batch episode
         self.sgd_batch_size = 32 # sgd batch size
+        self.sgd_drop_last = False # drop the last incomplete minibatch of each epoch
         self.actor_hidden_dim = 256 # hidden dimension for actor
         self.critic_hidden_dim = 256 # hidden dimension for critic
         self.min_policy = 0 # min value for policy (for discrete action space)
\ No newline at end of file
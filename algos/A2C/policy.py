@@ -3,17 +3,21 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 from torch.distributions import Categorical,Normal
-import torch.utils.data as Data
 import numpy as np
 
 from algos.base.networks import ValueNetwork, CriticNetwork, ActorNetwork
 from algos.base.policies import BasePolicy
+from algos.base.returns import compute_returns, compute_gae, normalize
+from algos.base.samplers import MiniBatchSampler
 
 class Policy(BasePolicy):
     def __init__(self, cfg) -> None:
         super().__init__(cfg)
         self.cfg = cfg
         self.gamma = cfg.gamma
+        self.return_type = cfg.return_type # mc or gae
+        self.gae_lambda = cfg.gae_lambda
+        self.vectorized_returns = cfg.vectorized_returns
         self.entropy_coef = cfg.entropy_coef
         self.independ_actor = cfg.independ_actor
         self.share_optimizer = cfg.share_optimizer
@@ -24,6 +28,7 @@ class Policy(BasePolicy):
         self.k_epochs = cfg.k_epochs # update policy for K epochs
         self.batch_size = cfg.batch_size
         self.sgd_batch_size = cfg.sgd_batch_size
+        self.sampler = MiniBatchSampler(self.sgd_batch_size, n_epochs = self.k_epochs, drop_last = cfg.sgd_drop_last) # k_epochs of shuffled minibatches
         self.create_graph()
         self.create_optimizer()
         self.create_summary()
@@ -88,6 +93,46 @@ class Policy(BasePolicy):
         else:
             raise NameError('mode must be sample or predict')
         return action
+
+    def get_actions(self, states, mode='sample', columnar=False, **kwargs):
+        ''' get actions for a batch of states with one forward pass,
+            policy transitions are one dict of batched tensors if columnar
+        '''
+        if mode not in ['sample', 'predict']:
+            raise NameError('mode must be sample or predict')
+        states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32)
+        n_states = states.shape[0]
+        with torch.no_grad():
+            if not self.independ_actor:
+                if self.action_type.lower() == 'continuous':
+                    values, mus, sigmas = self.policy_net(states)
+                else:
+                    probs = self.policy_net(states)
+            else:
+                values = self.critic(states)
+                output = self.actor(states)
+                if self.action_type.lower() == 'continuous':
+                    mus, sigmas = output['mu'], output['sigma']
+                else:
+                    probs = output['probs']
+            if self.action_type.lower() == 'continuous':
+                sigmas = sigmas.expand_as(mus) # sigma may be shared by all states
+                if mode == 'predict':
+                    return list(mus.cpu().numpy()), {} if columnar else [{} for _ in range(n_states)]
+                dist = Normal(mus * self.action_scale + self.action_bias, sigmas)
+                actions = dist.sample()
+                actions = torch.clamp(actions, torch.tensor(self.action_space.low, device=self.device, dtype=torch.float32), torch.tensor(self.action_space.high, device=self.device, dtype=torch.float32))
+                policy_transitions = {'value': values, 'mu': mus, 'sigma': sigmas}
+            else:
+                if mode == 'predict':
+                    return list(torch.argmax(probs, dim=1).cpu().numpy()), {} if columnar else [{} for _ in range(n_states)]
+                dist = Categorical(probs)
+                actions = dist.sample()
+                log_probs = dist.log_prob(actions)
+                policy_transitions = {'value': values, 'probs': probs, 'log_probs': log_probs}
+        if not columnar: # per-state dicts keep the same [1, ...] shapes as update_policy_transition
+            policy_transitions = [{k: v[i:i+1] for k, v in policy_transitions.items()} for i in range(n_states)]
+        return list(actions.cpu().numpy()), policy_transitions
     
     def update_policy_transition(self):
         if self.action_type.lower() == 'continuous':
@@ -140,10 +185,15 @@ class Policy(BasePolicy):
 
     def learn(self, **kwargs): 
         states, actions, next_states, rewards, dones = kwargs.get('states'), kwargs.get('actions'), kwargs.get('next_states'), kwargs.get('rewards'), kwargs.get('dones')
+        segment_ends = kwargs.get('segment_ends') # only given by the on-policy rollout buffer, whose data are contiguous arrays
         if self.action_type.lower() == 'continuous':
             mus, sigmas = kwargs.get('mu'), kwargs.get('sigma')
-            mus = torch.stack(mus, dim=0).to(device=self.device, dtype=torch.float32)
-            sigmas = torch.stack(sigmas, dim=0).to(device=self.device, dtype=torch.float32)
+            if segment_ends is not None:
+                mus = torch.as_tensor(mus, device=self.device, dtype=torch.float32)
+                sigmas = torch.as_tensor(sigmas, device=self.device, dtype=torch.float32)
+            else:
+                mus = torch.stack(mus, dim=0).to(device=self.device, dtype=torch.float32)
+                sigmas = torch.stack(sigmas, dim=0).to(device=self.device, dtype=torch.float32)
             means = mus * self.action_scale + self.action_bias
             stds = sigmas
             dists = Normal(means,stds)
@@ -151,52 +201,87 @@ class Policy(BasePolicy):
             old_probs = torch.exp(old_log_probs)
         else:
             old_probs, old_log_probs  = kwargs.get('probs'), kwargs.get('log_probs')
-            old_probs = torch.cat(old_probs,dim=0).to(self.device) # shape:[batch_size,n_actions]
-            old_log_probs = torch.cat(old_log_probs,dim=0).to(self.device).unsqueeze(dim=1) # shape:[batch_size,1]
+            if segment_ends is not None:
+                old_probs = torch.as_tensor(old_probs, device=self.device, dtype=torch.float32) # shape:[batch_size,n_actions]
+                old_log_probs = torch.as_tensor(old_log_probs, device=self.device, dtype=torch.float32).unsqueeze(dim=1) # shape:[batch_size,1]
+            else:
+                old_probs = torch.cat(old_probs,dim=0).to(self.device) # shape:[batch_size,n_actions]
+                old_log_probs = torch.cat(old_log_probs,dim=0).to(self.device).unsqueeze(dim=1) # shape:[batch_size,1]
         # convert to tensor
         states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32) # shape:[batch_size,n_states]
         if self.action_type.lower() == 'continuous':
             actions = torch.tensor(np.array(actions), device=self.device, dtype=torch.float32) # shape:[batch_size,1]
         else:
-            actions = torch.tensor(np.array(actions), device=self.device, dtype=torch.int64) # shape:[batch_size,1]
+            actions = torch.tensor(np.array(actions), device=self.device, dtype=torch.int64).reshape(-1, 1) # shape:[batch_size,1]
         next_states = torch.tensor(np.array(next_states), device=self.device, dtype=torch.float32) # shape:[batch_size,n_states]
-        rewards = torch.tensor(np.array(rewards), device=self.device, dtype=torch.float32) # shape:[batch_size,1]
-        dones = torch.tensor(np.array(dones), device=self.device, dtype=torch.float32) # shape:[batch_size,1]
-        returns = self._compute_returns(rewards, dones) # shape:[batch_size,1]  
-        torch_dataset = Data.TensorDataset(states, actions, old_probs, old_log_probs,returns)
-        train_loader = Data.DataLoader(dataset=torch_dataset, batch_size=self.sgd_batch_size, shuffle=True,drop_last=False)
-        for _ in range(self.k_epochs):
-            for batch_idx, (states_sgd, actions_sgd, old_probs_sgd, old_log_probs_sgd, returns_sgd) in enumerate(train_loader):
-                values_sgd, new_log_probs_sgd, entropies = self.evaluate(states_sgd,actions_sgd)
-                advantages = returns_sgd - values_sgd.detach()
-                self.actor_loss = torch.mean(-new_log_probs_sgd*advantages.detach())
-                # + self.entropy_coef * entropies.mean()
-                self.critic_loss = torch.mean(
-                    F.mse_loss(values_sgd, returns_sgd.detach()))
+        rewards = torch.tensor(np.array(rewards), device=self.device, dtype=torch.float32).reshape(-1, 1) # shape:[batch_size,1]
+        dones = torch.tensor(np.array(dones), device=self.device, dtype=torch.float32).reshape(-1, 1) # shape:[batch_size,1]
+        if segment_ends is not None:
+            segment_ends = torch.as_tensor(segment_ends, device=self.device, dtype=torch.float32).reshape(-1, 1)
+        returns, fixed_advantages = self._compute_returns(rewards, dones, states, next_states, segment_ends) # shape:[batch_size,1]  
+        data = {'states': states, 'actions': actions, 'old_probs': old_probs, 'old_log_probs': old_log_probs, 'returns': returns}
+        if fixed_advantages is not None:
+            data['advantages'] = fixed_advantages
+        for batch in self.sampler.sample(data):
+            states_sgd, actions_sgd, old_probs_sgd, old_log_probs_sgd, returns_sgd = batch['states'], batch['actions'], batch['old_probs'], batch['old_log_probs'], batch['returns']
+            values_sgd, new_log_probs_sgd, entropies = self.evaluate(states_sgd,actions_sgd)
+            advantages = batch['advantages'] if fixed_advantages is not None else returns_sgd - values_sgd.detach()
+            self.actor_loss = torch.mean(-new_log_probs_sgd*advantages.detach())
+            # + self.entropy_coef * entropies.mean()
+            self.critic_loss = torch.mean(
+                F.mse_loss(values_sgd, returns_sgd.detach()))
 
-                ## AC algorithm
-                # td_target = rewards + self.gamma * self.critic(next_states) * (1 - dones)
-                # td_delta = td_target - self.critic(states_sgd)
-                # # log_probs = torch.log(self.actor(states_sgd)['probs'].gather(1, actions_sgd))
-                # output = self.actor(states_sgd)
-                # mu , sigma = output['mu'], output['sigma']
-                # mean = mu * self.action_scale + self.action_bias
-                # std = sigma
-                # dist = Normal(mean, std)
-                # log_probs = dist.log_prob(actions_sgd)
-                # self.actor_loss = torch.mean(-log_probs * td_delta.detach())
-                # self.critic_loss = torch.mean(
-                #     F.mse_loss(self.critic(states_sgd), td_target.detach()))
+            ## AC algorithm
+            # td_target = rewards + self.gamma * self.critic(next_states) * (1 - dones)
+            # td_delta = td_target - self.critic(states_sgd)
+            # # log_probs = torch.log(self.actor(states_sgd)['probs'].gather(1, actions_sgd))
+            # output = self.actor(states_sgd)
+            # mu , sigma = output['mu'], output['sigma']
+            # mean = mu * self.action_scale + self.action_bias
+            # std = sigma
+            # dist = Normal(mean, std)
+            # log_probs = dist.log_prob(actions_sgd)
+            # self.actor_loss = torch.mean(-log_probs * td_delta.detach())
+            # self.critic_loss = torch.mean(
+            #     F.mse_loss(self.critic(states_sgd), td_target.detach()))
 
-                self.actor_optimizer.zero_grad()
-                self.actor_loss.backward()
-                self.actor_optimizer.step()
-                self.critic_optimizer.zero_grad()
-                self.critic_loss.backward()
-                self.critic_optimizer.step() 
+            self.actor_optimizer.zero_grad()
+            self.actor_loss.backward()
+            self.actor_optimizer.step()
+            self.critic_optimizer.zero_grad()
+            self.critic_loss.backward()
+            self.critic_optimizer.step() 
         self.update_summary()
 
-    def _compute_returns(self, rewards, dones):
+    def _get_values(self, states):
+        ''' critic values of states, from the shared policy net if the actor is not independent
+        '''
+        if not self.independ_actor:
+            return self.policy_net(states)[0]
+        return self.critic(states)
+
+    def _compute_returns(self, rewards, dones, states, next_states, segment_ends = None):
+        ''' compute critic targets, and fixed advantages when using gae,
+            segment_ends mark the last step of each interactor's rollout, they end returns but bootstrap in gae
+        Returns:
+            returns (torch.Tensor): shape [batch_size, 1]
+            advantages (torch.Tensor): shape [batch_size, 1], None for mc since advantages are computed per minibatch
+        '''
+        truncateds = None
+        if segment_ends is not None:
+            truncateds = segment_ends * (1 - dones)
+            dones = torch.maximum(dones, segment_ends)
+        if self.return_type == 'gae':
+            with torch.no_grad():
+                values, next_values = self._get_values(states), self._get_values(next_states)
+            advantages, returns = compute_gae(rewards, values, next_values, dones, self.gamma, self.gae_lambda, truncateds = truncateds)
+            return returns, normalize(advantages)
+        if not self.vectorized_returns:
+            return self._compute_returns_loop(rewards, dones), None
+        returns = compute_returns(rewards, dones, self.gamma)
+        return normalize(returns), None
+
+    def _compute_returns_loop(self, rewards, dones):
         # monte carlo estimate of state rewards
         returns = []
         discounted_sum = 0
@@ -79,6 +79,22 @@ class Policy(BasePolicy):
         action = action.cpu().detach().numpy()[0]
         return action
 
+    def get_actions(self, states, mode = 'sample', **kwargs):
+        ''' get actions for a batch of states with one forward pass
+        '''
+        if mode not in ['sample', 'predict']:
+            raise NameError('mode must be sample or predict')
+        n_states = len(states)
+        with torch.no_grad():
+            states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32)
+            mus = self.actor(states)  # mu is in [-1, 1]
+            actions = (self.action_scale * mus + self.action_bias).cpu().numpy()
+        if mode == 'sample':
+            self.sample_count = kwargs.get('sample_count')
+            # evolve the OU process once per state, same as sampling state by state
+            actions = [self.ou_noise.get_action(action, self.sample_count) for action in actions]
+        return list(actions), [{} for _ in range(n_states)]
+
     def learn(self, **kwargs):
         ''' train policy
         '''
@@ -8,7 +8,7 @@ class AlgoConfig():
         self.epsilon_decay = 500  # epsilon decay
         self.gamma = 0.95  # reward discount factor
         self.lr = 0.0001  # learning rate
-        self.buffer_type = 'REPLAY_QUE' # replay buffer type
+        self.buffer_type = 'REPLAY_QUE' # replay buffer type, "REPLAY_FRAME" stores each frame of stacked image obs once, needs a FrameStack env wrapper
         self.buffer_size = 100000  # replay buffer size
         self.batch_size = 64  # batch size
         self.target_update = 4  # target network update frequency
@@ -48,6 +48,25 @@ class Policy(BasePolicy):
             q_values = self.policy_net(state)
             action = q_values.max(1)[1].item() # choose action corresponding to the maximum q value
         return action
+    def get_actions(self, states, mode = 'sample', **kwargs):
+        ''' get actions for a batch of states with one forward pass
+        '''
+        if mode not in ['sample', 'predict']:
+            raise NameError('mode must be sample or predict')
+        n_states = len(states)
+        with torch.no_grad():
+            states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32)
+            actions = self.policy_net(states).max(1)[1].cpu().numpy()
+        if mode == 'sample':
+            # epsilon decays once per state, same as calling sample_action state by state
+            sample_counts = self.sample_count + np.arange(1, n_states + 1)
+            self.sample_count += n_states
+            epsilons = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
+                np.exp(-1. * sample_counts / self.epsilon_decay)
+            self.epsilon = epsilons[-1]
+            random_idxs = np.flatnonzero(np.random.random(n_states) <= epsilons)
+            actions[random_idxs] = np.random.randint(self.action_space.n, size = len(random_idxs))
+        return actions.tolist(), [{} for _ in range(n_states)]
     def learn(self, **kwargs):
         ''' learn policy
         '''
@@ -21,9 +21,7 @@ Environment:
 '''
 import numpy as np
 import math
-import torch
-import random
-from collections import defaultdict
+from algos.base.tabular import QTable, TabularModel, discrete_n_states
 
 
 class Agent(object):
@@ -37,9 +35,11 @@ class Agent(object):
         self.epsilon_start = cfg.epsilon_start
         self.epsilon_end = cfg.epsilon_end
         self.epsilon_decay = cfg.epsilon_decay
-        self.Q_table = defaultdict(lambda: np.zeros(self.n_actions)) # use nested dictionary to represent Q(s,a), here set all Q(s,a)=0 initially, not like pseudo code
+        self.Q_table = QTable(self.n_actions, n_states = discrete_n_states(cfg)) # Q(s,a) array with one row per state, here set all Q(s,a)=0 initially, not like pseudo code
         self.n_planning = cfg.n_planning
-        self.model = dict()  # environment model
+        self.prioritized_sweeping = cfg.prioritized_sweeping
+        self.priority_threshold = cfg.priority_threshold
+        self.model = TabularModel()  # environment model over Q table rows
 
     def sample_action(self, state):
         ''' sample action with e-greedy policy while training
@@ -64,49 +64,69 @@ class Agent(object):
         # epsilon must decay(linear,exponential and etc.) for balancing exploration and exploitation
         self.epsilon = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
             math.exp(-1. * self.sample_count / self.epsilon_decay) 
-        if np.random.uniform(0, 1) > self.epsilon:
-            action = np.argmax(self.Q_table[str(state)]) # choose action corresponding to the maximum q value
-        else:
-            action = np.random.choice(self.n_actions) # choose action randomly
-        return action
+        return self.Q_table.epsilon_greedy(state, self.epsilon)
 
     def _epsilon_greedy_predict_action(self,state):
-        action = np.argmax(self.Q_table[str(state)])
-        return action
+        return self.Q_table.greedy(state)
 
     def _update_q_table(self, state, action, reward, next_state, done):
-        Q_predict = self.Q_table[str(state)][action] 
+        s, s_ = self.Q_table.index(state), self.Q_table.index(next_state)
+        Q = self.Q_table.values
+        Q_predict = Q[s, action]
         if done: # terminal state
             Q_target = reward  
         else:
-            Q_target = reward + self.gamma * np.max(self.Q_table[str(next_state)]) 
-        self.Q_table[str(state)][action] += self.lr * (Q_target - Q_predict)
+            Q_target = reward + self.gamma * np.max(Q[s_]) 
+        Q[s, action] += self.lr * (Q_target - Q_predict)
+        return s, s_
+
+    def _td_errors(self, slots):
+        Q = self.Q_table.values
+        states, actions = self.model.states[slots], self.model.actions[slots]
+        Q_target = self.model.rewards[slots] + self.gamma * np.max(Q[self.model.next_states[slots]], axis = 1) * (1 - self.model.dones[slots])
+        return Q_target - Q[states, actions]
+
+    def _update_priorities(self, slots):
+        """
+        reset priorities of the given slots and of the pairs leading into their states
+        """
+        slots = np.union1d(slots, self.model.predecessors(self.model.states[slots]))
+        self.model.priorities[slots] = np.abs(self._td_errors(slots))
+
+    def _planning(self):
+        """
+        update the q-table with n_planning pairs drawn from the environment model at once
+        """
+        if self.prioritized_sweeping:
+            slots = self.model.top(self.n_planning, self.priority_threshold)
+            counts = np.ones(len(slots))
+        else:
+            slots, counts = np.unique(self.model.sample(self.n_planning), return_counts = True)
+        if len(slots) == 0:
+            return
+        td_errors = self._td_errors(slots) # targets of the whole batch use the q-table before planning
+        # k updates of one pair towards a fixed target move it by 1 - (1 - lr)^k of the td error
+        self.Q_table.values[self.model.states[slots], self.model.actions[slots]] += (1 - (1 - self.lr) ** counts) * td_errors
+        if self.prioritized_sweeping:
+            self._update_priorities(slots)
 
     def update(self, state, action, reward, next_state, done):
         """
         update environment model and q_table
         """
-        self._update_q_table(state, action, reward, next_state, done)
-        self.model[(state, action)] = reward, next_state  # update environment model(add data into environment model)
-        # Update the q-table with data generated by the environment model
-        for _ in range(self.n_planning):
-            # Randomly select a state action pair that has been generated by the environment model
-            (state, action), (reward, next_state) = random.choice(list(self.model.items()))
-            self._update_q_table(state, action, reward, next_state, done)
+        s, s_ = self._update_q_table(state, action, reward, next_state, done)
+        slot = self.model.add(s, action, reward, s_, done)  # update environment model(add data into environment model)
+        if self.prioritized_sweeping:
+            self._update_priorities([slot])
+        self._planning()
 
     def save_model(self,path):
-        import dill
         from pathlib import Path
         # create path
         Path(path).mkdir(parents=True, exist_ok=True)
-        torch.save(
-            obj=self.Q_table,
-            f=path+"DynaQ_model.pkl",
-            pickle_module=dill
-        )
+        self.Q_table.save(path+"DynaQ_model.npy")
         print("Model saved!")
 
-    def load_model(self, path):
-        import dill
-        self.Q_table =torch.load(f=path+'DynaQ_model.pkl',pickle_module=dill)
+    def load_model(self, path, mmap_mode = None):
+        self.Q_table.load(path+"DynaQ_model.npy", mmap_mode = mmap_mode)
         print("Mode loaded!")
\ No newline at end of file
@@ -7,4 +7,6 @@ class AlgoConfig:
         self.epsilon_decay = 300 # epsilon decay rate
         self.gamma = 0.90 # discount factor
         self.lr = 0.1 # learning rate
-        self.n_planning = 10
\ No newline at end of file
+        self.n_planning = 10 # number of planning updates per env step, drawn from the model at once
+        self.prioritized_sweeping = False # plan on the pairs with the largest td errors instead of uniform samples
+        self.priority_threshold = 1e-4 # pairs with smaller td errors are not planned on in prioritized sweeping
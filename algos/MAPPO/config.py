@@ -10,6 +10,7 @@ class AlgoConfig:
         self.n_rollout_threads = 5 # Number of parallel envs for training rollouts
         self.n_eval_rollout_threads = 1 # Number of parallel envs for evaluation rollouts
         self.n_render_rollout_threads = 1 # Number of parallel envs for rendering rollouts
+        self.use_shm_vec_env = False # Whether to step training envs in subprocesses writing into shared memory [threads, agents, dim]
         self.num_env_steps = 1000000 # !! Number of environment steps to train (million)
         self.user_name = 'marl' # !
 
@@ -13,6 +13,41 @@ def _t2n(x):
     """Convert torch tensor to a numpy array."""
     return x.detach().cpu().numpy()
 
+def _merge(x):
+    """[envs, agents, ...] --> [envs * agents, ...], a view for contiguous arrays."""
+    return x.reshape(-1, *x.shape[2:])
+
+def _split(x, n_envs):
+    """[envs * agents, ...] --> [envs, agents, ...], replaces np.array(np.split(x, n_envs))."""
+    return x.reshape(n_envs, -1, *x.shape[1:])
+
+class ActionEnvEncoder(object):
+    """
+    Convert policy actions [..., act_dim] to the form the env takes, using a one-hot lookup table built once,
+    e.g. Discrete(5) actions of shape [envs, agents, 1] --> one-hot actions of shape [envs, agents, 5].
+    Other action spaces are passed through unchanged.
+    :param action_space: (gym.Space) action space of an agent.
+    """
+    def __init__(self, action_space):
+        self.table = None
+        if action_space.__class__.__name__ == "Discrete":
+            sizes = np.array([action_space.n])
+        elif action_space.__class__.__name__ == "MultiDiscrete":
+            sizes = np.asarray(action_space.high) + 1
+        else:
+            return
+        # sub actions occupy disjoint columns, sub action i with value a is row offsets[i] + a
+        self.offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        self.table = np.eye(int(sizes.sum()))
+
+    def __call__(self, actions):
+        if self.table is None:
+            return actions
+        idxs = actions.astype(np.int64) + self.offsets
+        if idxs.shape[-1] == 1:
+            return self.table[idxs[..., 0]]
+        return self.table[idxs].sum(axis=-2)  # concatenation of the one-hot codes of sub actions
+
 class Sep_Runner(object):
     def __init__(self, config):
 
@@ -98,7 +133,14 @@ class Sep_Runner(object):
                                        self.envs.action_space[agent_id])
             self.buffer.append(bu)
             self.trainer.append(tr)
-            
+
+        # agents using the same policy object are batched into one forward pass
+        policy_groups = {}
+        for agent_id in range(self.num_agents):
+            policy_groups.setdefault(id(self.trainer[agent_id].policy), []).append(agent_id)
+        self.policy_groups = list(policy_groups.values())
+        self.action_encoders = [ActionEnvEncoder(space) for space in self.envs.action_space]
+
     def run(self):
         raise NotImplementedError
 
@@ -110,7 +152,66 @@ class Sep_Runner(object):
 
     def insert(self, data):
         raise NotImplementedError
-    
+
+    def group_forward(self, fn_name, inputs, n_envs, **kwargs):
+        """
+        Call a policy method once per policy group, with the inputs of the agents in the group stacked.
+        :param fn_name: (str) policy method, e.g. get_actions or act.
+        :param inputs: (list) per input, a list of [envs, dim] arrays indexed by agent id.
+        :param n_envs: (int) number of envs of each input.
+        :param kwargs: passed to the policy method, e.g. deterministic=True.
+        :return outputs: (list) per output, a list of [envs, dim] arrays indexed by agent id.
+        """
+        outputs = None
+        for agent_ids in self.policy_groups:
+            trainer = self.trainer[agent_ids[0]]
+            trainer.prep_rollout()
+            # [agents * envs, dim]
+            group_inputs = [x[agent_ids[0]] if len(agent_ids) == 1 else np.concatenate([x[a] for a in agent_ids])
+                            for x in inputs]
+            group_outputs = getattr(trainer.policy, fn_name)(*group_inputs, **kwargs)
+            if outputs is None:
+                outputs = [[None] * self.num_agents for _ in group_outputs]
+            for output, group_output in zip(outputs, group_outputs):
+                group_output = _t2n(group_output)
+                group_output = group_output.reshape(len(agent_ids), n_envs, *group_output.shape[1:])
+                for i, agent_id in enumerate(agent_ids):
+                    output[agent_id] = group_output[i]
+        return outputs
+
+    def encode_actions(self, actions, action_encoders=None):
+        """
+        Build env actions from per agent [envs, dim] actions.
+        :return actions_env: (np.ndarray) [envs, agents, dim], or a list of per env lists if dims differ between agents.
+        """
+        action_encoders = self.action_encoders if action_encoders is None else action_encoders
+        actions_env = [encoder(action) for encoder, action in zip(action_encoders, actions)]
+        if all(a.shape == actions_env[0].shape for a in actions_env):
+            return np.stack(actions_env, axis=1)
+        return [list(env_actions) for env_actions in zip(*actions_env)]
+
+    def agent_obs(self, obs, agent_id):
+        """Obs [envs, dim] of one agent, obs of agents with different shapes come as object arrays."""
+        if obs.dtype == object:
+            return np.array(list(obs[:, agent_id]))
+        return obs[:, agent_id]
+
+    def get_share_obs(self, obs):
+        """
+        Critic inputs, a list of [envs, dim] arrays indexed by agent id. Centralized obs are taken as they are
+        from vec envs that write them (ShmMultiAgentVecEnv), otherwise they are the concatenated obs of all agents.
+        """
+        if not self.use_centralized_V:
+            return [self.agent_obs(obs, agent_id) for agent_id in range(self.num_agents)]
+        share_obs = getattr(self.envs, "share_obs", None)
+        if share_obs is not None:
+            return [share_obs[:, agent_id] for agent_id in range(self.num_agents)]
+        if obs.dtype == object:
+            share_obs = np.array([list(chain(*o)) for o in obs])
+        else:
+            share_obs = obs.reshape(obs.shape[0], -1)
+        return [share_obs] * self.num_agents
+
     @torch.no_grad()
     def compute(self):
         for agent_id in range(self.num_agents):
@@ -264,80 +365,36 @@ class Sep_EnvRunner(Sep_Runner):
     def warmup(self):
         # reset env
         obs = self.envs.reset()
-
-        share_obs = []
-        for o in obs:
-            share_obs.append(list(chain(*o)))
-        share_obs = np.array(share_obs)
+        share_obs = self.get_share_obs(obs)
+        available_actions = getattr(self.envs, "available_actions", None)
 
         for agent_id in range(self.num_agents):
-            if not self.use_centralized_V:
-                share_obs = np.array(list(obs[:, agent_id]))
-            self.buffer[agent_id].share_obs[0] = share_obs.copy()
-            self.buffer[agent_id].obs[0] = np.array(list(obs[:, agent_id])).copy()
+            self.buffer[agent_id].share_obs[0] = share_obs[agent_id]
+            self.buffer[agent_id].obs[0] = self.agent_obs(obs, agent_id)
+            if available_actions is not None:
+                self.buffer[agent_id].available_actions[0] = available_actions[:, agent_id]
 
     @torch.no_grad()
     def collect(self, step):
-        values = []
-        actions = []
-        temp_actions_env = []
-        action_log_probs = []
-        rnn_states = []
-        rnn_states_critic = []
-
-        for agent_id in range(self.num_agents):
-            self.trainer[agent_id].prep_rollout()
-            value, action, action_log_prob, rnn_state, rnn_state_critic = self.trainer[
-                agent_id
-            ].policy.get_actions(
-                self.buffer[agent_id].share_obs[step],
-                self.buffer[agent_id].obs[step],
-                self.buffer[agent_id].rnn_states[step],
-                self.buffer[agent_id].rnn_states_critic[step],
-                self.buffer[agent_id].masks[step],
-            )
-            # [agents, envs, dim]
-            values.append(_t2n(value))
-            action = _t2n(action)
-            # rearrange action
-            if self.envs.action_space[agent_id].__class__.__name__ == "MultiDiscrete":
-                for i in range(self.envs.action_space[agent_id].shape):
-                    uc_action_env = np.eye(
-                        self.envs.action_space[agent_id].high[i] + 1
-                    )[action[:, i]]
-                    if i == 0:
-                        action_env = uc_action_env
-                    else:
-                        action_env = np.concatenate((action_env, uc_action_env), axis=1)
-            elif self.envs.action_space[agent_id].__class__.__name__ == "Discrete":
-                action_env = np.squeeze(
-                    np.eye(self.envs.action_space[agent_id].n)[action], 1
-                )
-            else:
-                # TODO 这里改造成自己环境需要的形式即可
-                # TODO Here, you can change the action_env to the form you need
-                action_env = actions
-                # raise NotImplementedError
-
-            actions.append(action)
-            temp_actions_env.append(action_env)
-            action_log_probs.append(_t2n(action_log_prob))
-            rnn_states.append(_t2n(rnn_state))
-            rnn_states_critic.append(_t2n(rnn_state_critic))
-
+        # one forward pass per policy group, outputs are lists of [envs, dim] indexed by agent id
+        values, actions, action_log_probs, rnn_states, rnn_states_critic = self.group_forward(
+            "get_actions",
+            [[buffer.share_obs[step] for buffer in self.buffer],
+             [buffer.obs[step] for buffer in self.buffer],
+             [buffer.rnn_states[step] for buffer in self.buffer],
+             [buffer.rnn_states_critic[step] for buffer in self.buffer],
+             [buffer.masks[step] for buffer in self.buffer]]
+            + ([[buffer.available_actions[step] for buffer in self.buffer]]
+               if all(buffer.available_actions is not None for buffer in self.buffer) else []),
+            self.n_rollout_threads,
+        )
         # [envs, agents, dim]
-        actions_env = []
-        for i in range(self.n_rollout_threads):
-            one_hot_action_env = []
-            for temp_action_env in temp_actions_env:
-                one_hot_action_env.append(temp_action_env[i])
-            actions_env.append(one_hot_action_env)
-
-        values = np.array(values).transpose(1, 0, 2)
-        actions = np.array(actions).transpose(1, 0, 2)
-        action_log_probs = np.array(action_log_probs).transpose(1, 0, 2)
-        rnn_states = np.array(rnn_states).transpose(1, 0, 2, 3)
-        rnn_states_critic = np.array(rnn_states_critic).transpose(1, 0, 2, 3)
+        actions_env = self.encode_actions(actions)
+        values = np.stack(values, axis=1)
+        actions = np.stack(actions, axis=1)
+        action_log_probs = np.stack(action_log_probs, axis=1)
+        rnn_states = np.stack(rnn_states, axis=1)
+        rnn_states_critic = np.stack(rnn_states_critic, axis=1)
 
         return (
             values,
@@ -372,18 +429,13 @@ class Sep_EnvRunner(Sep_Runner):
         masks = np.ones((self.n_rollout_threads, self.num_agents, 1), dtype=np.float32)
         masks[dones == True] = np.zeros(((dones == True).sum(), 1), dtype=np.float32)
 
-        share_obs = []
-        for o in obs:
-            share_obs.append(list(chain(*o)))
-        share_obs = np.array(share_obs)
+        share_obs = self.get_share_obs(obs)
+        available_actions = getattr(self.envs, "available_actions", None)
 
         for agent_id in range(self.num_agents):
-            if not self.use_centralized_V:
-                share_obs = np.array(list(obs[:, agent_id]))
-
             self.buffer[agent_id].insert(
-                share_obs,
-                np.array(list(obs[:, agent_id])),
+                share_obs[agent_id],
+                self.agent_obs(obs, agent_id),
                 rnn_states[:, agent_id],
                 rnn_states_critic[:, agent_id],
                 actions[:, agent_id],
@@ -391,6 +443,7 @@ class Sep_EnvRunner(Sep_Runner):
                 values[:, agent_id],
                 rewards[:, agent_id],
                 masks[:, agent_id],
+                available_actions=None if available_actions is None else available_actions[:, agent_id],
             )
 
     @torch.no_grad()
@@ -411,53 +464,19 @@ class Sep_EnvRunner(Sep_Runner):
             (self.n_eval_rollout_threads, self.num_agents, 1), dtype=np.float32
         )
 
+        eval_action_encoders = [ActionEnvEncoder(space) for space in self.eval_envs.action_space]
         for eval_step in range(self.episode_length):
-            eval_temp_actions_env = []
-            for agent_id in range(self.num_agents):
-                self.trainer[agent_id].prep_rollout()
-                eval_action, eval_rnn_state = self.trainer[agent_id].policy.act(
-                    np.array(list(eval_obs[:, agent_id])),
-                    eval_rnn_states[:, agent_id],
-                    eval_masks[:, agent_id],
-                    deterministic=True,
-                )
-
-                eval_action = eval_action.detach().cpu().numpy()
-                # rearrange action
-                if (
-                    self.eval_envs.action_space[agent_id].__class__.__name__
-                    == "MultiDiscrete"
-                ):
-                    for i in range(self.eval_envs.action_space[agent_id].shape):
-                        eval_uc_action_env = np.eye(
-                            self.eval_envs.action_space[agent_id].high[i] + 1
-                        )[eval_action[:, i]]
-                        if i == 0:
-                            eval_action_env = eval_uc_action_env
-                        else:
-                            eval_action_env = np.concatenate(
-                                (eval_action_env, eval_uc_action_env), axis=1
-                            )
-                elif (
-                    self.eval_envs.action_space[agent_id].__class__.__name__
-                    == "Discrete"
-                ):
-                    eval_action_env = np.squeeze(
-                        np.eye(self.eval_envs.action_space[agent_id].n)[eval_action], 1
-                    )
-                else:
-                    raise NotImplementedError
-
-                eval_temp_actions_env.append(eval_action_env)
-                eval_rnn_states[:, agent_id] = _t2n(eval_rnn_state)
-
+            eval_actions, eval_rnn_state = self.group_forward(
+                "act",
+                [[np.array(list(eval_obs[:, agent_id])) for agent_id in range(self.num_agents)],
+                 [eval_rnn_states[:, agent_id] for agent_id in range(self.num_agents)],
+                 [eval_masks[:, agent_id] for agent_id in range(self.num_agents)]],
+                self.n_eval_rollout_threads,
+                deterministic=True,
+            )
+            eval_rnn_states = np.stack(eval_rnn_state, axis=1)
             # [envs, agents, dim]
-            eval_actions_env = []
-            for i in range(self.n_eval_rollout_threads):
-                eval_one_hot_action_env = []
-                for eval_temp_action_env in eval_temp_actions_env:
-                    eval_one_hot_action_env.append(eval_temp_action_env[i])
-                eval_actions_env.append(eval_one_hot_action_env)
+            eval_actions_env = self.encode_actions(eval_actions, eval_action_encoders)
 
             # Obser reward and next obs
             eval_obs, eval_rewards, eval_dones, eval_infos = self.eval_envs.step(
@@ -519,54 +538,17 @@ class Sep_EnvRunner(Sep_Runner):
             for step in range(self.episode_length):
                 calc_start = time.time()
 
-                temp_actions_env = []
-                for agent_id in range(self.num_agents):
-                    if not self.use_centralized_V:
-                        share_obs = np.array(list(obs[:, agent_id]))
-                    self.trainer[agent_id].prep_rollout()
-                    action, rnn_state = self.trainer[agent_id].policy.act(
-                        np.array(list(obs[:, agent_id])),
-                        rnn_states[:, agent_id],
-                        masks[:, agent_id],
-                        deterministic=True,
-                    )
-
-                    action = action.detach().cpu().numpy()
-                    # rearrange action
-                    if (
-                        self.envs.action_space[agent_id].__class__.__name__
-                        == "MultiDiscrete"
-                    ):
-                        for i in range(self.envs.action_space[agent_id].shape):
-                            uc_action_env = np.eye(
-                                self.envs.action_space[agent_id].high[i] + 1
-                            )[action[:, i]]
-                            if i == 0:
-                                action_env = uc_action_env
-                            else:
-                                action_env = np.concatenate(
-                                    (action_env, uc_action_env), axis=1
-                                )
-                    elif (
-                        self.envs.action_space[agent_id].__class__.__name__
-                        == "Discrete"
-                    ):
-                        action_env = np.squeeze(
-                            np.eye(self.envs.action_space[agent_id].n)[action], 1
-                        )
-                    else:
-                        raise NotImplementedError
-
-                    temp_actions_env.append(action_env)
-                    rnn_states[:, agent_id] = _t2n(rnn_state)
-
+                actions, rnn_state = self.group_forward(
+                    "act",
+                    [[np.array(list(obs[:, agent_id])) for agent_id in range(self.num_agents)],
+                     [rnn_states[:, agent_id] for agent_id in range(self.num_agents)],
+                     [masks[:, agent_id] for agent_id in range(self.num_agents)]],
+                    self.n_rollout_threads,
+                    deterministic=True,
+                )
+                rnn_states = np.stack(rnn_state, axis=1)
                 # [envs, agents, dim]
-                actions_env = []
-                for i in range(self.n_rollout_threads):
-                    one_hot_action_env = []
-                    for temp_action_env in temp_actions_env:
-                        one_hot_action_env.append(temp_action_env[i])
-                    actions_env.append(one_hot_action_env)
+                actions_env = self.encode_actions(actions)
 
                 # Obser reward and next obs
                 obs, rewards, dones, infos = self.envs.step(actions_env)
@@ -684,6 +666,7 @@ class Shared_Runner(object):
                                         self.envs.observation_space[0],
                                         share_observation_space,
                                         self.envs.action_space[0])
+        self.action_encoder = ActionEnvEncoder(self.envs.action_space[0])
 
     def run(self):
         """Collect training data, perform training updates, and evaluate policy."""
@@ -708,10 +691,10 @@ class Shared_Runner(object):
     def compute(self):
         """Calculate returns for the collected data."""
         self.trainer.prep_rollout()
-        next_values = self.trainer.policy.get_values(np.concatenate(self.buffer.share_obs[-1]),
-                                                np.concatenate(self.buffer.rnn_states_critic[-1]),
-                                                np.concatenate(self.buffer.masks[-1]))
-        next_values = np.array(np.split(_t2n(next_values), self.n_rollout_threads))
+        next_values = self.trainer.policy.get_values(_merge(self.buffer.share_obs[-1]),
+                                                _merge(self.buffer.rnn_states_critic[-1]),
+                                                _merge(self.buffer.masks[-1]))
+        next_values = _split(_t2n(next_values), self.n_rollout_threads)
         self.buffer.compute_returns(next_values, self.trainer.value_normalizer)
     
     def train(self):
@@ -862,16 +845,24 @@ class Shared_EnvRunner(Shared_Runner):
         obs = self.envs.reset()  # shape = (5, 2, 14)
 
         # replay buffer
-        if self.use_centralized_V:
-            share_obs = obs.reshape(self.n_rollout_threads, -1)  # shape = (5, 28)
-            share_obs = np.expand_dims(share_obs, 1).repeat(
-                self.num_agents, axis=1
-            )  # shape = (5, 2, 28)
-        else:
-            share_obs = obs
+        self.buffer.share_obs[0] = self.get_share_obs(obs)
+        self.buffer.obs[0] = obs
+        available_actions = getattr(self.envs, "available_actions", None)
+        if available_actions is not None:
+            self.buffer.available_actions[0] = available_actions
 
-        self.buffer.share_obs[0] = share_obs.copy()
-        self.buffer.obs[0] = obs.copy()
+    def get_share_obs(self, obs):
+        """
+        Critic inputs [envs, agents, dim]. Centralized obs are taken as they are from vec envs
+        that write them (ShmMultiAgentVecEnv), otherwise they are the concatenated obs of all agents.
+        """
+        if not self.use_centralized_V:
+            return obs
+        share_obs = getattr(self.envs, "share_obs", None)
+        if share_obs is not None:
+            return share_obs
+        share_obs = obs.reshape(self.n_rollout_threads, -1)  # shape = (5, 28)
+        return np.expand_dims(share_obs, 1).repeat(self.num_agents, axis=1)  # shape = (5, 2, 28)
 
     @torch.no_grad()
     def collect(self, step):
@@ -883,40 +874,21 @@ class Shared_EnvRunner(Shared_Runner):
             rnn_states,
             rnn_states_critic,
         ) = self.trainer.policy.get_actions(
-            np.concatenate(self.buffer.share_obs[step]),
-            np.concatenate(self.buffer.obs[step]),
-            np.concatenate(self.buffer.rnn_states[step]),
-            np.concatenate(self.buffer.rnn_states_critic[step]),
-            np.concatenate(self.buffer.masks[step]),
+            _merge(self.buffer.share_obs[step]),
+            _merge(self.buffer.obs[step]),
+            _merge(self.buffer.rnn_states[step]),
+            _merge(self.buffer.rnn_states_critic[step]),
+            _merge(self.buffer.masks[step]),
+            None if self.buffer.available_actions is None else _merge(self.buffer.available_actions[step]),
         )
         # [self.envs, agents, dim]
-        values = np.array(np.split(_t2n(value), self.n_rollout_threads))
-        actions = np.array(np.split(_t2n(action), self.n_rollout_threads))
-        action_log_probs = np.array(
-            np.split(_t2n(action_log_prob), self.n_rollout_threads)
-        )
-        rnn_states = np.array(np.split(_t2n(rnn_states), self.n_rollout_threads))
-        rnn_states_critic = np.array(
-            np.split(_t2n(rnn_states_critic), self.n_rollout_threads)
-        )
-        # rearrange action
-        if self.envs.action_space[0].__class__.__name__ == "MultiDiscrete":
-            for i in range(self.envs.action_space[0].shape):
-                uc_actions_env = np.eye(self.envs.action_space[0].high[i] + 1)[
-                    actions[:, :, i]
-                ]
-                if i == 0:
-                    actions_env = uc_actions_env
-                else:
-                    actions_env = np.concatenate((actions_env, uc_actions_env), axis=2)
-        elif self.envs.action_space[0].__class__.__name__ == "Discrete":
-            # actions  --> actions_env : shape:[10, 1] --> [5, 2, 5]
-            actions_env = np.squeeze(np.eye(self.envs.action_space[0].n)[actions], 2)
-        else:
-            # TODO 这里改造成自己环境需要的形式即可
-            # TODO Here, you can change the shape of actions_env to fit your environment
-            actions_env = actions
-            # raise NotImplementedError
+        values = _split(_t2n(value), self.n_rollout_threads)
+        actions = _split(_t2n(action), self.n_rollout_threads)
+        action_log_probs = _split(_t2n(action_log_prob), self.n_rollout_threads)
+        rnn_states = _split(_t2n(rnn_states), self.n_rollout_threads)
+        rnn_states_critic = _split(_t2n(rnn_states_critic), self.n_rollout_threads)
+        # rearrange action, e.g. discrete actions --> one-hot actions_env : shape:[5, 2, 1] --> [5, 2, 5]
+        actions_env = self.action_encoder(actions)
 
         return (
             values,
@@ -951,14 +923,8 @@ class Shared_EnvRunner(Shared_Runner):
         masks = np.ones((self.n_rollout_threads, self.num_agents, 1), dtype=np.float32)
         masks[dones == True] = np.zeros(((dones == True).sum(), 1), dtype=np.float32)
 
-        if self.use_centralized_V:
-            share_obs = obs.reshape(self.n_rollout_threads, -1)
-            share_obs = np.expand_dims(share_obs, 1).repeat(self.num_agents, axis=1)
-        else:
-            share_obs = obs
-
         self.buffer.insert(
-            share_obs,
+            self.get_share_obs(obs),
             obs,
             rnn_states,
             rnn_states_critic,
@@ -967,6 +933,7 @@ class Shared_EnvRunner(Shared_Runner):
             values,
             rewards,
             masks,
+            available_actions=getattr(self.envs, "available_actions", None),
         )
 
     @torch.no_grad()
@@ -982,38 +949,18 @@ class Shared_EnvRunner(Shared_Runner):
             (self.n_eval_rollout_threads, self.num_agents, 1), dtype=np.float32
         )
 
+        eval_action_encoder = ActionEnvEncoder(self.eval_envs.action_space[0])
         for eval_step in range(self.episode_length):
             self.trainer.prep_rollout()
             eval_action, eval_rnn_states = self.trainer.policy.act(
-                np.concatenate(eval_obs),
-                np.concatenate(eval_rnn_states),
-                np.concatenate(eval_masks),
+                _merge(eval_obs),
+                _merge(eval_rnn_states),
+                _merge(eval_masks),
                 deterministic=True,
             )
-            eval_actions = np.array(
-                np.split(_t2n(eval_action), self.n_eval_rollout_threads)
-            )
-            eval_rnn_states = np.array(
-                np.split(_t2n(eval_rnn_states), self.n_eval_rollout_threads)
-            )
-
-            if self.eval_envs.action_space[0].__class__.__name__ == "MultiDiscrete":
-                for i in range(self.eval_envs.action_space[0].shape):
-                    eval_uc_actions_env = np.eye(
-                        self.eval_envs.action_space[0].high[i] + 1
-                    )[eval_actions[:, :, i]]
-                    if i == 0:
-                        eval_actions_env = eval_uc_actions_env
-                    else:
-                        eval_actions_env = np.concatenate(
-                            (eval_actions_env, eval_uc_actions_env), axis=2
-                        )
-            elif self.eval_envs.action_space[0].__class__.__name__ == "Discrete":
-                eval_actions_env = np.squeeze(
-                    np.eye(self.eval_envs.action_space[0].n)[eval_actions], 2
-                )
-            else:
-                raise NotImplementedError
+            eval_actions = _split(_t2n(eval_action), self.n_eval_rollout_threads)
+            eval_rnn_states = _split(_t2n(eval_rnn_states), self.n_eval_rollout_threads)
+            eval_actions_env = eval_action_encoder(eval_actions)
 
             # Obser reward and next obs
             eval_obs, eval_rewards, eval_dones, eval_infos = self.eval_envs.step(
@@ -1080,31 +1027,14 @@ class Shared_EnvRunner(Shared_Runner):
 
                 self.trainer.prep_rollout()
                 action, rnn_states = self.trainer.policy.act(
-                    np.concatenate(obs),
-                    np.concatenate(rnn_states),
-                    np.concatenate(masks),
+                    _merge(obs),
+                    _merge(rnn_states),
+                    _merge(masks),
                     deterministic=True,
                 )
-                actions = np.array(np.split(_t2n(action), self.n_rollout_threads))
-                rnn_states = np.array(
-                    np.split(_t2n(rnn_states), self.n_rollout_threads)
-                )
-
-                if envs.action_space[0].__class__.__name__ == "MultiDiscrete":
-                    for i in range(envs.action_space[0].shape):
-                        uc_actions_env = np.eye(envs.action_space[0].high[i] + 1)[
-                            actions[:, :, i]
-                        ]
-                        if i == 0:
-                            actions_env = uc_actions_env
-                        else:
-                            actions_env = np.concatenate(
-                                (actions_env, uc_actions_env), axis=2
-                            )
-                elif envs.action_space[0].__class__.__name__ == "Discrete":
-                    actions_env = np.squeeze(np.eye(envs.action_space[0].n)[actions], 2)
-                else:
-                    raise NotImplementedError
+                actions = _split(_t2n(action), self.n_rollout_threads)
+                rnn_states = _split(_t2n(rnn_states), self.n_rollout_threads)
+                actions_env = self.action_encoder(actions)
 
                 # Obser reward and next obs
                 obs, rewards, dones, infos = envs.step(actions_env)
@@ -1,5 +1,7 @@
 import os
+import sys
 import time
+import importlib.util
 import numpy as np
 import torch
 from tensorboardX import SummaryWriter
@@ -7,6 +9,7 @@ from common.memories import SharedReplayBuffer
 # import imageio
 import gym
 from gym import spaces
+from multiprocessing import Process, Pipe
 
 def _t2n(x):
     """Convert torch tensor to a numpy array."""
@@ -598,6 +601,198 @@ class DummyVecEnv():
             raise NotImplementedError
 
 
+_SHM_MODULE_NAME = 'mappo_multiprocessing_env'
+
+
+def _shm_helpers():
+    """
+    envs/multiprocessing_env.py loaded from its file. trainer.py puts algos/MAPPO on sys.path and imports this
+    module as `envs`, which shadows the top-level envs package, so `import envs.multiprocessing_env` cannot be used.
+    """
+    module = sys.modules.get(_SHM_MODULE_NAME)
+    if module is None:
+        repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        spec = importlib.util.spec_from_file_location(_SHM_MODULE_NAME, os.path.join(repo_dir, 'envs', 'multiprocessing_env.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[_SHM_MODULE_NAME] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def shm_multi_agent_worker(remote, parent_remote, env_fn_wrapper, env_idx, shm_specs):
+    """
+    Worker of ShmMultiAgentVecEnv, writes the step results of env env_idx into row env_idx of the shared arrays
+    and only sends infos back.
+    """
+    parent_remote.close()
+    env = env_fn_wrapper.x()
+    shms, bufs = {}, {}
+    for key, spec in shm_specs.items():
+        shms[key], bufs[key] = _shm_helpers()._attach_shm_array(spec)
+
+    def write_obs(ob):
+        bufs['obs'][env_idx] = ob
+        bufs['share_obs'][env_idx] = np.reshape(ob, -1)  # concatenated obs of all agents, broadcast to each agent
+        if 'available_actions' in bufs and hasattr(env, 'get_available_actions'):
+            bufs['available_actions'][env_idx] = env.get_available_actions()
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                ob, reward, done, info = env.step(data)
+                bufs['rewards'][env_idx] = reward
+                bufs['dones'][env_idx] = done
+                if np.all(done):  # auto reset, as DummyVecEnv
+                    ob = env.reset()
+                write_obs(ob)
+                remote.send(info)
+            elif cmd == 'reset':
+                write_obs(env.reset())
+                remote.send(None)
+            elif cmd == 'render':
+                remote.send(env.render(mode=data))
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError
+    finally:
+        del bufs  # release views before closing shared memory
+        for shm in shms.values():
+            shm.close()
+
+
+class ShmMultiAgentVecEnv():
+    """
+    Same interface as DummyVecEnv, but each env runs in a subprocess that writes per agent obs, centralized share_obs,
+    rewards, dones and available actions into shared arrays laid out as the MAPPO buffers, i.e. [threads, agents, dim].
+    Only actions and infos go through the pipes, share_obs and available_actions of the last reset/step are
+    exposed as attributes, so the runner inserts them into the buffer as they are.
+    """
+    def __init__(self, env_fns):
+        self.waiting = False
+        self.closed = False
+        self.num_envs = len(env_fns)
+        env = env_fns[0]()
+        self.observation_space = env.observation_space
+        self.share_observation_space = env.share_observation_space
+        self.action_space = env.action_space
+        env.close()
+        self.num_agents = len(self.observation_space)
+        obs_shape = self.observation_space[0].shape
+        share_obs_shape = self.share_observation_space[0].shape
+        assert all(space.shape == obs_shape for space in self.observation_space), \
+            "agents must have the same observation shape to be stored as [threads, agents, dim]"
+        assert int(np.prod(share_obs_shape)) == self.num_agents * int(np.prod(obs_shape)), \
+            "share_obs is the concatenated obs of all agents"
+
+        n, m = self.num_envs, self.num_agents
+        buf_cfgs = {
+            'obs': ((n, m, *obs_shape), np.float32),
+            'share_obs': ((n, m, *share_obs_shape), np.float32),
+            'rewards': ((n, m, 1), np.float32),
+            'dones': ((n, m), np.bool_),
+        }
+        if self.action_space[0].__class__.__name__ == 'Discrete':
+            buf_cfgs['available_actions'] = ((n, m, self.action_space[0].n), np.float32)
+        self.share_obs = None
+        self.available_actions = None
+        self.shms, self.bufs, self.ps, self.remotes = {}, {}, [], []
+        shm_helpers = _shm_helpers()
+        try:
+            shm_specs = {}
+            for key, (shape, dtype) in buf_cfgs.items():
+                self.shms[key], self.bufs[key], shm_specs[key] = shm_helpers._create_shm_array(shape, dtype)
+            if 'available_actions' in self.bufs:
+                self.bufs['available_actions'].fill(1)  # all actions available unless the env has get_available_actions
+
+            self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(n)])
+            self.ps = [Process(target=shm_multi_agent_worker,
+                               args=(work_remote, remote, shm_helpers.CloudpickleWrapper(env_fn), env_idx, shm_specs))
+                       for env_idx, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns))]
+            for p in self.ps:
+                p.daemon = True  # if the main process crashes, we should not cause things to hang
+                p.start()
+            for remote in self.work_remotes:
+                remote.close()
+        except BaseException:
+            self._release()  # do not leak shared memory when the workers cannot be started
+            raise
+
+    def _read_obs(self):
+        """copy obs of all envs out of shared memory, the next step overwrites them"""
+        self.share_obs = self.bufs['share_obs'].copy()
+        if 'available_actions' in self.bufs:
+            self.available_actions = self.bufs['available_actions'].copy()
+        return self.bufs['obs'].copy()
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        """
+        :return obs: (np.ndarray) [threads, agents, obs_dim], already reset for finished envs.
+        :return rewards: (np.ndarray) [threads, agents, 1].
+        :return dones: (np.ndarray) [threads, agents].
+        :return infos: (list) infos of each env.
+        """
+        infos = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        obs = self._read_obs()
+        return obs, self.bufs['rewards'].copy(), self.bufs['dones'].copy(), infos
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        for remote in self.remotes:
+            remote.recv()
+        return self._read_obs()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.waiting:
+                for remote in self.remotes:
+                    remote.recv()
+            for remote in self.remotes:
+                remote.send(('close', None))
+        except (EOFError, OSError):  # a worker has died, the others are terminated below
+            pass
+        self._release()
+
+    def _release(self):
+        """stop workers that are still running and free the shared memory"""
+        for p in self.ps:
+            if p.pid is None:  # never started
+                continue
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self.bufs = {}
+        for shm in self.shms.values():
+            shm.close()
+            shm.unlink()
+        self.shms = {}
+        self.closed = True
+
+    def render(self, mode="human"):
+        for remote in self.remotes:
+            remote.send(('render', mode))
+        frames = [remote.recv() for remote in self.remotes]
+        if mode == "rgb_array":
+            return np.array(frames)
+
+
 class EnvCore(object):
     """
     # 环境中的智能体
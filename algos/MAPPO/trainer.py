@@ -13,7 +13,7 @@ parent_dir = os.path.abspath(os.path.join(os.getcwd(), "."))
 sys.path.append(parent_dir)
 
 from algos.MAPPO.config import AlgoConfig
-from algos.MAPPO.envs import DummyVecEnv
+from algos.MAPPO.envs import DummyVecEnv, ShmMultiAgentVecEnv
 
 """Train script for MPEs."""
 
@@ -33,7 +33,8 @@ def make_train_env(all_args):
 
         return init_env
 
-    return DummyVecEnv([get_env_fn(i) for i in range(all_args.n_rollout_threads)])
+    vec_env_cls = ShmMultiAgentVecEnv if all_args.use_shm_vec_env else DummyVecEnv
+    return vec_env_cls([get_env_fn(i) for i in range(all_args.n_rollout_threads)])
 
 
 def make_eval_env(all_args):
@@ -159,13 +160,13 @@ def main(args):
     else:
         from env_runner import Sep_Runner as Runner
 
-    runner = Runner(config)
-    runner.run()
-
-    # post process
-    envs.close()
-    if all_args.use_eval and eval_envs is not envs:
-        eval_envs.close()
+    try:
+        runner = Runner(config)
+        runner.run()
+    finally:  # close envs even if the runner fails, ShmMultiAgentVecEnv frees its shared memory on close
+        envs.close()
+        if all_args.use_eval and eval_envs is not envs:
+            eval_envs.close()
 
     runner.writter.export_scalars_to_json(str(runner.log_dir + "/summary.json"))
     runner.writter.close()
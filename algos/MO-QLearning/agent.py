@@ -1,7 +1,6 @@
 import numpy as np
 import math
-import torch
-from collections import defaultdict
+from algos.base.tabular import QTable, discrete_n_states
 
 class Agent(object):
     def __init__(self,cfg):
@@ -14,7 +13,7 @@ class Agent(object):
         self.epsilon_start = cfg.epsilon_start
         self.epsilon_end = cfg.epsilon_end
         self.epsilon_decay = cfg.epsilon_decay
-        self.Q_table  = defaultdict(lambda: np.zeros(self.n_actions)) # use nested dictionary to represent Q(s,a), here set all Q(s,a)=0 initially, not like pseudo code
+        self.Q_table = QTable(self.n_actions, n_states = discrete_n_states(cfg)) # scalarized Q(s,a) array with one row per state, here set all Q(s,a)=0 initially, not like pseudo code
         self.weights = cfg.weights
 
     # def scalarized_q_values(self, state) -> np.ndarray:
@@ -48,33 +47,24 @@ class Agent(object):
         # epsilon must decay(linear,exponential and etc.) for balancing exploration and exploitation
         self.epsilon = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
             math.exp(-1. * self.sample_count / self.epsilon_decay) 
-        if np.random.uniform(0, 1) > self.epsilon:
-            action = np.argmax(self.Q_table[str(state)]) # choose action corresponding to the maximum q value
-        else:
-            action = np.random.choice(self.n_actions) # choose action randomly
-        return action
+        return self.Q_table.epsilon_greedy(state, self.epsilon)
     def _epsilon_greedy_predict_action(self,state):
-        action = np.argmax(self.Q_table[str(state)])
-        return action
+        return self.Q_table.greedy(state)
     def update(self, state, action, reward, next_state, done):
-        Q_predict = self.Q_table[str(state)][action] 
+        s, s_ = self.Q_table.index(state), self.Q_table.index(next_state)
+        Q = self.Q_table.values
+        Q_predict = Q[s, action]
         if done: # terminal state
             Q_target = np.dot(reward, self.weights)  
         else:
-            Q_target = np.dot(reward, self.weights) + self.gamma * np.max(self.Q_table[str(next_state)]) 
-        self.Q_table[str(state)][action] += self.lr * (Q_target - Q_predict)
+            Q_target = np.dot(reward, self.weights) + self.gamma * np.max(Q[s_]) 
+        Q[s, action] += self.lr * (Q_target - Q_predict)
     def save_model(self,path):
-        import dill
         from pathlib import Path
         # create path
         Path(path).mkdir(parents=True, exist_ok=True)
-        torch.save(
-            obj=self.Q_table,
-            f=path+"MO-Qleaning_model.pkl",
-            pickle_module=dill
-        )
+        self.Q_table.save(path+"MO-Qleaning_model.npy")
         print("Model saved!")
-    def load_model(self, path):
-        import dill
-        self.Q_table =torch.load(f=path+'MO-Qleaning_model.pkl',pickle_module=dill)
+    def load_model(self, path, mmap_mode = None):
+        self.Q_table.load(path+"MO-Qleaning_model.npy", mmap_mode = mmap_mode)
         print("Mode loaded!")
\ No newline at end of file
@@ -10,25 +10,25 @@ Discription:
 Environment: 
 '''
 import numpy as np
-from collections import defaultdict
-import torch
-import dill
+from algos.base.returns import discount_cumsum
+from algos.base.tabular import QTable, discrete_n_states
 
 class Agent:
-    ''' On-Policy First-Visit MC Control
+    ''' On-Policy First-Visit MC Control, every-visit and constant step size updates are optional
     '''
     def __init__(self,cfg):
         self.n_actions = cfg.n_actions
         self.epsilon = cfg.epsilon
         self.gamma = cfg.gamma 
-        self.Q_table = defaultdict(lambda: np.zeros(cfg.n_actions))
-        self.returns_sum = defaultdict(float) # 保存return之和
-        self.returns_count = defaultdict(float)
+        self.lr = cfg.lr
+        self.visit_type = cfg.visit_type
+        self.update_type = cfg.update_type
+        self.Q_table = QTable(cfg.n_actions, n_states = discrete_n_states(cfg))
+        self.returns_count = np.zeros((0, cfg.n_actions)) # 保存return的个数, rows follow the Q table
         
     def sample_action(self,state):
-        state = str(state)
-        if state in self.Q_table.keys():
-            best_action = np.argmax(self.Q_table[state])
+        if state in self.Q_table:
+            best_action = self.Q_table.greedy(state)
             action_probs = np.ones(self.n_actions, dtype=float) * self.epsilon / self.n_actions
             action_probs[best_action] += (1.0 - self.epsilon)
             action = np.random.choice(np.arange(len(action_probs)), p=action_probs)
@@ -36,43 +36,46 @@ class Agent:
             action = np.random.randint(0,self.n_actions)
         return action
     def predict_action(self,state):
-        state = str(state)
-        if state in self.Q_table.keys():
-            best_action = np.argmax(self.Q_table[state])
-            action_probs = np.ones(self.n_actions, dtype=float) * self.epsilon / self.n_actions
-            action_probs[best_action] += (1.0 - self.epsilon)
-            action = np.argmax(self.Q_table[state])
+        if state in self.Q_table:
+            action = self.Q_table.greedy(state)
         else:
             action = np.random.randint(0,self.n_actions)
         return action
     def update(self,one_ep_transition):
-        # Find all (state, action) pairs we've visited in this one_ep_transition
-        # We convert each state to a tuple so that we can use it as a dict key
-        sa_in_episode = set([(str(x[0]), x[1]) for x in one_ep_transition])
-        for state, action in sa_in_episode:
-            sa_pair = (state, action)
-            # Find the first occurence of the (state, action) pair in the one_ep_transition
-
-            first_occurence_idx = next(i for i,x in enumerate(one_ep_transition)
-                                       if str(x[0]) == state and x[1] == action)
-            # Sum up all rewards since the first occurance
-            G = sum([x[2]*(self.gamma**i) for i,x in enumerate(one_ep_transition[first_occurence_idx:])])
-            # Calculate average return for this state over all sampled episodes
-            self.returns_sum[sa_pair] += G
-            self.returns_count[sa_pair] += 1.0
-            self.Q_table[state][action] = self.returns_sum[sa_pair] / self.returns_count[sa_pair]
+        states = self.Q_table.indices([x[0] for x in one_ep_transition]) # map states to table rows once
+        actions = np.array([x[1] for x in one_ep_transition], dtype=np.int64)
+        rewards = np.array([x[2] for x in one_ep_transition], dtype=float)
+        # discounted return of every step in one backward pass
+        returns = discount_cumsum(rewards, self.gamma, np.zeros(len(rewards)))
+        if self.visit_type == 'first':
+            # first occurence of every (state, action) pair in one forward pass
+            _, steps = np.unique(states * self.n_actions + actions, return_index=True)
+        elif self.visit_type == 'every':
+            steps = np.arange(len(states))
+        else:
+            raise NotImplementedError
+        # sum up the returns of each visited pair, pairs may repeat in every-visit mode
+        pair_ids, inverse, counts = np.unique(states[steps] * self.n_actions + actions[steps], return_inverse=True, return_counts=True)
+        returns_sum = np.bincount(inverse, weights=returns[steps])
+        s, a = pair_ids // self.n_actions, pair_ids % self.n_actions
+        Q = self.Q_table.values
+        if self.update_type == 'mean': # average return over all sampled episodes, updated incrementally
+            if len(self.returns_count) < len(Q):
+                self.returns_count = np.concatenate([self.returns_count, np.zeros((len(Q) - len(self.returns_count), self.n_actions))])
+            self.returns_count[s, a] += counts
+            Q[s, a] += (returns_sum - counts * Q[s, a]) / self.returns_count[s, a]
+        elif self.update_type == 'constant': # k steps of size lr towards the mean return of this episode
+            Q[s, a] += (1 - (1 - self.lr) ** counts) * (returns_sum / counts - Q[s, a])
+        else:
+            raise NotImplementedError
     def save_model(self,path=None):
         '''把 Q表格 的数据保存到文件中
         '''
         from pathlib import Path
         Path(path).mkdir(parents=True, exist_ok=True)
-        torch.save(
-            obj=self.Q_table,
-            f=path+"Q_table",
-            pickle_module=dill
-        )
+        self.Q_table.save(path+"Q_table.npy")
 
-    def load_model(self, path=None):
+    def load_model(self, path=None, mmap_mode=None):
         '''从文件中读取数据到 Q表格
         '''
-        self.Q_table =torch.load(f=path+"Q_table",pickle_module=dill)
\ No newline at end of file
+        self.Q_table.load(path+"Q_table.npy", mmap_mode=mmap_mode)
\ No newline at end of file
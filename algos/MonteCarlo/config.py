@@ -13,4 +13,6 @@ class AlgoConfig:
     def __init__(self) -> None:
         self.gamma = 0.90 # discount factor
         self.epsilon = 0.15 # epsilon greedy
-        self.lr = 0.1 # learning rate
\ No newline at end of file
+        self.lr = 0.1 # learning rate, step size of constant update_type
+        self.visit_type = 'first' # first: first-visit MC, every: every-visit MC
+        self.update_type = 'mean' # mean: sample average of returns, constant: incremental mean with step size lr
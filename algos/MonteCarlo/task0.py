@@ -46,6 +46,7 @@ class Main(Launcher):
         logger.info(f"n_states: {n_states}, n_actions: {n_actions}") # print info
         # update to cfg paramters
         setattr(cfg, 'n_states', n_states)
+        setattr(cfg, 'obs_space', env.observation_space) # the Q table is dense only for Discrete spaces
         setattr(cfg, 'n_actions', n_actions)
         agent = FisrtVisitMC(cfg)
         return env,agent
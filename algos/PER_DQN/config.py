@@ -18,7 +18,7 @@ class AlgoConfig(DefaultConfig):
         self.epsilon_decay = 500 # epsilon decay rate
         self.gamma = 0.95 # discount factor
         self.lr = 0.0001 # learning rate
-        self.buffer_type = 'PER_QUE' # replay buffer type
+        self.buffer_type = 'PER_QUE' # replay buffer type, PER_QUE or PER_ARRAY (array-backed sum tree, for large buffers)
         self.buffer_size = 100000 # size of replay buffer
         self.per_alpha = 0.6 # alpha for prioritized replay buffer
         self.per_beta = 0.4 # beta for prioritized replay buffer
@@ -3,11 +3,12 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 from torch.distributions import Categorical,Normal
-import torch.utils.data as Data
 import numpy as np
 
 from algos.base.networks import ValueNetwork, CriticNetwork, ActorNetwork
 from algos.base.policies import BasePolicy
+from algos.base.returns import compute_returns, compute_gae, normalize
+from algos.base.samplers import MiniBatchSampler
 
 class Policy(BasePolicy):
     def __init__(self, cfg) -> None:
@@ -22,6 +23,9 @@ class Policy(BasePolicy):
             self.kl_beta = cfg.kl_beta
             self.kl_alpha = cfg.kl_alpha
         self.gamma = cfg.gamma
+        self.return_type = cfg.return_type # mc or gae
+        self.gae_lambda = cfg.gae_lambda
+        self.vectorized_returns = cfg.vectorized_returns
         self.action_type = cfg.action_type
         if self.action_type.lower() == 'continuous': # continuous action space
             self.action_scale = torch.tensor((self.action_space.high - self.action_space.low)/2, device=self.device, dtype=torch.float32).unsqueeze(dim=0)
@@ -31,6 +35,7 @@ class Policy(BasePolicy):
         self.eps_clip = cfg.eps_clip # clip parameter for PPO
         self.entropy_coef = cfg.entropy_coef # entropy coefficient
         self.sgd_batch_size = cfg.sgd_batch_size
+        self.sampler = MiniBatchSampler(self.sgd_batch_size, n_epochs = self.k_epochs, drop_last = cfg.sgd_drop_last) # k_epochs of shuffled minibatches
         self.create_graph()
         self.create_optimizer()
         self.create_summary()
@@ -111,6 +116,45 @@ class Policy(BasePolicy):
         else:
             raise NameError('mode must be sample or predict')
         return action
+    def get_actions(self, states, mode='sample', columnar=False, **kwargs):
+        ''' get actions for a batch of states with one forward pass,
+            policy transitions are one dict of batched tensors if columnar
+        '''
+        if mode not in ['sample', 'predict']:
+            raise NameError('mode must be sample or predict')
+        states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32)
+        n_states = states.shape[0]
+        with torch.no_grad():
+            if not self.independ_actor:
+                if self.action_type.lower() == 'continuous':
+                    values, mus, sigmas = self.policy_net(states)
+                else:
+                    probs = self.policy_net(states)
+            else:
+                values = self.critic(states)
+                output = self.actor(states)
+                if self.action_type.lower() == 'continuous':
+                    mus, sigmas = output['mu'], output['sigma']
+                else:
+                    probs = output['probs']
+            if self.action_type.lower() == 'continuous':
+                sigmas = sigmas.expand_as(mus) # sigma may be shared by all states
+                if mode == 'predict':
+                    return list(mus.cpu().numpy()), {} if columnar else [{} for _ in range(n_states)]
+                dist = Normal(mus * self.action_scale + self.action_bias, sigmas)
+                actions = dist.sample()
+                actions = torch.clamp(actions, torch.tensor(self.action_space.low, device=self.device, dtype=torch.float32), torch.tensor(self.action_space.high, device=self.device, dtype=torch.float32))
+                policy_transitions = {'value': values, 'mu': mus, 'sigma': sigmas}
+            else:
+                if mode == 'predict':
+                    return list(torch.argmax(probs, dim=1).cpu().numpy()), {} if columnar else [{} for _ in range(n_states)]
+                dist = Categorical(probs)
+                actions = dist.sample()
+                log_probs = dist.log_prob(actions)
+                policy_transitions = {'value': values, 'probs': probs, 'log_probs': log_probs}
+        if not columnar: # per-state dicts keep the same [1, ...] shapes as update_policy_transition
+            policy_transitions = [{k: v[i:i+1] for k, v in policy_transitions.items()} for i in range(n_states)]
+        return list(actions.cpu().numpy()), policy_transitions
     def update_policy_transition(self):
         if self.action_type.lower() == 'continuous':
             self.policy_transition = {'value': self.value, 'mu': self.mu, 'sigma': self.sigma}
@@ -138,10 +182,15 @@ class Policy(BasePolicy):
             return torch.argmax(self.probs).detach().cpu().numpy()
     def learn(self, **kwargs): 
         states, actions, next_states, rewards, dones = kwargs.get('states'), kwargs.get('actions'), kwargs.get('next_states'), kwargs.get('rewards'), kwargs.get('dones')
+        segment_ends = kwargs.get('segment_ends') # only given by the on-policy rollout buffer, whose data are contiguous arrays
         if self.action_type.lower() == 'continuous':      
             mus, sigmas = kwargs.get('mu'), kwargs.get('sigma')
-            mus = torch.stack(mus, dim=0).to(device=self.device, dtype=torch.float32)
-            sigmas = torch.stack(sigmas, dim=0).to(device=self.device, dtype=torch.float32)
+            if segment_ends is not None:
+                mus = torch.as_tensor(mus, device=self.device, dtype=torch.float32)
+                sigmas = torch.as_tensor(sigmas, device=self.device, dtype=torch.float32)
+            else:
+                mus = torch.stack(mus, dim=0).to(device=self.device, dtype=torch.float32)
+                sigmas = torch.stack(sigmas, dim=0).to(device=self.device, dtype=torch.float32)
             means = mus * self.action_scale + self.action_bias
             stds = sigmas
             dists = Normal(means,stds)
@@ -149,62 +198,97 @@ class Policy(BasePolicy):
             old_probs = torch.exp(old_log_probs)
         else:
             old_probs, old_log_probs  = kwargs.get('probs'), kwargs.get('log_probs')
-            old_probs = torch.cat(old_probs,dim=0).to(self.device) # shape:[batch_size,n_actions]
-            old_log_probs = torch.cat(old_log_probs,dim=0).to(self.device).unsqueeze(dim=1) # shape:[batch_size,1]
+            if segment_ends is not None:
+                old_probs = torch.as_tensor(old_probs, device=self.device, dtype=torch.float32) # shape:[batch_size,n_actions]
+                old_log_probs = torch.as_tensor(old_log_probs, device=self.device, dtype=torch.float32).unsqueeze(dim=1) # shape:[batch_size,1]
+            else:
+                old_probs = torch.cat(old_probs,dim=0).to(self.device) # shape:[batch_size,n_actions]
+                old_log_probs = torch.cat(old_log_probs,dim=0).to(self.device).unsqueeze(dim=1) # shape:[batch_size,1]
         # convert to tensor
         states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32) # shape:[batch_size,n_states]
         # actions = torch.tensor(np.array(actions), device=self.device, dtype=torch.float32).unsqueeze(dim=1) # shape:[batch_size,1]
         actions = torch.tensor(np.array(actions), device=self.device, dtype=torch.float32).unsqueeze(dim=1) # shape:[batch_size,1]
         next_states = torch.tensor(np.array(next_states), device=self.device, dtype=torch.float32) # shape:[batch_size,n_states]
-        rewards = torch.tensor(np.array(rewards), device=self.device, dtype=torch.float32) # shape:[batch_size,1]
-        dones = torch.tensor(np.array(dones), device=self.device, dtype=torch.float32) # shape:[batch_size,1]
-        returns = self._compute_returns(rewards, dones) # shape:[batch_size,1]  
-        torch_dataset = Data.TensorDataset(states, actions, old_probs, old_log_probs,returns)
-        train_loader = Data.DataLoader(dataset=torch_dataset, batch_size=self.sgd_batch_size, shuffle=True,drop_last=False)
-        for _ in range(self.k_epochs):
-            for batch_idx, (states_sgd, actions_sgd, old_probs_sgd, old_log_probs_sgd, returns_sgd) in enumerate(train_loader):
-                # compute advantages
-                values_sgd, new_log_probs_sgd, entropies = self.evaluate(states_sgd,actions_sgd)
-                # values_sgd = self.critic(states_sgd) # detach to avoid backprop through the critic
-                advantages = returns_sgd - values_sgd.detach() # shape:[batch_size,1]
-                # compute ratio (pi_theta / pi_theta__old):
-                ratio = torch.exp(new_log_probs_sgd.unsqueeze(dim=1) - old_log_probs_sgd.detach()) # shape: [batch_size, 1]
-                # compute surrogate loss
-                surr1 = ratio * advantages # shape: [batch_size, 1]
-                if self.ppo_type == 'clip':
-                    surr2 = torch.clamp(ratio, 1 - self.eps_clip, 1 + self.eps_clip) * advantages
-                    # compute actor loss
-                    self.actor_loss = - (torch.mean(torch.min(surr1, surr2)) + torch.mean(self.entropy_coef * entropies))
-                elif self.ppo_type == 'kl':
-                    kl_mean = F.kl_div(torch.log(new_log_probs_sgd.detach()), old_probs_sgd.unsqueeze(1),reduction='mean') # KL(input|target),new_probs.shape: [batch_size, n_actions]
-                    # kl_div = torch.mean(new_probs * (torch.log(new_probs) - torch.log(old_probs)), dim=1) # KL(new|old),new_probs.shape: [batch_size, n_actions]
-                    surr2 = self.kl_lambda * kl_mean
-                    # surr2 = torch.clamp(ratio, 1 - self.eps_clip, 1 + self.eps_clip) * advantages
-                    # compute actor loss
-                    self.actor_loss = - (surr1.mean() + surr2 + self.entropy_coef * dist.entropy().mean())
-                    if kl_mean > self.kl_beta * self.kl_target:
-                        self.kl_lambda *= self.kl_alpha
-                    elif kl_mean < 1/self.kl_beta * self.kl_target:
-                        self.kl_lambda /= self.kl_alpha
-                else:
-                    raise NameError("ppo_type must be 'clip' or 'kl'")
-                # compute critic loss
-                self.critic_loss = nn.MSELoss()(returns_sgd, values_sgd) # shape: [batch_size, 1]
-                # compute total loss
-                if self.share_optimizer:
-                    self.optimizer.zero_grad()
-                    self.tot_loss = self.actor_loss + self.critic_loss_coef* self.critic_loss
-                    self.tot_loss.backward()
-                else:
-                    self.actor_optimizer.zero_grad()
-                    self.actor_loss.backward()
-                    self.actor_optimizer.step()
-                    self.critic_optimizer.zero_grad()  
-                    self.critic_loss.backward()
-                    self.critic_optimizer.step()
+        rewards = torch.tensor(np.array(rewards), device=self.device, dtype=torch.float32).reshape(-1, 1) # shape:[batch_size,1]
+        dones = torch.tensor(np.array(dones), device=self.device, dtype=torch.float32).reshape(-1, 1) # shape:[batch_size,1]
+        if segment_ends is not None:
+            segment_ends = torch.as_tensor(segment_ends, device=self.device, dtype=torch.float32).reshape(-1, 1)
+        returns, fixed_advantages = self._compute_returns(rewards, dones, states, next_states, segment_ends) # shape:[batch_size,1]  
+        data = {'states': states, 'actions': actions, 'old_probs': old_probs, 'old_log_probs': old_log_probs, 'returns': returns}
+        if fixed_advantages is not None:
+            data['advantages'] = fixed_advantages
+        for batch in self.sampler.sample(data):
+            states_sgd, actions_sgd, old_probs_sgd, old_log_probs_sgd, returns_sgd = batch['states'], batch['actions'], batch['old_probs'], batch['old_log_probs'], batch['returns']
+            # compute advantages
+            values_sgd, new_log_probs_sgd, entropies = self.evaluate(states_sgd,actions_sgd)
+            # values_sgd = self.critic(states_sgd) # detach to avoid backprop through the critic
+            advantages = batch['advantages'] if fixed_advantages is not None else returns_sgd - values_sgd.detach() # shape:[batch_size,1]
+            # compute ratio (pi_theta / pi_theta__old):
+            ratio = torch.exp(new_log_probs_sgd.unsqueeze(dim=1) - old_log_probs_sgd.detach()) # shape: [batch_size, 1]
+            # compute surrogate loss
+            surr1 = ratio * advantages # shape: [batch_size, 1]
+            if self.ppo_type == 'clip':
+                surr2 = torch.clamp(ratio, 1 - self.eps_clip, 1 + self.eps_clip) * advantages
+                # compute actor loss
+                self.actor_loss = - (torch.mean(torch.min(surr1, surr2)) + torch.mean(self.entropy_coef * entropies))
+            elif self.ppo_type == 'kl':
+                kl_mean = F.kl_div(torch.log(new_log_probs_sgd.detach()), old_probs_sgd.unsqueeze(1),reduction='mean') # KL(input|target),new_probs.shape: [batch_size, n_actions]
+                # kl_div = torch.mean(new_probs * (torch.log(new_probs) - torch.log(old_probs)), dim=1) # KL(new|old),new_probs.shape: [batch_size, n_actions]
+                surr2 = self.kl_lambda * kl_mean
+                # surr2 = torch.clamp(ratio, 1 - self.eps_clip, 1 + self.eps_clip) * advantages
+                # compute actor loss
+                self.actor_loss = - (surr1.mean() + surr2 + self.entropy_coef * dist.entropy().mean())
+                if kl_mean > self.kl_beta * self.kl_target:
+                    self.kl_lambda *= self.kl_alpha
+                elif kl_mean < 1/self.kl_beta * self.kl_target:
+                    self.kl_lambda /= self.kl_alpha
+            else:
+                raise NameError("ppo_type must be 'clip' or 'kl'")
+            # compute critic loss
+            self.critic_loss = nn.MSELoss()(returns_sgd, values_sgd) # shape: [batch_size, 1]
+            # compute total loss
+            if self.share_optimizer:
+                self.optimizer.zero_grad()
+                self.tot_loss = self.actor_loss + self.critic_loss_coef* self.critic_loss
+                self.tot_loss.backward()
+            else:
+                self.actor_optimizer.zero_grad()
+                self.actor_loss.backward()
+                self.actor_optimizer.step()
+                self.critic_optimizer.zero_grad()  
+                self.critic_loss.backward()
+                self.critic_optimizer.step()
         self.update_summary()
 
-    def _compute_returns(self, rewards, dones):
+    def _get_values(self, states):
+        ''' critic values of states, from the shared policy net if the actor is not independent
+        '''
+        if not self.independ_actor:
+            return self.policy_net(states)[0]
+        return self.critic(states)
+
+    def _compute_returns(self, rewards, dones, states, next_states, segment_ends = None):
+        ''' compute critic targets, and fixed advantages when using gae,
+            segment_ends mark the last step of each interactor's rollout, they end returns but bootstrap in gae
+        Returns:
+            returns (torch.Tensor): shape [batch_size, 1]
+            advantages (torch.Tensor): shape [batch_size, 1], None for mc since advantages are computed per minibatch
+        '''
+        truncateds = None
+        if segment_ends is not None:
+            truncateds = segment_ends * (1 - dones)
+            dones = torch.maximum(dones, segment_ends)
+        if self.return_type == 'gae':
+            with torch.no_grad():
+                values, next_values = self._get_values(states), self._get_values(next_states)
+            advantages, returns = compute_gae(rewards, values, next_values, dones, self.gamma, self.gae_lambda, truncateds = truncateds)
+            return returns, normalize(advantages)
+        if not self.vectorized_returns:
+            return self._compute_returns_loop(rewards, dones), None
+        returns = compute_returns(rewards, dones, self.gamma)
+        return normalize(returns), None
+
+    def _compute_returns_loop(self, rewards, dones):
         # monte carlo estimate of state rewards
         returns = []
         discounted_sum = 0
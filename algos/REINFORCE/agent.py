@@ -3,6 +3,7 @@ from torch.distributions import Categorical
 import numpy as np
 from common.models import ActorSoftmax
 from common.memories import PGReplay
+from algos.base.returns import compute_returns, normalize
 
 class Agent:
     def __init__(self,cfg) -> None:
@@ -13,6 +14,7 @@ class Agent:
         self.optimizer = torch.optim.RMSprop(self.actor.parameters(), lr=cfg.lr)
         self.sample_count = 0
         self.update_freq = cfg.update_freq # update policy every n steps
+        self.vectorized_returns = cfg.vectorized_returns
     def sample_action(self,state):
         self.sample_count += 1
         state = torch.tensor(state, device=self.device, dtype=torch.float32).unsqueeze(dim=0)
@@ -34,19 +36,12 @@ class Agent:
         print("update policy")
         state_pool,action_pool,reward_pool= self.memory.sample()
         state_pool,action_pool,reward_pool = list(state_pool),list(action_pool),list(reward_pool)
-        # compute discounted rewards (Returns)
-        running_add = 0
-        for i in reversed(range(len(reward_pool))):
-            if reward_pool[i] == 0:
-                running_add = 0
-            else:
-                running_add = running_add * self.gamma + reward_pool[i]
-                reward_pool[i] = running_add
-        # Normalize reward
-        reward_mean = np.mean(reward_pool)
-        reward_std = np.std(reward_pool)
-        for i in range(len(reward_pool)):
-            reward_pool[i] = (reward_pool[i] - reward_mean) / reward_std
+        if self.vectorized_returns:
+            # zero reward marks the end of an episode
+            rewards = np.array(reward_pool, dtype=np.float64)
+            reward_pool = normalize(compute_returns(rewards, rewards == 0, self.gamma))
+        else:
+            reward_pool = self._compute_returns_loop(reward_pool)
         state = torch.tensor(state_pool, device=self.device, dtype=torch.float32)
         action = torch.tensor(action_pool, device=self.device, dtype=torch.float32)
         reward = torch.tensor(reward_pool, device=self.device, dtype=torch.float32)
@@ -60,6 +55,21 @@ class Agent:
         loss.backward()
         self.optimizer.step()
         self.memory.clear()
+    def _compute_returns_loop(self, reward_pool):
+        # compute discounted rewards (Returns)
+        running_add = 0
+        for i in reversed(range(len(reward_pool))):
+            if reward_pool[i] == 0:
+                running_add = 0
+            else:
+                running_add = running_add * self.gamma + reward_pool[i]
+                reward_pool[i] = running_add
+        # Normalize reward
+        reward_mean = np.mean(reward_pool)
+        reward_std = np.std(reward_pool)
+        for i in range(len(reward_pool)):
+            reward_pool[i] = (reward_pool[i] - reward_mean) / reward_std
+        return reward_pool
     def save_model(self,fpath):
         from pathlib import Path
         # create path
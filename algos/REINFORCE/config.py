@@ -2,5 +2,6 @@ class AlgoConfig:
     def __init__(self):
         self.lr = 0.01
         self.gamma = 0.99 # discount factor
+        self.vectorized_returns = True # compute returns with the vectorized scan in algos/base/returns.py, False for the python loop
         self.hidden_dim = 36 # hidden dimension of actor 
         self.update_freq = 200 # update policy every n steps
\ No newline at end of file
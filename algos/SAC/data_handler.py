@@ -21,4 +21,12 @@ class DataHandler(BaseDataHandler):
         sigma = [exp.sigma[0] for exp in exps] if hasattr(exps[-1],'sigma') else None
         data = {'states': states, 'actions': actions, 'rewards': rewards, 'next_states': next_states, 'dones': dones, 
                 'probs': probs, 'log_probs': log_probs, 'value': value, 'mu': mu, 'sigma': sigma}
-        return data
\ No newline at end of file
+        return data
+    def handle_batch_before_train(self, batch, **kwargs):
+        ''' convert batch arrays to training data
+        '''
+        if batch['actions'].ndim == 1: # discrete action
+            batch['actions'] = batch['actions'][:, np.newaxis]
+        batch['rewards'] = batch['rewards'][:, np.newaxis]
+        batch['dones'] = batch['dones'][:, np.newaxis]
+        return batch
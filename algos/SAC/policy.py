@@ -108,7 +108,33 @@ class Policy(BasePolicy):
         else:
             raise NameError('mode must be sample or predict')
         return action
-    
+
+    def get_actions(self, states, mode='sample', **kwargs):
+        ''' get actions for a batch of states with one forward pass
+        '''
+        if mode not in ['sample', 'predict']:
+            raise NameError('mode must be sample or predict')
+        states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32)
+        n_states = states.shape[0]
+        with torch.no_grad():
+            output = self.actor(states)
+            if self.action_type.lower() == 'continuous':
+                mus, sigmas = output['mu'], output['sigma']
+                sigmas = sigmas.expand_as(mus) # sigma may be shared by all states
+                if mode == 'predict':
+                    return list(mus.cpu().numpy()), [{} for _ in range(n_states)]
+                actions, _ = self.calc_log_prob(mus, sigmas)
+                policy_transitions = [{'value': [None], 'mu': mus[i:i+1], 'sigma': sigmas[i:i+1]} for i in range(n_states)]
+            else:
+                probs = output['probs']
+                if mode == 'predict':
+                    return list(torch.argmax(probs, dim=1).cpu().numpy()), [{} for _ in range(n_states)]
+                dist = Categorical(probs)
+                actions = dist.sample()
+                log_probs = dist.log_prob(actions)
+                policy_transitions = [{'value': [None], 'probs': probs[i:i+1], 'log_probs': log_probs[i:i+1]} for i in range(n_states)]
+        return list(actions.cpu().numpy()), policy_transitions
+
     def update_policy_transition(self):
         if self.action_type.lower() == 'continuous':
             self.policy_transition = {'value': self.value, 'mu': self.mu, 'sigma': self.sigma}
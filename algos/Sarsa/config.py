@@ -20,3 +20,4 @@ class AlgoConfig(DefaultConfig):
         self.epsilon_decay = 500  # epsilon decay
         self.gamma = 0.95  # reward discount factor
         self.lr = 0.0001  # learning rate
+        self.n_steps_per_learn = -1  # table updates per learner step, -1 to learn every buffered transition, e.g. from several interactors
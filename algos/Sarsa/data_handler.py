@@ -9,18 +9,23 @@ LastEditTime: 2023-05-19 00:55:08
 Discription: 
 '''
 import numpy as np
+from collections import deque
 from algos.base.data_handlers import BaseDataHandler
 from algos.base.exps import Exp
 class DataHandler(BaseDataHandler):
     def __init__(self,cfg) -> None:
         self.cfg = cfg
-        self.buffer = []
+        self.buffer = deque() # learned in arrival order, see sample_training_data
         self.data_after_train = {}
     def add_transition(self, transition):
         ''' add transition to buffer
         '''
         exp = self._create_exp(transition)
         self.buffer.append(exp)
+    def add_exps(self, exps):
+        ''' add exps sent by interactors to buffer
+        '''
+        self.buffer.extend([exp] for exp in exps)
     def add_data_after_learn(self, data):
         ''' add update data
         '''
@@ -28,7 +33,9 @@ class DataHandler(BaseDataHandler):
     def sample_training_data(self):
         ''' sample training data from buffer
         '''
-        exp = self.buffer.pop()[0]
+        if len(self.buffer) == 0:
+            return None
+        exp = self.buffer.popleft()[0] # oldest first, so transitions of all interactors are learned once in order
         if exp is not None:
             return self.handle_exps_before_train(exp)
         else:
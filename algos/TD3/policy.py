@@ -93,6 +93,25 @@ class Policy(BasePolicy):
         action = self.action_scale * action + self.action_bias
         return action.detach().cpu().numpy()[0]
 
+    def get_actions(self, states, mode = 'sample', **kwargs):
+        ''' get actions for a batch of states with one forward pass
+        '''
+        if mode not in ['sample', 'predict']:
+            raise NameError('mode must be sample or predict')
+        n_states = len(states)
+        if mode == 'sample':
+            self.sample_count = kwargs.get('sample_count')
+            if self.sample_count < self.explore_steps:
+                return [self.action_space.sample() for _ in range(n_states)], [{} for _ in range(n_states)]
+        with torch.no_grad():
+            states = torch.tensor(np.array(states), device=self.device, dtype=torch.float32)
+            actions = self.action_scale * self.actor(states) + self.action_bias
+            actions = actions.cpu().numpy()
+        if mode == 'sample':
+            action_noise = np.random.normal(0, self.action_scale.cpu().numpy()[0] * self.expl_noise, size=(n_states, self.n_actions))
+            actions = (actions + action_noise).clip(self.action_space.low, self.action_space.high)
+        return list(actions), [{} for _ in range(n_states)]
+
     def learn(self, **kwargs):
         # if len(self.memory) < self.explore_steps:
         #     return
@@ -9,6 +9,11 @@ class AlgoConfig(DefaultConfig):
         # self.hidden_dim = 256 # hidden_dim for MLP
         self.gamma = 0.95 # discount factor
         self.lr = 0.0001 # learning rate
+        self.dp_type = 'value_iteration' # value_iteration or policy_iteration
+        self.theta = 1e-6 # stop when the largest value change of a backup is below theta
+        self.max_iter = 10000 # max number of backups (value iteration) or policy improvements (policy iteration)
+        self.n_eval = None # evaluation backups per policy improvement, None to evaluate until theta, an int gives modified policy iteration
+        self.sparse = None # transitions in CSR arrays instead of a dense [S, A, S] tensor, None to decide by the number of states
         # self.buffer_size = 100000 # size of replay buffer
         # self.batch_size = 64 # batch size
         # self.target_update = 800 # target network update frequency per steps
@@ -25,10 +25,11 @@ class BaseDataHandler:
         ''' sample training data from buffer
         '''
         exps = self.buffer.sample()
-        if exps is not None:
-            return self.handle_exps_before_train(exps)
-        else:
+        if exps is None:
             return None
+        if isinstance(exps, dict): # columnar buffers return ready-made batch arrays
+            return self.handle_batch_before_train(exps)
+        return self.handle_exps_before_train(exps)
     def _create_exp(self,transtion):
         ''' create experience
         '''
@@ -43,6 +44,10 @@ class BaseDataHandler:
         dones = np.array([exp.done for exp in exps])
         data = {'states': states, 'actions': actions, 'rewards': rewards, 'next_states': next_states, 'dones': dones}
         return data
+    def handle_batch_before_train(self, batch, **kwargs):
+        ''' convert batch arrays sampled from columnar buffers to training data
+        '''
+        return batch
     def handle_exps_after_train(self):
         ''' handle exps after train
         '''
@@ -0,0 +1,105 @@
+import numpy as np
+
+DENSE_MAX_SIZE = 2 ** 24 # compile P into a dense [S, A, S] tensor only up to this many entries
+
+class TabularMDP:
+    ''' Gym-style transition dict P[s][a] = [(prob, next_state, reward, done), ...] compiled once into arrays.
+        Bootstrapping is cut after done transitions, expected rewards are kept in R[s, a].
+        The dense layout stores P[s, a, s'], the sparse layout stores the outcomes in CSR order (rows are flat s * A + a),
+        backups of both are a few vectorized numpy calls.
+    Args:
+        P (dict): transitions, e.g. env.unwrapped.P of FrozenLake, CliffWalking or envs.simple_grid.DrunkenWalkEnv
+        n_states, n_actions (int): inferred from P if None
+        sparse (bool): layout, None to pick dense for small state spaces
+    '''
+    def __init__(self, P, n_states = None, n_actions = None, sparse = None) -> None:
+        self.n_states = len(P) if n_states is None else n_states
+        self.n_actions = max(len(P[s]) for s in P) if n_actions is None else n_actions
+        S, A = self.n_states, self.n_actions
+        # flatten the outcomes once, rows are sorted so the arrays are in CSR order
+        rows = [s * A + a for s in range(S) for a in range(A) for _ in P[s].get(a, ())]
+        outcomes = [t[:4] for s in range(S) for a in range(A) for t in P[s].get(a, ())]
+        outcomes = np.array(outcomes, dtype = np.float64).reshape(-1, 4)
+        self.rows = np.array(rows, dtype = np.int64)
+        self.cols = outcomes[:, 1].astype(np.int64)
+        self.probs = outcomes[:, 0] * (1. - outcomes[:, 3]) # probability of bootstrapping from next state
+        self.indptr = np.searchsorted(self.rows, np.arange(S * A + 1))
+        self.R = np.bincount(self.rows, weights = outcomes[:, 0] * outcomes[:, 2], minlength = S * A).reshape(S, A)
+        self.sparse = S * A * S > DENSE_MAX_SIZE if sparse is None else sparse
+        if not self.sparse:
+            self.P = np.zeros((S * A, S))
+            np.add.at(self.P, (self.rows, self.cols), self.probs)
+            self.P = self.P.reshape(S, A, S)
+
+    def q_values(self, V, gamma):
+        ''' one Bellman backup of all state-action pairs, [S, A]
+        '''
+        if self.sparse:
+            expected_V = np.bincount(self.rows, weights = self.probs * V[self.cols], minlength = self.n_states * self.n_actions)
+            return self.R + gamma * expected_V.reshape(self.n_states, self.n_actions)
+        return self.R + gamma * self.P @ V
+
+    def policy_values(self, V, policy, gamma):
+        ''' one Bellman backup of the actions chosen by a deterministic policy, [S]
+        '''
+        states = np.arange(self.n_states)
+        if self.sparse:
+            rows = states * self.n_actions + policy
+            # gather the outcome ranges of the chosen rows
+            starts, ends = self.indptr[rows], self.indptr[rows + 1]
+            lengths = ends - starts
+            idxs = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            expected_V = np.bincount(np.repeat(states, lengths), weights = self.probs[idxs] * V[self.cols[idxs]], minlength = self.n_states)
+            return self.R[states, policy] + gamma * expected_V
+        return self.R[states, policy] + gamma * self.P[states, policy] @ V
+
+def value_iteration(mdp, gamma, theta = 1e-6, max_iter = 10000, V = None):
+    ''' value iteration until the largest value change is below theta
+    Returns:
+        V (np.ndarray): state values, [S]
+        policy (np.ndarray): greedy policy, [S]
+        n_iter (int): number of backups
+    '''
+    V = np.zeros(mdp.n_states) if V is None else np.asarray(V, dtype = np.float64)
+    for n_iter in range(1, max_iter + 1):
+        Q = mdp.q_values(V, gamma)
+        V_new = Q.max(axis = 1)
+        delta = np.abs(V_new - V).max()
+        V = V_new
+        if delta < theta:
+            break
+    return V, mdp.q_values(V, gamma).argmax(axis = 1), n_iter
+
+def policy_evaluation(mdp, policy, gamma, theta = 1e-6, max_iter = 10000, V = None):
+    ''' iterative evaluation of a deterministic policy, stops after max_iter backups or when the largest value change is below theta
+    '''
+    V = np.zeros(mdp.n_states) if V is None else V
+    for _ in range(max_iter):
+        V_new = mdp.policy_values(V, policy, gamma)
+        delta = np.abs(V_new - V).max()
+        V = V_new
+        if delta < theta:
+            break
+    return V
+
+def policy_iteration(mdp, gamma, theta = 1e-6, max_iter = 1000, n_eval = None, policy = None):
+    ''' policy iteration, with n_eval evaluation backups per improvement it becomes modified policy iteration
+    Args:
+        n_eval (int): evaluation backups per iteration, None to evaluate each policy until theta
+    Returns:
+        V (np.ndarray): state values, [S]
+        policy (np.ndarray): greedy policy, [S]
+        n_iter (int): number of policy improvements
+    '''
+    policy = np.zeros(mdp.n_states, dtype = np.int64) if policy is None else np.asarray(policy, dtype = np.int64)
+    V = np.zeros(mdp.n_states)
+    for n_iter in range(1, max_iter + 1):
+        V = policy_evaluation(mdp, policy, gamma, theta = theta, max_iter = 10000 if n_eval is None else n_eval, V = V)
+        Q = mdp.q_values(V, gamma)
+        # keep the current action on ties so that the loop terminates
+        new_policy = np.where(Q.max(axis = 1) > Q[np.arange(mdp.n_states), policy] + 1e-12, Q.argmax(axis = 1), policy)
+        stable = np.array_equal(new_policy, policy)
+        policy = new_policy
+        if stable and (n_eval is None or np.abs(Q.max(axis = 1) - V).max() < theta): # modified PI also waits for the values to settle
+            break
+    return V, policy, n_iter
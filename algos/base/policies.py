@@ -1,7 +1,10 @@
+import math
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from gymnasium.spaces import Box, Discrete
+from algos.base.tabular import QTable, is_npy_file
 class BasePolicy(nn.Module):
     ''' base policy for DRL
     '''
@@ -56,6 +59,23 @@ class BasePolicy(nn.Module):
             return self.predict_action(state, **kwargs)
         else:
             raise NameError('mode must be sample or predict')
+    def get_actions(self, states, mode = 'sample', columnar = False, **kwargs):
+        ''' get actions for a batch of states, e.g. from envs stepped in lockstep,
+            policies should override it with one batched forward pass
+        Args:
+            states (array): batch of states, shape [n_envs, *state_shape]
+            columnar (bool): return policy transitions as one dict of batched values instead of a list of dicts
+        Returns:
+            actions (list): action of each state
+            policy_transitions (list or dict): policy transition of each state, or dict of values with shape [n_envs, ...] if columnar
+        '''
+        actions, policy_transitions = [], []
+        for state in states:
+            actions.append(self.get_action(state, mode = mode, **kwargs))
+            policy_transitions.append(self.get_policy_transition())
+        if columnar: # per-state values keep a leading dim of 1, e.g. value of shape [1, 1]
+            policy_transitions = {k: torch.cat([t[k].detach() for t in policy_transitions]) for k in policy_transitions[0]} if len(policy_transitions) > 0 else {}
+        return actions, policy_transitions
     def sample_action(self, state, **kwargs):
         ''' sample action
         '''
@@ -70,7 +90,10 @@ class BasePolicy(nn.Module):
         self.policy_transition = {}
         
     def get_policy_transition(self):
-        return self.policy_transition
+        ''' policy transition of the last sampled action, tensors are detached so that exps keep no autograd graph
+            and can be pickled, e.g. by interactors running in other processes
+        '''
+        return {k: v.detach() if torch.is_tensor(v) else v for k, v in self.policy_transition.items()}
     
     def create_summary(self):
         ''' create policy summary
@@ -138,6 +161,14 @@ class ToyPolicy:
             return self.predict_action(state, **kwargs)
         else:
             raise NameError('mode must be sample or predict')
+    def get_actions(self, states, mode = 'sample', **kwargs):
+        ''' get actions for a batch of states
+        '''
+        actions, policy_transitions = [], []
+        for state in states:
+            actions.append(self.get_action(state, mode = mode, **kwargs))
+            policy_transitions.append(self.get_policy_transition())
+        return actions, policy_transitions
     def sample_action(self, state, **kwargs):
         raise NotImplementedError
     def predict_action(self, state, **kwargs):
@@ -159,4 +190,62 @@ class ToyPolicy:
     def save_model(self, fpath):
         raise NotImplementedError
     def load_model(self, fpath):
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+class TabularPolicy(ToyPolicy):
+    ''' base policy for tabular methods, Q values live in a QTable indexed by the Discrete state
+    '''
+    def __init__(self, cfg) -> None:
+        super().__init__(cfg)
+        self.lr = cfg.lr
+        self.gamma = cfg.gamma
+        self.epsilon = cfg.epsilon_start
+        self.epsilon_start = cfg.epsilon_start
+        self.epsilon_end = cfg.epsilon_end
+        self.epsilon_decay = cfg.epsilon_decay
+        self.sample_count = 0
+        self.Q_table = QTable(self.n_actions, n_states = self.n_states)
+        self.create_summary()
+    def update_epsilon(self, sample_count = None):
+        self.sample_count = self.sample_count + 1 if sample_count is None else sample_count # count samples here if the caller does not
+        self.epsilon = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
+            math.exp(-1. * self.sample_count / self.epsilon_decay)
+    def sample_action(self, state, **kwargs):
+        self.update_epsilon(kwargs.get('sample_count'))
+        return self.Q_table.epsilon_greedy(state, self.epsilon)
+    def predict_action(self, state, **kwargs):
+        return self.Q_table.greedy(state)
+    def get_actions(self, states, mode = 'sample', **kwargs):
+        ''' get actions for a batch of states with one table lookup
+        '''
+        idxs = self.Q_table.indices(states)
+        if mode == 'sample':
+            # epsilon decays once per state, same as calling sample_action state by state
+            sample_count = kwargs.get('sample_count')
+            sample_counts = (self.sample_count if sample_count is None else sample_count) + np.arange(1, len(idxs) + 1)
+            self.sample_count = int(sample_counts[-1])
+            epsilons = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
+                np.exp(-1. * sample_counts / self.epsilon_decay)
+            self.epsilon = epsilons[-1]
+            actions = self.Q_table.epsilon_greedy_batch(idxs, epsilons)
+        elif mode == 'predict':
+            actions = self.Q_table.greedy_batch(idxs)
+        else:
+            raise NameError('mode must be sample or predict')
+        return actions.tolist(), [{} for _ in range(len(idxs))]
+    def get_model_params(self):
+        ''' Q values as a tensor sharing memory with the table, so the param store and checkpointer handle it like network weights
+        '''
+        return {'Q_table': torch.from_numpy(self.Q_table.values)}
+    def put_model_params(self, model_params):
+        self.Q_table.values[:] = model_params['Q_table'].numpy()
+    def save_model(self, fpath):
+        ''' save Q values as .npy
+        '''
+        self.Q_table.save(fpath)
+    def load_model(self, fpath, mmap_mode = None):
+        ''' load Q values saved by save_model, or params saved by the checkpointer
+        '''
+        if is_npy_file(fpath):
+            self.Q_table.load(fpath, mmap_mode = mmap_mode)
+        else:
+            self.put_model_params(torch.load(fpath))
@@ -0,0 +1,88 @@
+import numpy as np
+import torch
+
+def _to_numpy(x):
+    if x is None:
+        return None
+    if isinstance(x, torch.Tensor):
+        return x.detach().cpu().numpy().astype(np.float64)
+    return np.asarray(x, dtype = np.float64)
+
+def _like(result, ref):
+    ''' return result with the same array type, device and dtype as ref
+    '''
+    if isinstance(ref, torch.Tensor):
+        return torch.as_tensor(result, device = ref.device, dtype = ref.dtype if ref.is_floating_point() else torch.float32)
+    return result.astype(ref.dtype) if isinstance(ref, np.ndarray) and np.issubdtype(ref.dtype, np.floating) else result
+
+def _block_len(discount, max_len):
+    ''' longest block for which discount**k stays far from underflow in float64
+    '''
+    if discount <= 0 or discount >= 1:
+        return max_len
+    return max(1, min(max_len, int(460 / -np.log(discount)))) # discount**L >= 1e-200
+
+def discount_cumsum(x, discount, dones, last = None):
+    ''' Segmented reverse scan y[t] = x[t] + discount * (1 - dones[t]) * y[t+1], with y[T] = last.
+        Every block of the time axis is solved at once: inside a block y[t] = discount**-t * sum_{k=t}^{end(t)} discount**k * x[k],
+        where end(t) is the first done at or after t, then the tail of the next block is carried in.
+    Args:
+        x (np.ndarray): [T] or [T, n_envs]
+        dones (np.ndarray): same shape as x, episode ends after step t if dones[t]
+        last (np.ndarray): [n_envs] bootstrap values after the last step, zeros by default
+    '''
+    x, dones = _to_numpy(x), _to_numpy(dones).astype(bool)
+    T = x.shape[0]
+    y = np.zeros_like(x)
+    carry = np.zeros(x.shape[1:]) if last is None else _to_numpy(last).reshape(x.shape[1:])
+    if T == 0:
+        return y
+    if discount == 0:
+        return x.copy()
+    block_len = _block_len(discount, T)
+    for e in range(T, 0, -block_len):
+        s = max(0, e - block_len)
+        xb, db = x[s:e], dones[s:e]
+        L = e - s
+        k = np.arange(L).reshape((L,) + (1,) * (x.ndim - 1))
+        w = discount ** k
+        # reverse cumsum with one extra zero row, so that rev[end + 1] is valid at block end
+        rev = np.zeros((L + 1,) + x.shape[1:])
+        rev[:L] = np.cumsum((xb * w)[::-1], axis = 0)[::-1]
+        # end(t): first done at or after t, or the last step of the block
+        seg_end = np.where(db, k, L - 1)
+        seg_end = np.minimum.accumulate(seg_end[::-1], axis = 0)[::-1]
+        y[s:e] = (rev[:L] - np.take_along_axis(rev, seg_end + 1, axis = 0)) / w
+        # steps without a done until block end get the carried value of the next step
+        no_done = ~np.flip(np.logical_or.accumulate(np.flip(db, axis = 0), axis = 0), axis = 0)
+        y[s:e] += np.where(no_done, discount ** (L - k), 0.0) * carry
+        carry = y[s]
+    return y
+
+def compute_returns(rewards, dones, gamma, last_values = None):
+    ''' discounted returns, cut at episode ends and optionally bootstrapped after the last step
+    '''
+    return _like(discount_cumsum(rewards, gamma, dones, last = last_values), rewards)
+
+def compute_gae(rewards, values, next_values, dones, gamma, gae_lambda, truncateds = None):
+    ''' generalized advantage estimation
+    Args:
+        values, next_values: V(s_t) and V(s_{t+1}), same shape as rewards ([T] or [T, n_envs])
+        dones: episode ends, terminated or truncated
+        truncateds: episodes ended by time limit, they bootstrap from V(s_{t+1}); if None every done is terminal
+    Returns:
+        advantages, returns (TD(lambda) targets, advantages + values)
+    '''
+    r, v, next_v, d = _to_numpy(rewards), _to_numpy(values), _to_numpy(next_values), _to_numpy(dones).astype(bool)
+    terminated = d if truncateds is None else d & ~_to_numpy(truncateds).astype(bool)
+    deltas = r + gamma * (1.0 - terminated) * next_v - v
+    advantages = discount_cumsum(deltas, gamma * gae_lambda, d)
+    return _like(advantages, rewards), _like(advantages + v, rewards)
+
+def compute_td_lambda_returns(rewards, values, next_values, dones, gamma, td_lambda, truncateds = None):
+    ''' TD(lambda) returns, equal to GAE advantages plus values
+    '''
+    return compute_gae(rewards, values, next_values, dones, gamma, td_lambda, truncateds = truncateds)[1]
+
+def normalize(x, eps = 1e-5):
+    return (x - x.mean()) / (x.std() + eps) # eps to avoid division by zero
@@ -0,0 +1,46 @@
+import torch
+
+class MiniBatchSampler:
+    ''' Minibatch iterator over a dict of tensors that are already on the device.
+        Each epoch draws one permutation and gathers every tensor once, minibatches are then contiguous views of it.
+        With chunk_len > 1, the batch is cut into chunks of consecutive steps that are shuffled as a whole,
+        so that recurrent policies get minibatches of [n_chunks, chunk_len, ...] sequences.
+    '''
+    def __init__(self, batch_size, n_epochs = 1, shuffle = True, drop_last = False, chunk_len = 1, generator = None) -> None:
+        self.batch_size = batch_size # number of steps per minibatch
+        self.n_epochs = n_epochs
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.chunk_len = chunk_len
+        self.generator = generator
+
+    def _n_items(self, data):
+        n_steps = len(next(iter(data.values())))
+        for k, v in data.items():
+            if len(v) != n_steps:
+                raise ValueError(f"length of {k} is {len(v)}, expected {n_steps}")
+        return n_steps // self.chunk_len # remaining steps that do not fill a chunk are dropped
+
+    def sample(self, data):
+        ''' yield minibatches as dicts with the same keys as data
+        Args:
+            data (dict): tensors of shape [n_steps, ...]
+        '''
+        n_items = self._n_items(data)
+        if self.chunk_len > 1: # [n_chunks, chunk_len, ...], chunks keep steps in order
+            data = {k: v[:n_items * self.chunk_len].reshape(n_items, self.chunk_len, *v.shape[1:]) for k, v in data.items()}
+        items_per_batch = max(1, self.batch_size // self.chunk_len)
+        n_batches = n_items // items_per_batch if self.drop_last else -(-n_items // items_per_batch)
+        device = next(iter(data.values())).device
+        for _ in range(self.n_epochs):
+            if self.shuffle:
+                perm = torch.randperm(n_items, device = device, generator = self.generator)
+                epoch_data = {k: v[perm] for k, v in data.items()} # one gather per tensor per epoch
+            else:
+                epoch_data = data
+            for i in range(n_batches):
+                s, e = i * items_per_batch, min((i + 1) * items_per_batch, n_items)
+                yield {k: v[s:e] for k, v in epoch_data.items()}
+
+    def __call__(self, data):
+        return self.sample(data)
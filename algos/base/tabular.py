@@ -0,0 +1,241 @@
+import numpy as np
+
+NPY_MAGIC = b'\x93NUMPY'
+
+def _state_key(state):
+    ''' hashable key of a state, arrays are keyed by dtype, shape and raw bytes
+    '''
+    if isinstance(state, np.ndarray):
+        if state.ndim == 0:
+            return state.item()
+        return (state.dtype.str, state.shape, state.tobytes())
+    if isinstance(state, list):
+        return tuple(_state_key(s) for s in state)
+    return state
+
+def discrete_n_states(cfg):
+    ''' number of states if cfg.obs_space is Discrete, None for other or unknown spaces so that QTable uses the hash index,
+        cfg.n_states is not used since launchers also set it to the state dimension of Box spaces (e.g. 4 for Racetrack)
+    '''
+    obs_space = getattr(cfg, 'obs_space', None)
+    if obs_space is not None and obs_space.__class__.__name__ == 'Discrete':
+        return int(obs_space.n)
+    return None
+
+def is_npy_file(fpath):
+    ''' whether fpath was written by np.save, whatever its suffix
+    '''
+    try:
+        with open(fpath, 'rb') as f:
+            return f.read(len(NPY_MAGIC)) == NPY_MAGIC
+    except OSError:
+        return False
+
+class StateIndexer:
+    ''' Map states to dense integer indices.
+        With n_states (Discrete spaces) a state is its own index, otherwise unseen states get the next free index from a hash index.
+    '''
+    def __init__(self, n_states = None) -> None:
+        self.n_states = n_states
+        self.dense = n_states is not None
+        self._index = {} # state key -> index, only used by the hash index
+        self._keys = [] # index -> state key
+
+    def __len__(self):
+        return self.n_states if self.dense else len(self._keys)
+
+    def __contains__(self, state):
+        if self.dense:
+            return 0 <= int(state) < self.n_states
+        return _state_key(state) in self._index
+
+    def index(self, state, add = True):
+        ''' index of a state, -1 if add is False and the state is unseen
+        '''
+        if self.dense:
+            return int(state)
+        key = _state_key(state)
+        idx = self._index.get(key, -1)
+        if idx < 0 and add:
+            idx = len(self._keys)
+            self._index[key] = idx
+            self._keys.append(key)
+        return idx
+
+    def indices(self, states, add = True):
+        ''' indices of a batch of states
+        '''
+        if self.dense:
+            return np.asarray(states, dtype = np.int64).reshape(-1)
+        return np.fromiter((self.index(s, add = add) for s in states), dtype = np.int64, count = len(states))
+
+    def keys(self):
+        return list(self._keys)
+
+    def load_keys(self, keys):
+        self._keys = list(keys)
+        self._index = {key: idx for idx, key in enumerate(self._keys)}
+
+class QTable:
+    ''' Tabular action values in one contiguous [n_states, n_actions] array.
+        States are mapped to rows by a StateIndexer, rows of the hash index are zero-initialized and the array doubles when it is full.
+    Args:
+        n_actions (int): number of actions
+        n_states (int): number of states of a Discrete space, None to grow the table with the visited states
+        capacity (int): initial number of rows of the hash index
+    '''
+    def __init__(self, n_actions, n_states = None, capacity = 1024, dtype = np.float64) -> None:
+        self.n_actions = n_actions
+        self.indexer = StateIndexer(n_states)
+        n_rows = n_states if n_states is not None else capacity
+        self._values = np.zeros((n_rows, n_actions), dtype = dtype)
+
+    @property
+    def values(self):
+        ''' rows of all indexed states
+        '''
+        return self._values[:len(self.indexer)]
+
+    def __len__(self):
+        return len(self.indexer)
+
+    def __contains__(self, state):
+        return state in self.indexer
+
+    def __getitem__(self, state):
+        ''' Q values of a state as a view, do not keep it across lookups of unseen states since the table may grow
+        '''
+        idx = self.index(state) # may grow the table, so index before touching _values
+        return self._values[idx]
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._values.shape[0]:
+            return
+        capacity = max(n_rows, 2 * self._values.shape[0], 1)
+        values = np.zeros((capacity, self.n_actions), dtype = self._values.dtype)
+        values[:self._values.shape[0]] = self._values
+        self._values = values
+
+    def index(self, state, add = True):
+        ''' row index of a state, unseen states are added to the hash index
+        '''
+        idx = self.indexer.index(state, add = add)
+        if not self.indexer.dense:
+            self._reserve(len(self.indexer))
+        return idx
+
+    def indices(self, states, add = True):
+        idxs = self.indexer.indices(states, add = add)
+        if not self.indexer.dense:
+            self._reserve(len(self.indexer))
+        return idxs
+
+    def greedy(self, state):
+        ''' greedy action of a state
+        '''
+        idx = self.index(state)
+        return int(np.argmax(self._values[idx]))
+
+    def greedy_batch(self, idxs):
+        ''' greedy actions of a batch of row indices
+        '''
+        return np.argmax(self._values[idxs], axis = 1)
+
+    def epsilon_greedy(self, state, epsilon):
+        ''' epsilon-greedy action of a state, the random draw is taken before the lookup so exploratory steps skip it
+        '''
+        if np.random.uniform(0, 1) > epsilon:
+            return self.greedy(state)
+        return int(np.random.randint(self.n_actions))
+
+    def epsilon_greedy_batch(self, idxs, epsilon):
+        ''' epsilon-greedy actions of a batch of row indices, epsilon is a scalar or one value per index
+        '''
+        actions = self.greedy_batch(idxs)
+        explore = np.random.uniform(0, 1, size = actions.shape) <= epsilon
+        actions[explore] = np.random.randint(self.n_actions, size = int(explore.sum()))
+        return actions
+
+    def save(self, fpath):
+        ''' save values with np.save to fpath exactly (no suffix is appended), state keys of the hash index go to {fpath}_keys.npy
+        '''
+        with open(fpath, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.values))
+        if not self.indexer.dense:
+            keys = np.empty(len(self.indexer), dtype = object)
+            for idx, key in enumerate(self.indexer.keys()): # element-wise so tuple keys are not broadcast
+                keys[idx] = key
+            np.save(f"{fpath}_keys.npy", keys, allow_pickle = True)
+
+    def load(self, fpath, mmap_mode = None):
+        ''' load values saved by save, with mmap_mode (e.g. 'r' or 'r+') the table is memory mapped instead of read into memory
+        '''
+        values = np.load(fpath, mmap_mode = mmap_mode)
+        if not self.indexer.dense:
+            self.indexer.load_keys(np.load(f"{fpath}_keys.npy", allow_pickle = True).tolist())
+        elif values.shape[0] != self.indexer.n_states:
+            raise ValueError(f"expected {self.indexer.n_states} states, got {values.shape[0]}")
+        self._values = values
+
+class TabularModel:
+    ''' Deterministic world model (s, a) -> (r, s', done) over row indices of a QTable.
+        Transitions live in growable arrays, one slot per visited pair, so planning can draw and update many pairs in one call.
+    Args:
+        capacity (int): initial number of slots, doubled when full
+    '''
+    def __init__(self, capacity = 1024) -> None:
+        self._slots = {} # (s, a) -> slot
+        self._data = {
+            'states': np.zeros(capacity, dtype = np.int64),
+            'actions': np.zeros(capacity, dtype = np.int64),
+            'rewards': np.zeros(capacity, dtype = np.float64),
+            'next_states': np.zeros(capacity, dtype = np.int64),
+            'dones': np.zeros(capacity, dtype = bool),
+            'priorities': np.zeros(capacity, dtype = np.float64), # only used by prioritized sweeping
+        }
+
+    def __len__(self):
+        return len(self._slots)
+
+    # views of the filled slots
+    states = property(lambda self: self._data['states'][:len(self)])
+    actions = property(lambda self: self._data['actions'][:len(self)])
+    rewards = property(lambda self: self._data['rewards'][:len(self)])
+    next_states = property(lambda self: self._data['next_states'][:len(self)])
+    dones = property(lambda self: self._data['dones'][:len(self)])
+    priorities = property(lambda self: self._data['priorities'][:len(self)])
+
+    def _reserve(self, n_slots):
+        capacity = len(self._data['states'])
+        if n_slots <= capacity:
+            return
+        for k, v in self._data.items():
+            self._data[k] = np.concatenate([v, np.zeros(max(n_slots, 2 * capacity) - capacity, dtype = v.dtype)])
+
+    def add(self, state, action, reward, next_state, done):
+        ''' store the latest outcome of (state, action), returns its slot
+        '''
+        slot = self._slots.setdefault((int(state), int(action)), len(self._slots))
+        self._reserve(len(self._slots))
+        for k, v in zip(('states', 'actions', 'rewards', 'next_states', 'dones'), (state, action, reward, next_state, done)):
+            self._data[k][slot] = v
+        return slot
+
+    def sample(self, n):
+        ''' n slots drawn uniformly with replacement
+        '''
+        return np.random.randint(len(self._slots), size = n)
+
+    def top(self, n, threshold = 0.):
+        ''' at most n slots with the largest priorities above threshold
+        '''
+        priorities = self.priorities
+        slots = np.flatnonzero(priorities > threshold)
+        if len(slots) > n:
+            slots = slots[np.argpartition(-priorities[slots], n - 1)[:n]]
+        return slots
+
+    def predecessors(self, states):
+        ''' slots whose next state is one of states
+        '''
+        return np.flatnonzero(np.isin(self.next_states, states))
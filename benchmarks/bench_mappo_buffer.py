@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''
+Discription: micro benchmark of the MAPPO buffer in common/memories.py against the former per-step python loops,
+times compute_returns and one pass of each minibatch generator over data_chunk_length/num_mini_batch settings,
+checks that both give the same returns and minibatches, and reports timings as json.
+Usage:
+    python benchmarks/bench_mappo_buffer.py
+    python benchmarks/bench_mappo_buffer.py --episode_length 400 --n_rollout_threads 32 --num_agents 5 --data_chunk_length 10 25 --num_mini_batch 1 4
+'''
+import sys, os
+curr_path = os.path.dirname(os.path.abspath(__file__))  # current path
+parent_path = os.path.dirname(curr_path)  # parent path
+sys.path.append(parent_path)  # add path to system path
+import argparse, json, time
+from types import SimpleNamespace
+import numpy as np
+import torch
+from gymnasium.spaces import Box, Discrete
+from common.memories import SharedReplayBuffer
+
+def _flatten(T, N, x):
+    return x.reshape(T * N, *x.shape[2:])
+
+def _cast(x):
+    return x.transpose(1, 2, 0, 3).reshape(-1, *x.shape[3:])
+
+def legacy_compute_returns(buffer, next_value):
+    ''' per-step loop of the former SharedReplayBuffer.compute_returns, without value normalizer
+    '''
+    if buffer._use_gae:
+        buffer.value_preds[-1] = next_value
+        gae = 0
+        for step in reversed(range(buffer.rewards.shape[0])):
+            delta = buffer.rewards[step] + buffer.gamma * buffer.value_preds[step + 1] * buffer.masks[step + 1] - buffer.value_preds[step]
+            gae = delta + buffer.gamma * buffer.gae_lambda * buffer.masks[step + 1] * gae
+            if buffer._use_proper_time_limits:
+                gae = gae * buffer.bad_masks[step + 1]
+            buffer.returns[step] = gae + buffer.value_preds[step]
+    else:
+        buffer.returns[-1] = next_value
+        for step in reversed(range(buffer.rewards.shape[0])):
+            if buffer._use_proper_time_limits:
+                buffer.returns[step] = (buffer.returns[step + 1] * buffer.gamma * buffer.masks[step + 1] + buffer.rewards[step]) * buffer.bad_masks[step + 1] \
+                    + (1 - buffer.bad_masks[step + 1]) * buffer.value_preds[step]
+            else:
+                buffer.returns[step] = buffer.returns[step + 1] * buffer.gamma * buffer.masks[step + 1] + buffer.rewards[step]
+
+def legacy_naive_recurrent_generator(buffer, advantages, num_mini_batch):
+    ''' former SharedReplayBuffer.naive_recurrent_generator, one sequence at a time with lists and np.stack
+    '''
+    episode_length, n_rollout_threads, num_agents = buffer.rewards.shape[0:3]
+    batch_size = n_rollout_threads * num_agents
+    num_envs_per_batch = batch_size // num_mini_batch
+    perm = torch.randperm(batch_size).numpy()
+    arrays = [buffer.share_obs, buffer.obs, buffer.actions, buffer.value_preds, buffer.returns, buffer.masks,
+              buffer.active_masks, buffer.action_log_probs, advantages, buffer.available_actions]
+    arrays = [x.reshape(-1, batch_size, *x.shape[3:]) for x in arrays]
+    rnn_states = buffer.rnn_states.reshape(-1, batch_size, *buffer.rnn_states.shape[3:])
+    rnn_states_critic = buffer.rnn_states_critic.reshape(-1, batch_size, *buffer.rnn_states_critic.shape[3:])
+    T = episode_length
+    for start_ind in range(0, num_mini_batch * num_envs_per_batch, num_envs_per_batch):
+        batches = [[] for _ in arrays]
+        rnn_states_batch, rnn_states_critic_batch = [], []
+        for offset in range(num_envs_per_batch):
+            ind = perm[start_ind + offset]
+            for batch, x in zip(batches, arrays):
+                batch.append(x[:T, ind])
+            rnn_states_batch.append(rnn_states[0:1, ind])
+            rnn_states_critic_batch.append(rnn_states_critic[0:1, ind])
+        N = num_envs_per_batch
+        batches = [_flatten(T, N, np.stack(batch, 1)) for batch in batches]
+        rnn_states_batch = np.stack(rnn_states_batch).reshape(N, *buffer.rnn_states.shape[3:])
+        rnn_states_critic_batch = np.stack(rnn_states_critic_batch).reshape(N, *buffer.rnn_states_critic.shape[3:])
+        yield batches, rnn_states_batch, rnn_states_critic_batch
+
+def legacy_recurrent_generator(buffer, advantages, num_mini_batch, data_chunk_length):
+    ''' former SharedReplayBuffer.recurrent_generator, one chunk at a time with lists and np.stack
+    '''
+    episode_length, n_rollout_threads, num_agents = buffer.rewards.shape[0:3]
+    batch_size = n_rollout_threads * episode_length * num_agents
+    data_chunks = batch_size // data_chunk_length
+    mini_batch_size = data_chunks // num_mini_batch
+    rand = torch.randperm(data_chunks).numpy()
+    sampler = [rand[i * mini_batch_size:(i + 1) * mini_batch_size] for i in range(num_mini_batch)]
+    arrays = [buffer.share_obs[:-1], buffer.obs[:-1], buffer.actions, buffer.value_preds[:-1], buffer.returns[:-1],
+              buffer.masks[:-1], buffer.active_masks[:-1], buffer.action_log_probs, advantages, buffer.available_actions[:-1]]
+    arrays = [_cast(x) for x in arrays]
+    rnn_states = buffer.rnn_states[:-1].transpose(1, 2, 0, 3, 4).reshape(-1, *buffer.rnn_states.shape[3:])
+    rnn_states_critic = buffer.rnn_states_critic[:-1].transpose(1, 2, 0, 3, 4).reshape(-1, *buffer.rnn_states_critic.shape[3:])
+    L, N = data_chunk_length, mini_batch_size
+    for indices in sampler:
+        batches = [[] for _ in arrays]
+        rnn_states_batch, rnn_states_critic_batch = [], []
+        for index in indices:
+            ind = index * data_chunk_length
+            for batch, x in zip(batches, arrays):
+                batch.append(x[ind:ind + data_chunk_length])
+            rnn_states_batch.append(rnn_states[ind])
+            rnn_states_critic_batch.append(rnn_states_critic[ind])
+        batches = [_flatten(L, N, np.stack(batch, axis = 1)) for batch in batches]
+        rnn_states_batch = np.stack(rnn_states_batch).reshape(N, *buffer.rnn_states.shape[3:])
+        rnn_states_critic_batch = np.stack(rnn_states_critic_batch).reshape(N, *buffer.rnn_states_critic.shape[3:])
+        yield batches, rnn_states_batch, rnn_states_critic_batch
+
+def make_buffer(args, use_gae, use_proper_time_limits):
+    buffer_args = SimpleNamespace(episode_length = args.episode_length, n_rollout_threads = args.n_rollout_threads,
+                                  hidden_size = args.hidden_size, recurrent_N = 1, gamma = 0.99, gae_lambda = 0.95,
+                                  use_gae = use_gae, use_popart = False, use_valuenorm = False,
+                                  use_proper_time_limits = use_proper_time_limits)
+    obs_space = Box(-1, 1, (args.obs_dim,))
+    share_obs_space = Box(-1, 1, (args.obs_dim * args.num_agents,))
+    buffer = SharedReplayBuffer(buffer_args, args.num_agents, obs_space, share_obs_space, Discrete(5))
+    rng = np.random.default_rng(args.seed)
+    for x in [buffer.share_obs, buffer.obs, buffer.rnn_states, buffer.rnn_states_critic, buffer.actions,
+              buffer.action_log_probs, buffer.value_preds, buffer.rewards]:
+        x[:] = rng.standard_normal(x.shape)
+    buffer.masks[:] = rng.random(buffer.masks.shape) > 0.05 # episodes end at random steps
+    buffer.bad_masks[:] = rng.random(buffer.bad_masks.shape) > 0.02
+    buffer.active_masks[:] = rng.random(buffer.active_masks.shape) > 0.1
+    return buffer
+
+def timeit(fn, repeat):
+    ''' best of repeat runs in seconds
+    '''
+    times = []
+    for _ in range(repeat):
+        s_t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - s_t)
+    return min(times)
+
+def check_batches(new_batches, old_batches):
+    for new, (old, old_rnn_states, old_rnn_states_critic) in zip(new_batches, old_batches):
+        (share_obs, obs, rnn_states, rnn_states_critic, actions, value_preds, returns, masks,
+         active_masks, action_log_probs, adv_targ, available_actions) = new
+        for x, y in zip([share_obs, obs, actions, value_preds, returns, masks, active_masks,
+                         action_log_probs, adv_targ, available_actions], old):
+            assert np.array_equal(x, y), "minibatches differ from the former generator"
+        assert np.array_equal(rnn_states, old_rnn_states) and np.array_equal(rnn_states_critic, old_rnn_states_critic)
+
+def bench_returns(args):
+    results = []
+    for use_gae in [True, False]:
+        for use_proper_time_limits in [True, False]:
+            buffer = make_buffer(args, use_gae, use_proper_time_limits)
+            next_value = buffer.value_preds[-1].copy()
+            legacy_compute_returns(buffer, next_value)
+            old_returns = buffer.returns.copy()
+            buffer.compute_returns(next_value)
+            assert np.allclose(buffer.returns, old_returns, rtol = 1e-4, atol = 1e-4), "returns differ from the former loop"
+            results.append({
+                'use_gae': use_gae,
+                'use_proper_time_limits': use_proper_time_limits,
+                'legacy_s': timeit(lambda: legacy_compute_returns(buffer, next_value), args.repeat),
+                'vectorized_s': timeit(lambda: buffer.compute_returns(next_value), args.repeat),
+            })
+    return results
+
+def bench_generators(args):
+    buffer = make_buffer(args, True, False)
+    buffer.compute_returns(buffer.value_preds[-1].copy())
+    advantages = buffer.returns[:-1] - buffer.value_preds[:-1]
+    results = []
+    for num_mini_batch in args.num_mini_batch:
+        torch.manual_seed(args.seed)
+        new = list(buffer.naive_recurrent_generator(advantages, num_mini_batch))
+        torch.manual_seed(args.seed)
+        check_batches(new, legacy_naive_recurrent_generator(buffer, advantages, num_mini_batch))
+        results.append({
+            'generator': 'naive_recurrent',
+            'num_mini_batch': num_mini_batch,
+            'legacy_s': timeit(lambda: list(legacy_naive_recurrent_generator(buffer, advantages, num_mini_batch)), args.repeat),
+            'vectorized_s': timeit(lambda: list(buffer.naive_recurrent_generator(advantages, num_mini_batch)), args.repeat),
+        })
+        for data_chunk_length in args.data_chunk_length:
+            torch.manual_seed(args.seed)
+            new = list(buffer.recurrent_generator(advantages, num_mini_batch, data_chunk_length))
+            torch.manual_seed(args.seed)
+            check_batches(new, legacy_recurrent_generator(buffer, advantages, num_mini_batch, data_chunk_length))
+            results.append({
+                'generator': 'recurrent',
+                'num_mini_batch': num_mini_batch,
+                'data_chunk_length': data_chunk_length,
+                'legacy_s': timeit(lambda: list(legacy_recurrent_generator(buffer, advantages, num_mini_batch, data_chunk_length)), args.repeat),
+                'vectorized_s': timeit(lambda: list(buffer.recurrent_generator(advantages, num_mini_batch, data_chunk_length)), args.repeat),
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = "MAPPO buffer benchmark")
+    parser.add_argument('--episode_length', default = 200, type = int)
+    parser.add_argument('--n_rollout_threads', default = 16, type = int)
+    parser.add_argument('--num_agents', default = 3, type = int)
+    parser.add_argument('--obs_dim', default = 32, type = int)
+    parser.add_argument('--hidden_size', default = 64, type = int)
+    parser.add_argument('--data_chunk_length', default = [10, 25], type = int, nargs = '+')
+    parser.add_argument('--num_mini_batch', default = [1, 4], type = int, nargs = '+')
+    parser.add_argument('--repeat', default = 3, type = int, help = "best of repeat runs is reported")
+    parser.add_argument('--seed', default = 1, type = int)
+    parser.add_argument('--output', default = None, type = str, help = "json file to save results")
+    args = parser.parse_args()
+    results = {'compute_returns': bench_returns(args), 'generators': bench_generators(args)}
+    for group in results.values():
+        for res in group:
+            res['speedup'] = res['legacy_s'] / res['vectorized_s']
+    print(json.dumps(results, indent = 2))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''
+Discription: throughput benchmark of presets, run each preset for a fixed budget of env steps or update steps,
+report env steps/sec, updates/sec, sample-to-train latency, peak RSS and time-to-first-update as json,
+and compare them with a stored baseline to catch regressions.
+Usage:
+    python benchmarks/run_benchmark.py --output benchmarks/results.json
+    python benchmarks/run_benchmark.py --baseline benchmarks/results.json --tolerance 0.2
+'''
+import sys, os
+curr_path = os.path.dirname(os.path.abspath(__file__))  # current path
+parent_path = os.path.dirname(curr_path)  # parent path
+sys.path.append(parent_path)  # add path to system path
+import argparse, json, logging, resource, tempfile, time
+import multiprocessing as mp
+from queue import Empty
+from framework.message import Msg, MsgType
+
+# classic control and toy text presets run without special hardware
+DEFAULT_PRESETS = [
+    'presets/ClassControl/CartPole-v1/CartPole-v1_DQN.yaml',
+    'presets/ClassControl/CartPole-v1/CartPole-v1_PPO.yaml',
+    'presets/ClassControl/Pendulum-v1/Pendulum-v1_SAC.yaml',
+    'presets/ToyText/CliffWalking-v0/CliffWalking-v0_QLearning.yaml',
+    'presets/ToyText/CliffWalking-v0/CliffWalking-v0_Sarsa.yaml',
+]
+# metric name -> True if higher is better
+METRICS = {
+    'env_steps_per_sec': True,
+    'updates_per_sec': True,
+    'sample_to_train_latency': False,
+    'time_to_first_update': False,
+    'peak_rss_mb': False,
+    'peak_rss_children_mb': False,
+}
+
+class TimedCollector:
+    ''' record when sampled exps are put into collector
+    '''
+    def __init__(self, collector, stats) -> None:
+        self.collector = collector
+        self.stats = stats
+    def pub_msg(self, msg: Msg):
+        if msg.type == MsgType.COLLECTOR_PUT_EXPS:
+            self.stats['pending_put_times'].append(time.time())
+        return self.collector.pub_msg(msg)
+
+class TimedLearner:
+    ''' record latency from exps being put into collector to the update consuming them, and time to first update
+    '''
+    def __init__(self, learner, dataserver, stats) -> None:
+        self.learner = learner
+        self.dataserver = dataserver
+        self.stats = stats
+        self.last_update_step = 0
+    def pub_msg(self, msg: Msg):
+        output = self.learner.pub_msg(msg)
+        if msg.type == MsgType.LEARNER_UPDATE_POLICY:
+            update_step = self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_GET_UPDATE_STEP))
+            if update_step > self.last_update_step:
+                now = time.time()
+                if self.stats['first_update_time'] is None:
+                    self.stats['first_update_time'] = now
+                self.stats['latencies'].extend(now - t for t in self.stats['pending_put_times'])
+                self.stats['pending_put_times'].clear()
+                self.last_update_step = update_step
+        return output
+
+def _peak_rss_mb(who = resource.RUSAGE_SELF):
+    ''' peak resident memory of this process, or with RUSAGE_CHILDREN of its largest finished child
+        (peaks of different processes happen at different times, so they are not added), ru_maxrss is in KB on linux
+    '''
+    return resource.getrusage(who).ru_maxrss / 1024
+
+def run_preset(preset, max_sample_count = -1, max_update_step = -1):
+    ''' run one preset until the budget is used up and collect metrics
+    '''
+    from main import Main
+    logging.disable(logging.INFO) # keep benchmark output clean, including the config dump of create_trainer
+    os.chdir(tempfile.mkdtemp()) # task dirs go to a temp dir
+    main = Main(os.path.join(parent_path, preset))
+    main.cfg.mode = 'train'
+    main.cfg.load_checkpoint = False
+    main.cfg.max_episode = -1
+    main.cfg.max_sample_count = max_sample_count
+    main.cfg.max_update_step = max_update_step
+    trainer = main.create_trainer()
+    stats = {'pending_put_times': [], 'latencies': [], 'first_update_time': None}
+    trainer.collector = TimedCollector(trainer.collector, stats)
+    trainer.learner = TimedLearner(trainer.learner, trainer.dataserver, stats)
+    s_t = time.time()
+    trainer.run()
+    wall_time = time.time() - s_t
+    env_steps, updates = trainer.dataserver.get_sample_count(), trainer.dataserver.get_update_step()
+    main.close()
+    latencies = stats['latencies']
+    return {
+        'preset': preset,
+        'max_sample_count': max_sample_count,
+        'max_update_step': max_update_step,
+        'wall_time': wall_time,
+        'env_steps': env_steps,
+        'updates': updates,
+        'env_steps_per_sec': env_steps / wall_time,
+        'updates_per_sec': updates / wall_time,
+        'sample_to_train_latency': sum(latencies) / len(latencies) if len(latencies) > 0 else None,
+        'time_to_first_update': stats['first_update_time'] - s_t if stats['first_update_time'] is not None else None,
+        'peak_rss_mb': _peak_rss_mb(),
+        'peak_rss_children_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN), # e.g. subproc envs or process actors
+    }
+
+def _run_preset_worker(queue, preset, max_sample_count, max_update_step):
+    try:
+        queue.put(run_preset(preset, max_sample_count, max_update_step))
+    except Exception as e:
+        queue.put({'preset': preset, 'error': f"{type(e).__name__}: {e}"})
+
+def _wait_result(queue, p, preset, timeout = None):
+    ''' wait for the result of a worker, a worker that dies without a result or runs over timeout (s) is recorded as an error
+    '''
+    s_t = time.time()
+    while True:
+        try:
+            return queue.get(timeout = 1.0)
+        except Empty:
+            pass
+        if not p.is_alive():
+            try: # the result may have arrived right before exit
+                return queue.get(timeout = 1.0)
+            except Empty:
+                return {'preset': preset, 'error': f"worker exited with code {p.exitcode} without a result"}
+        if timeout is not None and time.time() - s_t > timeout:
+            p.terminate()
+            return {'preset': preset, 'error': f"timed out after {timeout} s"}
+
+def run_suite(presets, max_sample_count = -1, max_update_step = -1, timeout = None):
+    ''' run every preset in a fresh process, so memory and state are not shared between presets
+    '''
+    ctx = mp.get_context('spawn')
+    results = []
+    for preset in presets:
+        queue = ctx.Queue()
+        p = ctx.Process(target = _run_preset_worker, args = (queue, preset, max_sample_count, max_update_step))
+        p.start()
+        result = _wait_result(queue, p, preset, timeout = timeout)
+        p.join()
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+def compare_with_baseline(results, baseline, tolerance = 0.1):
+    ''' compare results with baseline results of the same presets
+    Returns:
+        regressions (list): (preset, metric, baseline value, current value)
+    '''
+    baseline = {res['preset']: res for res in baseline}
+    regressions = []
+    for res in results:
+        base = baseline.get(res['preset'])
+        if base is None or 'error' in base:
+            continue
+        if 'error' in res:
+            regressions.append((res['preset'], 'error', None, res['error']))
+            continue
+        for metric, higher_is_better in METRICS.items():
+            base_value, value = base.get(metric), res.get(metric)
+            if base_value is None or value is None:
+                continue
+            if higher_is_better and value < base_value * (1 - tolerance):
+                regressions.append((res['preset'], metric, base_value, value))
+            elif not higher_is_better and value > base_value * (1 + tolerance):
+                regressions.append((res['preset'], metric, base_value, value))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = "throughput benchmark of presets")
+    parser.add_argument('--presets', nargs = '+', default = DEFAULT_PRESETS, help = 'preset yaml paths relative to repo root')
+    parser.add_argument('--max_sample_count', type = int, default = 20000, help = 'env steps budget of each preset, -1 means unlimited')
+    parser.add_argument('--max_update_step', type = int, default = -1, help = 'update steps budget of each preset, -1 means unlimited')
+    parser.add_argument('--timeout', type = float, default = None, help = 'seconds before a preset is stopped and recorded as an error')
+    parser.add_argument('--output', type = str, default = None, help = 'path to save results as json')
+    parser.add_argument('--baseline', type = str, default = None, help = 'path of baseline results to compare with')
+    parser.add_argument('--tolerance', type = float, default = 0.1, help = 'relative tolerance before a metric counts as regression')
+    args = parser.parse_args()
+    results = run_suite(args.presets, args.max_sample_count, args.max_update_step, timeout = args.timeout)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, tolerance = args.tolerance)
+        for preset, metric, base_value, value in regressions:
+            print(f"regression: {preset} {metric}: baseline {base_value}, current {value}")
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("no regression")
+
+if __name__ == "__main__":
+    main()
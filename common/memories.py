@@ -0,0 +1,318 @@
+import torch
+import numpy as np
+
+# MAPPO
+from utils.utils import get_shape_from_obs_space, get_shape_from_act_space
+from algos.base.returns import discount_cumsum
+
+class MAPPOBuffer(object):
+    """
+    Rollout storage shared by MAPPO buffers, arrays are laid out as [T(+1), *batch_shape, dim],
+    where batch_shape is (n_rollout_threads,) or (n_rollout_threads, num_agents).
+    Returns are computed with one vectorized scan over time for all threads and agents,
+    minibatches are gathered with one fancy index per array from precomputed index arrays.
+    :param args: (argparse.Namespace) arguments containing relevant model, policy, and env information.
+    :param batch_shape: (tuple) shape of the axes between time and data dims.
+    :param obs_space: (gym.Space) observation space of agents.
+    :param cent_obs_space: (gym.Space) centralized observation space of agents.
+    :param act_space: (gym.Space) action space for agents.
+    """
+    def __init__(self, args, batch_shape, obs_space, cent_obs_space, act_space):
+        self.episode_length = args.episode_length
+        self.n_rollout_threads = args.n_rollout_threads
+        self.hidden_size = args.hidden_size
+        self.recurrent_N = args.recurrent_N
+        self.gamma = args.gamma
+        self.gae_lambda = args.gae_lambda
+        self._use_gae = args.use_gae
+        self._use_popart = args.use_popart
+        self._use_valuenorm = args.use_valuenorm
+        self._use_proper_time_limits = args.use_proper_time_limits
+
+        self.batch_shape = tuple(batch_shape)
+        self.n_batch = int(np.prod(self.batch_shape)) # number of sequences, threads * agents
+        self._chunk_index = {} # data_chunk_length -> index array of chunks, see _get_chunk_index
+
+        obs_shape = get_shape_from_obs_space(obs_space)
+        share_obs_shape = get_shape_from_obs_space(cent_obs_space)
+
+        if type(obs_shape[-1]) == list:
+            obs_shape = obs_shape[:1]
+
+        if type(share_obs_shape[-1]) == list:
+            share_obs_shape = share_obs_shape[:1]
+
+        T, B = self.episode_length, self.batch_shape
+        self.share_obs = np.zeros((T + 1, *B, *share_obs_shape), dtype=np.float32)
+        self.obs = np.zeros((T + 1, *B, *obs_shape), dtype=np.float32)
+
+        self.rnn_states = np.zeros((T + 1, *B, self.recurrent_N, self.hidden_size), dtype=np.float32)
+        self.rnn_states_critic = np.zeros_like(self.rnn_states)
+
+        self.value_preds = np.zeros((T + 1, *B, 1), dtype=np.float32)
+        self.returns = np.zeros_like(self.value_preds)
+
+        if act_space.__class__.__name__ == 'Discrete':
+            self.available_actions = np.ones((T + 1, *B, act_space.n), dtype=np.float32)
+        else:
+            self.available_actions = None
+
+        act_shape = get_shape_from_act_space(act_space)
+
+        self.actions = np.zeros((T, *B, act_shape), dtype=np.float32)
+        self.action_log_probs = np.zeros((T, *B, act_shape), dtype=np.float32)
+        self.rewards = np.zeros((T, *B, 1), dtype=np.float32)
+
+        self.masks = np.ones((T + 1, *B, 1), dtype=np.float32)
+        self.bad_masks = np.ones_like(self.masks)
+        self.active_masks = np.ones_like(self.masks)
+
+        self.step = 0
+
+    def insert(self, share_obs, obs, rnn_states_actor, rnn_states_critic, actions, action_log_probs,
+               value_preds, rewards, masks, bad_masks=None, active_masks=None, available_actions=None):
+        """
+        Insert data into the buffer.
+        :param share_obs: (np.ndarray) centralized observations.
+        :param obs: (np.ndarray) local agent observations.
+        :param rnn_states_actor: (np.ndarray) RNN states for actor network.
+        :param rnn_states_critic: (np.ndarray) RNN states for critic network.
+        :param actions:(np.ndarray) actions taken by agents.
+        :param action_log_probs:(np.ndarray) log probs of actions taken by agents
+        :param value_preds: (np.ndarray) value function prediction at each step.
+        :param rewards: (np.ndarray) reward collected at each step.
+        :param masks: (np.ndarray) denotes whether the environment has terminated or not.
+        :param bad_masks: (np.ndarray) denotes whether a termination is due to episode limit.
+        :param active_masks: (np.ndarray) denotes whether an agent is active or dead in the env.
+        :param available_actions: (np.ndarray) actions available to each agent. If None, all actions are available.
+        """
+        # assignment copies into the preallocated arrays
+        self.share_obs[self.step + 1] = share_obs
+        self.obs[self.step + 1] = obs
+        self.rnn_states[self.step + 1] = rnn_states_actor
+        self.rnn_states_critic[self.step + 1] = rnn_states_critic
+        self.actions[self.step] = actions
+        self.action_log_probs[self.step] = action_log_probs
+        self.value_preds[self.step] = value_preds
+        self.rewards[self.step] = rewards
+        self.masks[self.step + 1] = masks
+        if bad_masks is not None:
+            self.bad_masks[self.step + 1] = bad_masks
+        if active_masks is not None:
+            self.active_masks[self.step + 1] = active_masks
+        if available_actions is not None:
+            self.available_actions[self.step + 1] = available_actions
+
+        self.step = (self.step + 1) % self.episode_length
+
+    def chooseinsert(self, share_obs, obs, rnn_states, rnn_states_critic, actions, action_log_probs,
+                     value_preds, rewards, masks, bad_masks=None, active_masks=None, available_actions=None):
+        """
+        Insert data into the buffer. This insert function is used specifically for Hanabi, which is turn based.
+        Parameters are the same as insert.
+        """
+        self.share_obs[self.step] = share_obs
+        self.obs[self.step] = obs
+        self.rnn_states[self.step + 1] = rnn_states
+        self.rnn_states_critic[self.step + 1] = rnn_states_critic
+        self.actions[self.step] = actions
+        self.action_log_probs[self.step] = action_log_probs
+        self.value_preds[self.step] = value_preds
+        self.rewards[self.step] = rewards
+        self.masks[self.step + 1] = masks
+        if bad_masks is not None:
+            self.bad_masks[self.step + 1] = bad_masks
+        if active_masks is not None:
+            self.active_masks[self.step] = active_masks
+        if available_actions is not None:
+            self.available_actions[self.step] = available_actions
+
+        self.step = (self.step + 1) % self.episode_length
+
+    def after_update(self):
+        """Copy last timestep data to first index. Called after update to model."""
+        self.share_obs[0] = self.share_obs[-1]
+        self.obs[0] = self.obs[-1]
+        self.rnn_states[0] = self.rnn_states[-1]
+        self.rnn_states_critic[0] = self.rnn_states_critic[-1]
+        self.masks[0] = self.masks[-1]
+        self.bad_masks[0] = self.bad_masks[-1]
+        self.active_masks[0] = self.active_masks[-1]
+        if self.available_actions is not None:
+            self.available_actions[0] = self.available_actions[-1]
+
+    def chooseafter_update(self):
+        """Copy last timestep data to first index. This method is used for Hanabi."""
+        self.rnn_states[0] = self.rnn_states[-1]
+        self.rnn_states_critic[0] = self.rnn_states_critic[-1]
+        self.masks[0] = self.masks[-1]
+        self.bad_masks[0] = self.bad_masks[-1]
+
+    def compute_returns(self, next_value, value_normalizer=None):
+        """
+        Compute returns either as discounted sum of rewards, or using GAE.
+        Both are segmented reverse scans y[t] = x[t] + discount * c[t+1] * y[t+1] with c in {0, 1},
+        solved for all time steps, threads and agents at once by discount_cumsum.
+        :param next_value: (np.ndarray) value predictions for the step after the last episode step.
+        :param value_normalizer: (PopArt) If not None, PopArt value normalizer instance.
+        """
+        T = self.rewards.shape[0]
+        rewards = self.rewards.astype(np.float64)
+        next_masks = self.masks[1:].astype(np.float64)
+        # time limit truncations cut the scan like terminations, the value of the step is then used instead
+        bad_masks = self.bad_masks[1:].astype(np.float64) if self._use_proper_time_limits else np.ones_like(next_masks)
+        dones = next_masks * bad_masks == 0.0
+        if self._use_gae:
+            self.value_preds[-1] = next_value
+            values = self.value_preds
+            if self._use_popart or self._use_valuenorm:
+                values = value_normalizer.denormalize(values) # one call for all steps
+            values = np.asarray(values, dtype=np.float64)
+            deltas = rewards + self.gamma * values[1:] * next_masks - values[:-1]
+            gae = discount_cumsum(deltas * bad_masks, self.gamma * self.gae_lambda, dones)
+            self.returns[:T] = gae + values[:-1]
+        else:
+            self.returns[-1] = next_value
+            x = rewards
+            if self._use_proper_time_limits:
+                values = self.value_preds[:-1]
+                if self._use_popart or self._use_valuenorm:
+                    values = value_normalizer.denormalize(values)
+                x = rewards * bad_masks + (1.0 - bad_masks) * np.asarray(values, dtype=np.float64)
+            self.returns[:T] = discount_cumsum(x, self.gamma, dones, last=self.returns[-1])
+
+    def _flat(self, x, n_steps):
+        """[T(+1), *batch_shape, *dims] --> [n_steps * n_batch, *dims], a view in time major order"""
+        return x[:n_steps].reshape(n_steps * self.n_batch, *x.shape[1 + len(self.batch_shape):])
+
+    def _fields(self, advantages):
+        """flattened views of the arrays yielded in minibatches, rnn states are excluded"""
+        T = self.rewards.shape[0]
+        fields = [self._flat(self.share_obs, T), self._flat(self.obs, T), self._flat(self.actions, T),
+                  self._flat(self.value_preds, T), self._flat(self.returns, T), self._flat(self.masks, T),
+                  self._flat(self.active_masks, T), self._flat(self.action_log_probs, T),
+                  None if advantages is None else np.asarray(advantages).reshape(T * self.n_batch, 1),
+                  None if self.available_actions is None else self._flat(self.available_actions, T)]
+        return fields
+
+    def _yield_batch(self, fields, idxs, rnn_states_batch, rnn_states_critic_batch):
+        (share_obs, obs, actions, value_preds, returns, masks, active_masks,
+         action_log_probs, advantages, available_actions) = [None if x is None else x[idxs] for x in fields]
+        return share_obs, obs, rnn_states_batch, rnn_states_critic_batch, actions, \
+               value_preds, returns, masks, active_masks, action_log_probs, \
+               advantages, available_actions
+
+    def feed_forward_generator(self, advantages, num_mini_batch=None, mini_batch_size=None):
+        """
+        Yield training data for MLP policies.
+        :param advantages: (np.ndarray) advantage estimates.
+        :param num_mini_batch: (int) number of minibatches to split the batch into.
+        :param mini_batch_size: (int) number of samples in each minibatch.
+        """
+        T = self.rewards.shape[0]
+        batch_size = T * self.n_batch
+
+        if mini_batch_size is None:
+            assert batch_size >= num_mini_batch, (
+                "PPO requires the number of steps * processes * agents ({}) "
+                "to be greater than or equal to the number of PPO mini batches ({})."
+                "".format(batch_size, num_mini_batch))
+            mini_batch_size = batch_size // num_mini_batch
+
+        rand = torch.randperm(batch_size).numpy()
+        fields = self._fields(advantages)
+        rnn_states = self._flat(self.rnn_states, T)
+        rnn_states_critic = self._flat(self.rnn_states_critic, T)
+        for i in range(num_mini_batch):
+            # obs size [T+1 N M Dim]-->[T*N*M,Dim]-->[index,Dim]
+            indices = rand[i * mini_batch_size:(i + 1) * mini_batch_size]
+            yield self._yield_batch(fields, indices, rnn_states[indices], rnn_states_critic[indices])
+
+    def naive_recurrent_generator(self, advantages, num_mini_batch):
+        """
+        Yield training data for non-chunked RNN training, each minibatch holds whole sequences of some threads (and agents).
+        :param advantages: (np.ndarray) advantage estimates.
+        :param num_mini_batch: (int) number of minibatches to split the batch into.
+        """
+        T, n_batch = self.rewards.shape[0], self.n_batch
+        assert n_batch >= num_mini_batch, (
+            "PPO requires the number of processes * agents ({}) "
+            "to be greater than or equal to the number of "
+            "PPO mini batches ({}).".format(n_batch, num_mini_batch))
+        num_envs_per_batch = n_batch // num_mini_batch
+        perm = torch.randperm(n_batch).numpy()
+
+        fields = self._fields(advantages)
+        rnn_states = self.rnn_states[0].reshape(n_batch, *self.rnn_states.shape[1 + len(self.batch_shape):])
+        rnn_states_critic = self.rnn_states_critic[0].reshape(rnn_states.shape)
+        steps = np.arange(T)[:, None] * n_batch
+        for start_ind in range(0, num_mini_batch * num_envs_per_batch, num_envs_per_batch):
+            inds = perm[start_ind:start_ind + num_envs_per_batch]
+            # rows of the time major flattened arrays, [T, N] --> [T * N], T first as expected by the RNN layer
+            idxs = (steps + inds[None, :]).ravel()
+            yield self._yield_batch(fields, idxs, rnn_states[inds], rnn_states_critic[inds])
+
+    def _get_chunk_index(self, data_chunk_length):
+        """
+        Index array of shape [data_chunks, L], row c holds the rows of the time major flattened arrays
+        of chunk c, chunks are consecutive steps of one sequence in (thread, agent, step) order.
+        """
+        if data_chunk_length not in self._chunk_index:
+            T, n_batch = self.rewards.shape[0], self.n_batch
+            data_chunks = T * n_batch // data_chunk_length
+            pos = np.arange(data_chunks * data_chunk_length).reshape(data_chunks, data_chunk_length) # position in (seq, step) order
+            self._chunk_index[data_chunk_length] = (pos % T) * n_batch + pos // T # --> row of [T * n_batch]
+        return self._chunk_index[data_chunk_length]
+
+    def recurrent_generator(self, advantages, num_mini_batch, data_chunk_length):
+        """
+        Yield training data for chunked RNN training.
+        :param advantages: (np.ndarray) advantage estimates.
+        :param num_mini_batch: (int) number of minibatches to split the batch into.
+        :param data_chunk_length: (int) length of sequence chunks with which to train RNN.
+        """
+        T = self.rewards.shape[0]
+        batch_size = T * self.n_batch
+        assert batch_size >= data_chunk_length, (
+            "PPO requires the number of steps * processes * agents ({}) "
+            "to be greater than or equal to the data chunk length ({}).".format(batch_size, data_chunk_length))
+        data_chunks = batch_size // data_chunk_length  # [C=N*M*T/L]
+        mini_batch_size = data_chunks // num_mini_batch
+
+        rand = torch.randperm(data_chunks).numpy()
+        chunk_index = self._get_chunk_index(data_chunk_length)
+        fields = self._fields(advantages)
+        rnn_states = self._flat(self.rnn_states, T)
+        rnn_states_critic = self._flat(self.rnn_states_critic, T)
+        for i in range(num_mini_batch):
+            indices = rand[i * mini_batch_size:(i + 1) * mini_batch_size]
+            # [N, L] --> [L, N] --> [L * N], L first as expected by the RNN layer
+            idxs = chunk_index[indices].T.ravel()
+            # rnn states at the first step of each chunk, [N, Dim]
+            starts = chunk_index[indices, 0]
+            yield self._yield_batch(fields, idxs, rnn_states[starts], rnn_states_critic[starts])
+
+
+class SeparatedReplayBuffer(MAPPOBuffer):
+    """
+    Buffer of one agent, arrays are [T(+1), n_rollout_threads, dim].
+    :param args: (argparse.Namespace) arguments containing relevant model, policy, and env information.
+    :param obs_space: (gym.Space) observation space of the agent.
+    :param share_obs_space: (gym.Space) centralized observation space.
+    :param act_space: (gym.Space) action space of the agent.
+    """
+    def __init__(self, args, obs_space, share_obs_space, act_space):
+        super().__init__(args, (args.n_rollout_threads,), obs_space, share_obs_space, act_space)
+
+
+class SharedReplayBuffer(MAPPOBuffer):
+    """
+    Buffer of all agents sharing one policy, arrays are [T(+1), n_rollout_threads, num_agents, dim].
+    :param args: (argparse.Namespace) arguments containing relevant model, policy, and env information.
+    :param num_agents: (int) number of agents in the env.
+    :param obs_space: (gym.Space) observation space of agents.
+    :param cent_obs_space: (gym.Space) centralized observation space of agents.
+    :param act_space: (gym.Space) action space for agents.
+    """
+    def __init__(self, args, num_agents, obs_space, cent_obs_space, act_space):
+        super().__init__(args, (args.n_rollout_threads, num_agents), obs_space, cent_obs_space, act_space)
@@ -28,20 +28,43 @@ class GeneralConfig():
         self.seed = 0 # random seed
         self.max_episode = 100 # number of episodes for training, set -1 to keep running
         self.max_step = 200 # number of episodes for testing, set -1 means unlimited steps
+        self.max_sample_count = -1 # stop after n env steps sampled by all interactors, set -1 means unlimited
+        self.max_update_step = -1 # stop after n update steps, set -1 means unlimited
         self.collect_traj = False # if collect trajectory or not
         # multiprocessing settings
-        self.mp_backend = "single" # multiprocessing backend: "ray", default "single"
+        self.mp_backend = "single" # multiprocessing backend: "ray", "subproc" (envs in worker processes with shared memory), "process" (interactors, collector, dataserver and learner in torch.multiprocessing processes), default "single"
         self.n_workers = 1 # number of workers
         self.n_learners = 1 # number of learners if using multi-processing, default 1
         self.share_buffer = True # if all learners share the same buffer
+        self.policy_publish_fre = 1 # publish learner params to policy manager every n update steps
+        self.interactor_mode = "dummy" # "dummy": run interactors one by one, "batch": step all envs in lockstep with batched actions, "numpy": same as batch with a batched numpy env from envs/vec_register.py
+        # async training settings
+        self.async_train = False # if True, interactors sample on a background thread while the learner keeps updating
+        self.async_queue_size = 8 # max number of pending sampled batches, interactors block when the queue is full
+        self.async_max_staleness = 50 # max update steps the learner may run ahead of the params used by the latest exps, it waits for fresher exps beyond that (checked per learner update, params are only as fresh as policy_publish_fre allows)
         # online evaluation settings
-        self.online_eval = False # online evaluation or not
+        self.online_eval = False # evaluate the latest params whenever a checkpoint is saved (every model_save_fre update steps), rewards are recorded in checkpoints.json
         self.online_eval_episode = 10 # online eval episodes
         self.model_save_fre = 500 # model save frequency per update step
+        # checkpoint settings
+        self.ckpt_keep_last = 5 # keep the last k checkpoints, -1 to keep all
+        self.ckpt_keep_best = 3 # keep the best n checkpoints by online eval reward
+        self.ckpt_keep_every = 0 # keep checkpoints every m update steps, 0 to disable
+        self.ckpt_save_optimizer = False # save optimizer state together with model
         # load model settings
         self.load_checkpoint = True # if load checkpoint
         self.load_path = "Train_single_CartPole-v1_DQN_20230515-211721" # path to load model
-        self.load_model_step = 'best' # load model at which step
+        self.load_model_step = 'best' # load model at which step, 'best', 'last' or an update step
         # stats recorder settings
         self.interact_summary_fre = 1 # record interact stats per episode
         self.model_summary_fre = 1 # record update stats per update step
+        self.metrics_window = 1 # aggregate scalars (mean, min, max, count) over windows of n steps, 1 for no aggregation
+        self.metrics_flush_interval = 5 # seconds between flushes of buffered metrics to sinks
+        self.metrics_sinks = ['tensorboard', 'npz'] # metrics sinks: tensorboard (tb_dir), csv (res_dir) and npz (chunks in res_dir/metrics)
+        # perf settings
+        self.perf_timers = False # time training stages and record them as scalars of the perf writter type
+        self.perf_summary_fre = 100 # record perf scalars every n trainer iterations
+        self.perf_profiler = None # capture a profile of the first iterations into task_dir: None, "cprofile" or "torch"
+        self.perf_profile_iters = 50 # number of trainer iterations to profile
+        self.trace_events = False # record pub_msg handlers and stage boundaries of all processes, saved to task_dir/trace.json on close
+        self.trace_buffer_size = 100000 # max number of trace events kept per process, oldest are dropped first
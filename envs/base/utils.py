@@ -0,0 +1,24 @@
+import gymnasium as gym
+
+def make_env(env_cfg):
+    ''' make an env from its config and apply env_cfg.wrapper if any, so the main process and all interactors
+        see the same observation space
+    '''
+    env_cfg_dic = env_cfg.__dict__
+    kwargs = {k: v for k, v in env_cfg_dic.items() if k not in env_cfg_dic['ignore_params']}
+    env = gym.make(**kwargs)
+    if env_cfg.wrapper is not None:
+        wrapper_class_path = env_cfg.wrapper.split('.')[:-1]
+        wrapper_class_name = env_cfg.wrapper.split('.')[-1]
+        env_wapper = __import__('.'.join(wrapper_class_path), fromlist=[wrapper_class_name])
+        env = getattr(env_wapper, wrapper_class_name)(env)
+    return env
+
+def get_n_frame_stack(env):
+    ''' number of stacked frames of the first FrameStack wrapper in the wrapper chain of env, None if obs are not frame stacks
+    '''
+    while env is not None:
+        if getattr(env, 'num_stack', None) is not None:
+            return env.num_stack
+        env = getattr(env, 'env', None)
+    return None
@@ -0,0 +1,169 @@
+''' Batched numpy counterparts of the toy text and grid envs, one object steps num_envs copies at once.
+    They follow the step API of ShmSubprocVecEnv: step_async(actions, env_idxs) / step_wait() returns
+    (obs, rewards, terminated, truncated, infos), finished envs are reset automatically and their last obs
+    is in info['final_observation'].
+'''
+import os
+import importlib
+import numpy as np
+from gymnasium.spaces import Box, Discrete
+from envs.multiprocessing_env import VecEnv
+
+def load_entry_point(entry_point):
+    ''' load 'module:attr' as gym registration does
+    '''
+    module, attr = entry_point.split(':')
+    return getattr(importlib.import_module(module), attr)
+
+class BatchedDiscreteEnv(VecEnv):
+    ''' Batched env of a tabular MDP given as P[s][a] = [(prob, next_state, reward, done), ...] and an initial state distribution,
+        e.g. envs.simple_grid.DrunkenWalkEnv, envs.cliff_walking.CliffWalkingEnv or gym FrozenLake.
+        Outcomes are padded into [S, A, K] tables with their cumulative probabilities, so a step is one table lookup per env.
+    '''
+    def __init__(self, num_envs, P, isd, max_episode_steps = None, seed = None):
+        n_states, n_actions = len(P), max(len(P[s]) for s in P)
+        VecEnv.__init__(self, num_envs, Discrete(n_states), Discrete(n_actions))
+        K = max(len(outcomes) for s in P for outcomes in P[s].values())
+        self.next_states = np.zeros((n_states, n_actions, K), dtype = np.int64)
+        self.rewards = np.zeros((n_states, n_actions, K), dtype = np.float64)
+        self.dones = np.zeros((n_states, n_actions, K), dtype = bool)
+        self.cdf = np.full((n_states, n_actions, K), np.inf) # padded outcomes are never drawn
+        self.n_outcomes = np.ones((n_states, n_actions), dtype = np.int64)
+        for s in P:
+            for a, outcomes in P[s].items():
+                if len(outcomes) == 0: # e.g. unused actions, stay in place
+                    self.next_states[s, a, 0], self.dones[s, a, 0] = s, True
+                    continue
+                probs, next_states, rewards, dones = zip(*[outcome[:4] for outcome in outcomes])
+                n = len(outcomes)
+                self.next_states[s, a, :n], self.rewards[s, a, :n], self.dones[s, a, :n] = next_states, rewards, dones
+                self.cdf[s, a, :n] = np.cumsum(probs)
+                self.n_outcomes[s, a] = n
+        self.deterministic = K == 1
+        self.isd_cdf = np.cumsum(np.asarray(isd, dtype = np.float64))
+        self.max_episode_steps = max_episode_steps
+        self.rng = np.random.default_rng(seed)
+        self.states = np.zeros(num_envs, dtype = np.int64)
+        self.elapsed_steps = np.zeros(num_envs, dtype = np.int64)
+        self.pending = None
+
+    def _sample_initial_states(self, n):
+        return np.searchsorted(self.isd_cdf, self.rng.random(n) * self.isd_cdf[-1], side = 'right')
+
+    def reset(self, seeds = None):
+        ''' reset all envs, return obs and infos
+        '''
+        if seeds is not None and seeds[0] is not None:
+            self.rng = np.random.default_rng(list(seeds))
+        self.states[:] = self._sample_initial_states(self.num_envs)
+        self.elapsed_steps[:] = 0
+        return self.states.copy(), [{} for _ in range(self.num_envs)]
+
+    def step_async(self, actions, env_idxs = None):
+        self.pending = (np.arange(self.num_envs) if env_idxs is None else np.asarray(env_idxs, dtype = np.int64), np.asarray(actions, dtype = np.int64))
+
+    def step_wait(self):
+        idxs, actions = self.pending
+        self.pending = None
+        states = self.states[idxs]
+        if self.deterministic:
+            k = np.zeros(len(idxs), dtype = np.int64)
+        else: # first outcome whose cumulative probability exceeds a uniform draw
+            k = (self.cdf[states, actions] <= self.rng.random(len(idxs))[:, None]).sum(axis = 1)
+            k = np.minimum(k, self.n_outcomes[states, actions] - 1)
+        next_states = self.next_states[states, actions, k]
+        rewards = self.rewards[states, actions, k]
+        terminated = self.dones[states, actions, k]
+        self.elapsed_steps[idxs] += 1
+        truncated = ~terminated & (self.elapsed_steps[idxs] >= self.max_episode_steps) if self.max_episode_steps is not None else np.zeros_like(terminated)
+        obs = next_states.copy()
+        done = np.flatnonzero(terminated | truncated)
+        obs[done] = self._sample_initial_states(len(done))
+        self.elapsed_steps[idxs[done]] = 0
+        self.states[idxs] = obs
+        infos = [{} for _ in range(len(idxs))]
+        for i in done:
+            infos[i]['final_observation'] = next_states[i]
+        return obs, rewards, terminated, truncated, infos
+
+    def close(self):
+        pass
+
+def make_batched_discrete_env(num_envs, env_entry_point, max_episode_steps = None, seed = None, **kwargs):
+    ''' build a BatchedDiscreteEnv from the P and initial state distribution of a single env created from env_entry_point with kwargs
+    '''
+    env = load_entry_point(env_entry_point)(**kwargs)
+    env = getattr(env, 'unwrapped', env)
+    isd = getattr(env, 'isd', None)
+    if isd is None: # gym toy text envs
+        isd = env.initial_state_distrib
+    return BatchedDiscreteEnv(num_envs, env.P, isd, max_episode_steps = max_episode_steps, seed = seed)
+
+class BatchedRacetrackEnv(VecEnv):
+    ''' Batched envs.racetrack.RacetrackEnv. The track is padded by the max speed with walls,
+        so leaving the track and hitting a wall are one lookup of the cell type map.
+    '''
+    ACTIONS = np.array([(1, -1), (1, 0), (1, 1), (0, -1), (0, 0), (0, 1), (-1, -1), (-1, 0), (-1, 1)], dtype = np.int64) # same order as RacetrackEnv.ACTIONS_DICT
+    TRACK, WALL, START, GOAL = 0, 1, 2, 3
+    MAX_SPEED = 10
+
+    def __init__(self, num_envs, track = None, max_episode_steps = 1000, seed = None):
+        if track is None:
+            track = np.flip(np.loadtxt(os.path.dirname(__file__) + "/track.txt", dtype = int), axis = 0)
+        self.track = np.asarray(track, dtype = np.int64)
+        high = np.full(4, np.finfo(np.float32).max)
+        VecEnv.__init__(self, num_envs, Box(low = -high, high = high, shape = (4,), dtype = np.float32), Discrete(len(self.ACTIONS)))
+        self.cells = np.pad(self.track, self.MAX_SPEED, constant_values = self.WALL) # out of bounds counts as a wall
+        self.initial_states = np.argwhere(self.track == self.START)
+        self.max_episode_steps = max_episode_steps
+        self.rng = np.random.default_rng(seed)
+        self.positions = np.zeros((num_envs, 2), dtype = np.int64)
+        self.velocities = np.zeros((num_envs, 2), dtype = np.int64)
+        self.elapsed_steps = np.zeros(num_envs, dtype = np.int64)
+        self.pending = None
+
+    def _obs(self, idxs):
+        return np.concatenate([self.positions[idxs], self.velocities[idxs]], axis = 1)
+
+    def _restart(self, idxs):
+        self.positions[idxs] = self.initial_states[self.rng.integers(len(self.initial_states), size = len(idxs))]
+        self.velocities[idxs] = 0
+
+    def reset(self, seeds = None):
+        if seeds is not None and seeds[0] is not None:
+            self.rng = np.random.default_rng(list(seeds))
+        idxs = np.arange(self.num_envs)
+        self._restart(idxs)
+        self.elapsed_steps[:] = 0
+        return self._obs(idxs), [{} for _ in range(self.num_envs)]
+
+    def step_async(self, actions, env_idxs = None):
+        self.pending = (np.arange(self.num_envs) if env_idxs is None else np.asarray(env_idxs, dtype = np.int64), np.asarray(actions, dtype = np.int64))
+
+    def step_wait(self):
+        idxs, actions = self.pending
+        self.pending = None
+        n = len(idxs)
+        # velocity changes as intended with probability 0.8, and stays within (-10, 10)
+        d_v = self.ACTIONS[actions] * (self.rng.random(n) < 0.8)[:, None]
+        velocities = np.clip(self.velocities[idxs] + d_v, -self.MAX_SPEED, self.MAX_SPEED)
+        positions = self.positions[idxs] + velocities
+        cells = self.cells[positions[:, 0] + self.MAX_SPEED, positions[:, 1] + self.MAX_SPEED]
+        crashed, terminated = cells == self.WALL, cells == self.GOAL
+        rewards = -1. - 10. * crashed + 10. * terminated
+        self.positions[idxs], self.velocities[idxs] = positions, velocities
+        self._restart(idxs[crashed]) # back to the start line with zero velocity
+        self.elapsed_steps[idxs] += 1
+        truncated = ~terminated & (self.elapsed_steps[idxs] >= self.max_episode_steps) if self.max_episode_steps is not None else np.zeros_like(terminated)
+        final_obs = self._obs(idxs)
+        done = np.flatnonzero(terminated | truncated)
+        self._restart(idxs[done])
+        self.elapsed_steps[idxs[done]] = 0
+        obs = self._obs(idxs)
+        infos = [{} for _ in range(n)]
+        for i in done:
+            infos[i]['final_observation'] = final_obs[i]
+        return obs, rewards, terminated, truncated, infos
+
+    def close(self):
+        pass
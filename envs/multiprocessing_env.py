@@ -3,6 +3,7 @@
 
 import numpy as np
 from multiprocessing import Process, Pipe
+from multiprocessing import shared_memory
 
 def worker(remote, parent_remote, env_fn_wrapper):
     parent_remote.close()
@@ -150,4 +151,154 @@ class SubprocVecEnv(VecEnv):
             self.closed = True
             
     def __len__(self):
-        return self.nenvs
\ No newline at end of file
+        return self.nenvs
+
+def _get_space_spec(space):
+    ''' get shape and dtype of one observation from gym space
+    '''
+    if space.__class__.__name__ == 'Discrete':
+        return (), np.dtype(np.int64)
+    return space.shape, np.dtype(space.dtype)
+
+def _create_shm_array(shape, dtype):
+    ''' create numpy array backed by shared memory, return shm and array spec for workers
+    '''
+    nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    arr.fill(0)
+    return shm, arr, (shm.name, shape, np.dtype(dtype).str)
+
+def _attach_shm_array(spec):
+    ''' attach to shared memory created by the main process
+    '''
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+def shm_worker(remote, parent_remote, env_fn_wrapper, env_idx, shm_specs):
+    ''' worker for ShmSubprocVecEnv, writes step results into shared memory and only sends info back
+    '''
+    parent_remote.close()
+    env = env_fn_wrapper.x()
+    shms, bufs = {}, {}
+    for key, spec in shm_specs.items():
+        shms[key], bufs[key] = _attach_shm_array(spec)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                ob, reward, terminated, truncated, info = env.step(data)
+                bufs['final_obs'][env_idx] = ob
+                bufs['rewards'][env_idx] = reward
+                bufs['terminated'][env_idx] = terminated
+                bufs['truncated'][env_idx] = truncated
+                if terminated or truncated: # auto reset
+                    ob, _ = env.reset()
+                bufs['obs'][env_idx] = ob
+                remote.send(info)
+            elif cmd == 'reset':
+                ob, info = env.reset(seed=data)
+                bufs['obs'][env_idx] = ob
+                remote.send(info)
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+            elif cmd == 'get_spaces':
+                remote.send((env.observation_space, env.action_space))
+            else:
+                raise NotImplementedError
+    finally:
+        del bufs # release views before closing shared memory
+        for shm in shms.values():
+            shm.close()
+
+class ShmSubprocVecEnv(VecEnv):
+    ''' Same as SubprocVecEnv, but uses gymnasium step API and shared memory:
+        workers write obs, rewards and done flags into preallocated shared arrays,
+        only actions and infos go through the pipes
+    '''
+    def __init__(self, env_fns, spaces=None):
+        self.waiting = False
+        self.closed = False
+        nenvs = len(env_fns)
+        self.nenvs = nenvs
+        if spaces is None:
+            env = env_fns[0]()
+            spaces = (env.observation_space, env.action_space)
+            env.close()
+        observation_space, action_space = spaces
+        VecEnv.__init__(self, nenvs, observation_space, action_space)
+        obs_shape, obs_dtype = _get_space_spec(observation_space)
+        self.shms, self.bufs, shm_specs = {}, {}, {}
+        buf_cfgs = {
+            'obs': ((nenvs, *obs_shape), obs_dtype), # obs to continue from, after auto reset
+            'final_obs': ((nenvs, *obs_shape), obs_dtype), # obs returned by step, before auto reset
+            'rewards': ((nenvs,), np.float64),
+            'terminated': ((nenvs,), np.bool_),
+            'truncated': ((nenvs,), np.bool_),
+        }
+        for key, (shape, dtype) in buf_cfgs.items():
+            self.shms[key], self.bufs[key], shm_specs[key] = _create_shm_array(shape, dtype)
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(nenvs)])
+        self.ps = [Process(target=shm_worker, args=(work_remote, remote, CloudpickleWrapper(env_fn), env_idx, shm_specs))
+            for env_idx, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns))]
+        for p in self.ps:
+            p.daemon = True # if the main process crashes, we should not cause things to hang
+            p.start()
+        for remote in self.work_remotes:
+            remote.close()
+        self.pending_idxs = []
+
+    def reset(self, seeds=None):
+        ''' reset all envs, return obs and infos
+        '''
+        if seeds is None: seeds = [None] * self.nenvs
+        for remote, seed in zip(self.remotes, seeds):
+            remote.send(('reset', seed))
+        infos = [remote.recv() for remote in self.remotes]
+        return self.bufs['obs'].copy(), infos
+
+    def step_async(self, actions, env_idxs=None):
+        ''' step envs in env_idxs (all envs by default) with the given actions
+        '''
+        self.pending_idxs = list(range(self.nenvs)) if env_idxs is None else list(env_idxs)
+        for env_idx, action in zip(self.pending_idxs, actions):
+            self.remotes[env_idx].send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        ''' wait for the pending steps, return (obs, rewards, terminated, truncated, infos) of the stepped envs,
+            obs are already auto reset for finished envs, whose last obs are in info['final_observation']
+        '''
+        idxs = self.pending_idxs
+        infos = [self.remotes[env_idx].recv() for env_idx in idxs]
+        self.waiting = False
+        obs = self.bufs['obs'][idxs] # fancy indexing copies out of shared memory
+        rewards = self.bufs['rewards'][idxs]
+        terminated = self.bufs['terminated'][idxs]
+        truncated = self.bufs['truncated'][idxs]
+        for i, env_idx in enumerate(idxs):
+            if terminated[i] or truncated[i]:
+                infos[i] = dict(infos[i], final_observation = self.bufs['final_obs'][env_idx].copy())
+        return obs, rewards, terminated, truncated, infos
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for env_idx in self.pending_idxs:
+                self.remotes[env_idx].recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.bufs = {}
+        for shm in self.shms.values():
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def __len__(self):
+        return self.nenvs
@@ -1,5 +1,6 @@
 
 from gym.envs.registration import register
+from envs.vec_register import VEC_ENV_SPECS, register_vec_env, make_vec_env # batched numpy envs, kept apart since they do not need gym
 
 def register_env(env_name):
     if env_name == 'Racetrack-v0':
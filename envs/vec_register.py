@@ -0,0 +1,30 @@
+''' Registry of batched numpy envs used by interactor_mode 'numpy', it only depends on numpy and gymnasium
+'''
+from envs.batched_envs import load_entry_point
+
+VEC_ENV_SPECS = {} # env id -> (entry point, kwargs) of batched numpy envs
+
+def register_vec_env(id, entry_point, **kwargs):
+    ''' register a batched numpy env, the entry point is called as entry_point(num_envs, seed = seed, **kwargs)
+    '''
+    VEC_ENV_SPECS[id] = (entry_point, kwargs)
+
+def make_vec_env(id, num_envs, seed = None, **kwargs):
+    ''' make num_envs copies of a registered env stepped at once with numpy
+    '''
+    entry_point, spec_kwargs = VEC_ENV_SPECS[id]
+    return load_entry_point(entry_point)(num_envs, seed = seed, **{**spec_kwargs, **kwargs})
+
+register_vec_env('CliffWalking-v0', 'envs.batched_envs:make_batched_discrete_env',
+                 env_entry_point = 'gymnasium.envs.toy_text.cliffwalking:CliffWalkingEnv')
+register_vec_env('FrozenLake-v1', 'envs.batched_envs:make_batched_discrete_env', max_episode_steps = 100,
+                 env_entry_point = 'gymnasium.envs.toy_text.frozen_lake:FrozenLakeEnv', map_name = "4x4")
+register_vec_env('FrozenLakeNoSlippery-v1', 'envs.batched_envs:make_batched_discrete_env', max_episode_steps = 100,
+                 env_entry_point = 'gymnasium.envs.toy_text.frozen_lake:FrozenLakeEnv', map_name = "4x4", is_slippery = False)
+register_vec_env('WindyGridworld-v0', 'envs.batched_envs:make_batched_discrete_env',
+                 env_entry_point = 'envs.windy_gridworld:WindyGridworldEnv')
+register_vec_env('theAlley', 'envs.batched_envs:make_batched_discrete_env',
+                 env_entry_point = 'envs.simple_grid:DrunkenWalkEnv', map_name = "theAlley", is_slippery = False)
+register_vec_env('walkInThePark', 'envs.batched_envs:make_batched_discrete_env',
+                 env_entry_point = 'envs.simple_grid:DrunkenWalkEnv', map_name = "walkInThePark")
+register_vec_env('Racetrack-v0', 'envs.batched_envs:BatchedRacetrackEnv', max_episode_steps = 1000)
@@ -0,0 +1,158 @@
+import os
+import json
+import shutil
+import threading
+import torch
+from queue import Queue
+from pathlib import Path
+
+INVENTORY_FNAME = 'checkpoints.json' # on-disk inventory of checkpoints under model_dir
+
+def _atomic_write(fpath, write_fn):
+    ''' write to a temp file first and then rename, so readers never see a half-written file
+    '''
+    tmp_fpath = f"{fpath}.tmp"
+    write_fn(tmp_fpath)
+    os.replace(tmp_fpath, fpath)
+
+def _clone_state(state):
+    ''' deep copy tensors in a nested state dict (e.g. optimizer state) to cpu
+    '''
+    if isinstance(state, torch.Tensor):
+        return state.detach().cpu().clone()
+    if isinstance(state, dict):
+        return {k: _clone_state(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(_clone_state(v) for v in state)
+    return state
+
+def load_inventory(model_dir):
+    ''' load checkpoint inventory of a model dir, empty list if there is none
+    '''
+    fpath = Path(model_dir) / INVENTORY_FNAME
+    if not fpath.exists():
+        return []
+    with open(fpath) as f:
+        return json.load(f)
+
+def get_checkpoint_path(model_dir, model_step = 'best'):
+    ''' get checkpoint path of a model step, model_step can be 'best', 'last' or an update step
+    '''
+    inventory = load_inventory(model_dir)
+    if model_step == 'last' and len(inventory) > 0:
+        model_step = inventory[-1]['step']
+    return f"{model_dir}/{model_step}"
+
+class Checkpointer:
+    ''' Background checkpoint writer, weights are snapshotted in memory by the caller
+        and written atomically on a worker thread, old checkpoints are removed by retention policy:
+        keep the last k, the best n by online eval reward and every m update steps
+    '''
+    def __init__(self, cfg) -> None:
+        self.cfg = cfg
+        self.model_dir = cfg.model_dir
+        self.keep_last = cfg.ckpt_keep_last
+        self.keep_best = cfg.ckpt_keep_best
+        self.keep_every = cfg.ckpt_keep_every
+        self.best_eval_reward = -float('inf')
+        self._inventory = {} # step -> {'step', 'eval_reward', 'optimizer'}
+        self._awaiting_eval = set() # saved steps the online tester has not evaluated yet, kept by retention until it does
+        self._lock = threading.Lock() # protect inventory
+        self._save_queue = Queue(maxsize = 8) # pending snapshots, block the caller only if writer falls far behind
+        self._thread_save = threading.Thread(target = self._run, daemon = True)
+        self._thread_save.start()
+
+    def save(self, update_step, model_params, optimizer_params = None, eval_reward = None):
+        ''' snapshot params in memory and queue them for writing, returns immediately
+        '''
+        model_params = {k: v.detach().cpu().clone() for k, v in model_params.items()}
+        if optimizer_params is not None:
+            optimizer_params = _clone_state(optimizer_params)
+        self._save_queue.put((self._write, (update_step, model_params, optimizer_params, eval_reward)))
+
+    def put_eval_reward(self, update_step, eval_reward):
+        ''' attach an online eval reward to the checkpoint saved at update_step, it becomes the best model if no other scored higher
+        '''
+        self._save_queue.put((self._write_eval_reward, (update_step, eval_reward)))
+
+    def inventory(self):
+        ''' checkpoints currently on disk, sorted by update step
+        '''
+        with self._lock:
+            return [dict(self._inventory[step]) for step in sorted(self._inventory)]
+
+    def close(self):
+        ''' write all pending checkpoints and stop the worker thread
+        '''
+        self._save_queue.put(None)
+        self._thread_save.join()
+
+    def _run(self):
+        while True:
+            job = self._save_queue.get()
+            if job is None:
+                break
+            write_fn, args = job
+            write_fn(*args)
+
+    def _write(self, update_step, model_params, optimizer_params, eval_reward):
+        _atomic_write(f"{self.model_dir}/{update_step}", lambda fpath: torch.save(model_params, fpath))
+        if optimizer_params is not None:
+            _atomic_write(f"{self.model_dir}/{update_step}_optimizer", lambda fpath: torch.save(optimizer_params, fpath))
+        if eval_reward is not None and eval_reward >= self.best_eval_reward:
+            self.best_eval_reward = eval_reward
+            _atomic_write(f"{self.model_dir}/best", lambda fpath: torch.save(model_params, fpath))
+        with self._lock:
+            entry = self._inventory.setdefault(update_step, {'step': update_step, 'eval_reward': None, 'optimizer': False})
+            if eval_reward is not None:
+                entry['eval_reward'] = eval_reward
+            elif self.cfg.online_eval:
+                self._awaiting_eval.add(update_step)
+            entry['optimizer'] = entry['optimizer'] or optimizer_params is not None
+        self._update_inventory()
+
+    def _write_eval_reward(self, update_step, eval_reward):
+        with self._lock:
+            self._awaiting_eval = {step for step in self._awaiting_eval if step > update_step} # earlier steps will not be evaluated any more
+            entry = self._inventory.get(update_step, None)
+            if entry is not None:
+                entry['eval_reward'] = eval_reward
+        if entry is None: # no checkpoint was saved at this step
+            return
+        if eval_reward >= self.best_eval_reward:
+            self.best_eval_reward = eval_reward
+            _atomic_write(f"{self.model_dir}/best", lambda fpath: shutil.copyfile(f"{self.model_dir}/{update_step}", fpath))
+        self._update_inventory()
+
+    def _update_inventory(self):
+        ''' apply retention, remove dropped checkpoints and dump the inventory
+        '''
+        with self._lock:
+            removed_steps = self._apply_retention()
+            inventory = [self._inventory[step] for step in sorted(self._inventory)]
+        for step in removed_steps:
+            for fpath in (f"{self.model_dir}/{step}", f"{self.model_dir}/{step}_optimizer"):
+                if os.path.exists(fpath):
+                    os.remove(fpath)
+        def _dump_inventory(fpath):
+            with open(fpath, 'w') as f:
+                json.dump(inventory, f, indent = 2)
+        _atomic_write(f"{self.model_dir}/{INVENTORY_FNAME}", _dump_inventory)
+
+    def _apply_retention(self):
+        ''' drop checkpoints not kept by any rule from inventory, returns their steps
+        '''
+        steps = sorted(self._inventory)
+        if self.keep_last < 0:
+            return []
+        keep_steps = set(steps[-self.keep_last:]) if self.keep_last > 0 else set()
+        evaluated_steps = [step for step in steps if self._inventory[step]['eval_reward'] is not None]
+        evaluated_steps.sort(key = lambda step: self._inventory[step]['eval_reward'], reverse = True)
+        keep_steps.update(evaluated_steps[:self.keep_best])
+        keep_steps.update(self._awaiting_eval)
+        if self.keep_every > 0:
+            keep_steps.update(step for step in steps if step % self.keep_every == 0)
+        removed_steps = [step for step in steps if step not in keep_steps]
+        for step in removed_steps:
+            del self._inventory[step]
+        return removed_steps
@@ -1,10 +1,12 @@
 import ray
 from framework.message import Msg, MsgType
+from framework.perf import trace_msg
 class BaseCollector:
     def __init__(self, cfg, data_handler = None) -> None:
         self.cfg = cfg
         self.n_learners = cfg.n_learners
         self.data_handler = data_handler
+    @trace_msg
     def pub_msg(self, msg: Msg):
         ''' publish message
         '''
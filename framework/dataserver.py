@@ -9,73 +9,102 @@ LastEditTime: 2023-05-15 21:42:21
 Discription: 
 '''
 import ray
+import torch.multiprocessing as mp
 from ray.util.queue import Queue, Empty, Full
-from typing import int
 from framework.message import Msg, MsgType
+from framework.perf import trace_msg
+
+EPISODE, SAMPLE_COUNT, UPDATE_STEP, TASK_END = range(4) # indexes of shared counters
+
 class BaseDataServer:
     def __init__(self,cfg) -> None:
-        self.global_episode = 0 # current global episode
-        self.global_sample_count = 0 # global sample count
-        self.global_update_step = 0 # global update step
+        # counters are kept in shared memory, so copies of dataserver sent to other processes read them locally without rpc,
+        # reads are lock-free, increments of one or more counters take one lock
+        ctx = mp.get_context('spawn')
+        self._counters = ctx.RawArray('q', 4) # global episode, global sample count, global update step, task end flag
+        self._counters_lock = ctx.Lock()
         self.max_episode = cfg.max_episode # max episode
+        self.max_sample_count = cfg.max_sample_count # max env steps
+        self.max_update_step = cfg.max_update_step # max update steps
 
+    @trace_msg
     def pub_msg(self, msg: Msg):
         msg_type, msg_data = msg.type, msg.data
         if msg_type == MsgType.DATASERVER_GET_EPISODE:
-            self._get_episode()
+            return self._get_episode()
         elif msg_type == MsgType.DATASERVER_INCREASE_EPISODE:
             episode_delta = 1 if msg_data is None else msg_data
-            self._increase_episode(i = episode_delta)
-        elif msg_type == MsgType.GET_SAMPLE_COUNT:
-            self._get_sample_count(msg_data)
-        elif msg_type == MsgType.GET_UPDATE_STEP:
-            self._get_update_step(msg_data)
-        elif msg_type == MsgType.CHECK_TASK_END:
-            self._check_task_end(msg_data)
-        elif msg_type == MsgType.INCREASE_SAMPLE_COUNT:
-            self._increase_sample_count(msg_data)
+            return self._increase_episode(i = episode_delta)
         elif msg_type == MsgType.DATASERVER_INCREASE_UPDATE_STEP:
             update_step_delta = 1 if msg_data is None else msg_data
-            self._increase_update_step(i = update_step_delta)
+            return self._increase_update_step(i = update_step_delta)
+        elif msg_type == MsgType.DATASERVER_GET_UPDATE_STEP:
+            return self.get_update_step()
         elif msg_type == MsgType.DATASERVER_CHECK_TASK_END:
-            self._check_task_end(msg_data)
+            return self._check_task_end()
+        elif msg_type == MsgType.DATASERVER_INCREASE_COUNTERS:
+            return self.increase_counters(**msg_data)
         else:
             raise NotImplementedError
 
+    @property
+    def global_episode(self):
+        return self._counters[EPISODE]
+
+    @property
+    def global_sample_count(self):
+        return self._counters[SAMPLE_COUNT]
+
+    @property
+    def global_update_step(self):
+        return self._counters[UPDATE_STEP]
+
+    def increase_counters(self, episode: int = 0, sample_count: int = 0, update_step: int = 0):
+        ''' increase several counters at once
+        Returns:
+            counters (tuple): global episode, global sample count and global update step after increasing
+        '''
+        with self._counters_lock:
+            self._counters[EPISODE] += episode
+            self._counters[SAMPLE_COUNT] += sample_count
+            self._counters[UPDATE_STEP] += update_step
+            if 0 <= self.max_episode <= self._counters[EPISODE] or 0 <= self.max_sample_count <= self._counters[SAMPLE_COUNT] \
+                or 0 <= self.max_update_step <= self._counters[UPDATE_STEP]:
+                self._counters[TASK_END] = 1
+            return self._counters[EPISODE], self._counters[SAMPLE_COUNT], self._counters[UPDATE_STEP]
+
     def _increase_episode(self, i: int =1):
-        ''' increase episode
+        ''' increase episode, returns the global episode after increasing
         '''
-        self.global_episode += i
+        return self.increase_counters(episode = i)[EPISODE]
     def _get_episode(self):
         ''' get current episode
         '''
-        return self.global_episode
+        return self._counters[EPISODE]
     
     def _check_task_end(self):
-        ''' check if episode reaches the max episode
+        ''' check if episode, sample count or update step reaches its max
         '''
-        if self.max_episode < 0:
-            return False
-        return self.global_episode >= self.max_episode 
+        return self._counters[TASK_END] == 1
     
     def increase_sample_count(self, i = 1):
         ''' increase sample count
         '''
-        self.global_sample_count += i
+        return self.increase_counters(sample_count = i)[SAMPLE_COUNT]
 
     def get_sample_count(self):
         ''' get sample count
         '''
-        return self.global_sample_count
+        return self._counters[SAMPLE_COUNT]
     
     def _increase_update_step(self, i: int =1):
-        ''' increase update step
+        ''' increase update step, returns the global update step after increasing
         '''
-        self.global_update_step += i
+        return self.increase_counters(update_step = i)[UPDATE_STEP]
     def get_update_step(self):
         ''' get update step
         '''
-        return self.global_update_step
+        return self._counters[UPDATE_STEP]
     
 class SimpleDataServer(BaseDataServer):
     def __init__(self,cfg) -> None:
@@ -1,9 +1,25 @@
-import gymnasium as gym
+import numpy as np
+from functools import partial
 from typing import Tuple
 
 from algos.base.exps import Exp
+from algos.base.buffers import RolloutStorage
 from envs.base.config import BaseEnvConfig
+from envs.base.utils import make_env
+from envs.multiprocessing_env import ShmSubprocVecEnv
 from framework.message import Msg, MsgType
+from framework.perf import perf_timers, trace_msg
+from framework.policy_mgr import SharedParamStore
+from framework.process import ProcessActor
+
+def _create_rollout(cfg, n_envs):
+    ''' preallocated rollout storage when the on-policy rollout buffer is used, transitions are then
+        written in place as numpy arrays instead of Exp objects holding per-step tensors
+    '''
+    if getattr(cfg, 'buffer_type', None) != 'ONPOLICY_ROLLOUT':
+        return None
+    n_steps = int(cfg.n_sample_steps) if cfg.n_sample_steps != float('inf') else 1024 # grows when sampling by episodes
+    return RolloutStorage(n_steps, n_envs)
 
 class BaseInteractor:
     ''' Interactor for gym env to support sample n-steps or n-episodes traning data
@@ -14,13 +30,17 @@ class BaseInteractor:
         self.policy = policy
         self.dataserver = kwargs['dataserver']
         self.logger = kwargs['logger']
-        self.env = gym.make(self.cfg.env_cfg.id)
+        self.env = make_env(self.cfg.env_cfg)
         self.seed = self.cfg.seed + self.id
+        self.param_store = kwargs.get('param_store', None) # handed over once to interactors in other processes
+        self.params_version = -1 # version of params pulled from the shared param store
         self.data = None
+        self.rollout = _create_rollout(cfg, 1)
         self.reset_summary()
         self.reset_ep_params()
         self.init()
 
+    @trace_msg
     def pub_msg(self, msg: Msg):
         msg_type, msg_data = msg.type, msg.data
         if msg_type == MsgType.INTERACTOR_SAMPLE:
@@ -33,7 +53,14 @@ class BaseInteractor:
     def _put_model_params(self, model_params):
         ''' set model parameters
         '''
-        self.policy.put_model_params(model_params)
+        if model_params is None: # pull from own store if any, otherwise the policy is already synced, e.g. shared with learner or by the vec interactor
+            model_params = self.param_store
+        if model_params is None:
+            return
+        if isinstance(model_params, SharedParamStore):
+            self.params_version = model_params.pull(self.policy, self.params_version)
+        else:
+            self.policy.put_model_params(model_params)
 
     def reset_summary(self):
         ''' Create interact summary
@@ -59,21 +86,27 @@ class BaseInteractor:
     
     def _sample_data(self):
         exps = []
+        n_exps = 0
         run_step, run_episode = 0, 0 # local run step, local run episode
         while True:
-            action = self.policy.get_action(self.curr_obs)
-            obs, reward, terminated, truncated, info = self.env.step(action)
-            interact_transition = {'interactor_id': self.id, 'state': self.curr_obs, 'action': action,'reward': reward, 'next_state': obs, 'done': terminated or truncated, 'info': info}
-            policy_transition = policy.get_policy_transition()
-            exps.append(Exp(**interact_transition, **policy_transition))
+            with perf_timers.timer('interactor_get_action'):
+                action = self.policy.get_action(self.curr_obs)
+            with perf_timers.timer('interactor_env_step'):
+                obs, reward, terminated, truncated, info = self.env.step(action)
+            if self.rollout is None:
+                interact_transition = {'interactor_id': self.id, 'state': self.curr_obs, 'action': action,'reward': reward, 'next_state': obs, 'done': terminated or truncated, 'info': info}
+                policy_transition = self.policy.get_policy_transition()
+                exps.append(Exp(**interact_transition, **policy_transition))
+            else:
+                self.rollout.add([0], {'states': [self.curr_obs], 'actions': [action], 'rewards': [reward], 'next_states': [obs], 'dones': [terminated or truncated], **self.policy.get_policy_transition()})
+            n_exps += 1
             run_step += 1
             self.curr_obs, self.curr_info = obs, info
             self.ep_reward += reward
             self.ep_step += 1
             if terminated or truncated:
                 run_episode += 1
-                self.dataserver.pub_msg(Msg(MsgType.DATASERVER_INCREASE_EPISODE))
-                global_episode = self.dataserver.pub_msg(Msg(MsgType.DATASERVER_GET_EPISODE))
+                global_episode = self.dataserver.pub_msg(Msg(MsgType.DATASERVER_INCREASE_EPISODE)) # returns episode after increasing
                 if global_episode % self.cfg.interact_summary_fre == 0 and global_episode <= self.cfg.max_episode: 
                     self.logger.info(f"Interactor {self.id} finished episode {global_episode} with reward {self.ep_reward:.3f} in {self.ep_step} steps")
                     interact_summary = {'reward':self.ep_reward,'step':self.ep_step}
@@ -86,34 +119,69 @@ class BaseInteractor:
             if run_step >= self.cfg.n_sample_steps:
                 run_step = 0
                 break
+        self.dataserver.pub_msg(Msg(MsgType.DATASERVER_INCREASE_COUNTERS, data = {'sample_count': n_exps}))
+        perf_timers.count('env_steps', n_exps)
+        if self.rollout is not None:
+            exps = self.rollout.get(0)
+            exps['interactor_id'] = self.id
+            self.rollout.reset()
         self.data = {"exps": exps, "interact_summary": self.get_summary()}
     
     def _get_sample_data(self):
         output = self.data
         self.data = None # reset data
+        self.reset_summary()
         return output
     
     def close_env(self):
         self.env.close()
 
 class BaseVecInteractor:
-    def __init__(self, cfg) -> None:
+    def __init__(self, cfg, policy = None, *args, **kwargs) -> None:
         self.cfg = cfg
         self.n_envs = cfg.n_workers
+        self.policy = policy
+        self.params_version = -1 # version of params pulled from the shared param store
         self.reset_interact_outputs()
+
+    @trace_msg
+    def pub_msg(self, msg: Msg):
+        msg_type, msg_data = msg.type, msg.data
+        if msg_type == MsgType.INTERACTOR_SAMPLE:
+            model_params = msg_data
+            return self._sample_data(model_params)
+        else:
+            raise NotImplementedError
+
+    def _put_model_params(self, model_params):
+        ''' set model parameters, params from a shared param store are copied only when its version changes
+        '''
+        if model_params is None: # policy is shared with learner
+            return
+        if isinstance(model_params, SharedParamStore):
+            self.params_version = model_params.pull(self.policy, self.params_version)
+        else:
+            self.policy.put_model_params(model_params)
+
     def reset_interact_outputs(self):
         self.interact_outputs = []
 
+    def _sample_data(self, model_params):
+        raise NotImplementedError
+
 class DummyVecInteractor(BaseVecInteractor):
-    def __init__(self, cfg) -> None:
-        super().__init__(cfg)
-        self.interactors = [BaseInteractor(cfg, id = i) for i in range(self.n_envs)]
+    ''' Run interactors one after another, each interactor gets actions state by state
+    '''
+    def __init__(self, cfg, policy = None, *args, **kwargs) -> None:
+        super().__init__(cfg, policy, *args, **kwargs)
+        self.interactors = [BaseInteractor(cfg, i, policy, *args, **kwargs) for i in range(self.n_envs)]
 
-    def run(self, policy, *args, **kwargs):
+    def _sample_data(self, model_params):
+        self._put_model_params(model_params) # interactors share one policy, so sync it once here
         for i in range(self.n_envs):
-            self.interactors[i].run(policy, *args, **kwargs)
+            self.interactors[i].pub_msg(Msg(type = MsgType.INTERACTOR_SAMPLE, data = None))
         for i in range(self.n_envs):
-            self.interact_outputs.append(self.interactors[i].get_data())
+            self.interact_outputs.append(self.interactors[i].pub_msg(Msg(type = MsgType.INTERACTOR_GET_SAMPLE_DATA)))
         outputs = self.interact_outputs
         self.reset_interact_outputs()
         return outputs
@@ -122,6 +190,183 @@ class DummyVecInteractor(BaseVecInteractor):
         for i in range(self.n_envs):
             self.interactors[i].close_env()
 
+class BatchVecInteractor(BaseVecInteractor):
+    ''' Step all envs in lockstep, and get actions of all envs with one batched policy call per step
+    '''
+    def __init__(self, cfg, policy = None, *args, **kwargs) -> None:
+        super().__init__(cfg, policy, *args, **kwargs)
+        self.dataserver = kwargs['dataserver']
+        self.logger = kwargs['logger']
+        self.seeds = [self.cfg.seed + i for i in range(self.n_envs)]
+        self.sample_count = 0 # local sample count of all envs
+        self.curr_obs, self.curr_infos = [None] * self.n_envs, [None] * self.n_envs
+        self.reset_summaries()
+        self.ep_rewards, self.ep_steps = [0] * self.n_envs, [0] * self.n_envs
+        self.rollout = _create_rollout(cfg, self.n_envs)
+        self._create_envs()
+        self.init()
+
+    def _create_envs(self):
+        self.envs = [make_env(self.cfg.env_cfg) for _ in range(self.n_envs)]
+
+    def init(self):
+        for i in range(self.n_envs):
+            self.curr_obs[i], self.curr_infos[i] = self.envs[i].reset(seed = self.seeds[i])
+        return self.curr_obs, self.curr_infos
+
+    def _step_envs(self, env_ids, actions):
+        ''' step envs in env_ids, finished envs are reset automatically
+        Returns:
+            results (list): (next_obs, reward, terminated, truncated, info, reset_obs) of each env,
+                reset_obs is the obs to continue from, equals to next_obs if not done
+        '''
+        results = []
+        for i, action in zip(env_ids, actions):
+            next_obs, reward, terminated, truncated, info = self.envs[i].step(action)
+            reset_obs = next_obs
+            if terminated or truncated:
+                reset_obs, _ = self.envs[i].reset(seed = self.seeds[i])
+            results.append((next_obs, reward, terminated, truncated, info, reset_obs))
+        return results
+
+    def reset_summaries(self):
+        ''' Create interact summary for each env
+        '''
+        self.summaries = [list() for _ in range(self.n_envs)]
+
+    def reset_ep_params(self, i):
+        ''' Reset episode params of env i
+        '''
+        self.ep_rewards[i], self.ep_steps[i] = 0, 0
+
+    def _end_episodes(self, env_ids):
+        ''' Record summaries of envs whose episodes end at the same step, with one batched episode increment
+        '''
+        last_episode = self.dataserver.pub_msg(Msg(MsgType.DATASERVER_INCREASE_EPISODE, data = len(env_ids)))
+        for global_episode, i in zip(range(last_episode - len(env_ids) + 1, last_episode + 1), env_ids):
+            if global_episode % self.cfg.interact_summary_fre == 0 and global_episode <= self.cfg.max_episode:
+                self.logger.info(f"Interactor {i} finished episode {global_episode} with reward {self.ep_rewards[i]:.3f} in {self.ep_steps[i]} steps")
+                interact_summary = {'reward': self.ep_rewards[i], 'step': self.ep_steps[i]}
+                self.summaries[i].append((global_episode, interact_summary))
+            self.reset_ep_params(i)
+
+    def _sample_data(self, model_params):
+        ''' sample n-steps or n-episodes for every env, envs that reach their quota stop stepping
+        '''
+        self._put_model_params(model_params)
+        exps = [[] for _ in range(self.n_envs)]
+        run_steps, run_episodes = np.zeros(self.n_envs, dtype = int), np.zeros(self.n_envs, dtype = int)
+        active_ids = list(range(self.n_envs))
+        while len(active_ids) > 0:
+            states = np.stack([self.curr_obs[i] for i in active_ids])
+            with perf_timers.timer('interactor_get_action'):
+                actions, policy_transitions = self.policy.get_actions(states, sample_count = self.sample_count, columnar = self.rollout is not None)
+            self.sample_count += len(active_ids)
+            with perf_timers.timer('interactor_env_step'):
+                results = self._step_envs(active_ids, actions)
+            if self.rollout is not None: # write the step of all active envs at once
+                self.rollout.add(active_ids, {'states': states, 'actions': np.asarray(actions), 'rewards': [result[1] for result in results], 
+                                              'next_states': np.stack([result[0] for result in results]), 'dones': [result[2] or result[3] for result in results], **policy_transitions})
+                policy_transitions = [{}] * len(active_ids)
+            finished_ids, done_ids = [], []
+            for i, action, policy_transition, result in zip(active_ids, actions, policy_transitions, results):
+                obs, reward, terminated, truncated, info, reset_obs = result
+                if self.rollout is None:
+                    interact_transition = {'interactor_id': i, 'state': self.curr_obs[i], 'action': action,'reward': reward, 'next_state': obs, 'done': terminated or truncated, 'info': info}
+                    exps[i].append(Exp(**interact_transition, **policy_transition))
+                run_steps[i] += 1
+                self.curr_obs[i], self.curr_infos[i] = reset_obs, info
+                self.ep_rewards[i] += reward
+                self.ep_steps[i] += 1
+                if terminated or truncated:
+                    run_episodes[i] += 1
+                    done_ids.append(i)
+                    if run_episodes[i] >= self.cfg.n_sample_episodes:
+                        finished_ids.append(i)
+                        continue
+                if run_steps[i] >= self.cfg.n_sample_steps:
+                    finished_ids.append(i)
+            if len(done_ids) > 0:
+                self._end_episodes(done_ids)
+            active_ids = [i for i in active_ids if i not in finished_ids]
+        self.dataserver.pub_msg(Msg(MsgType.DATASERVER_INCREASE_COUNTERS, data = {'sample_count': int(run_steps.sum())}))
+        perf_timers.count('env_steps', int(run_steps.sum()))
+        if self.rollout is not None:
+            exps = [dict(self.rollout.get(i), interactor_id = i) for i in range(self.n_envs)]
+            self.rollout.reset()
+        outputs = [{"exps": exps[i], "interact_summary": self.summaries[i]} for i in range(self.n_envs)]
+        self.reset_summaries()
+        return outputs
+
+    def close_envs(self):
+        for env in self.envs:
+            env.close()
+
+class SubprocVecInteractor(BatchVecInteractor):
+    ''' Same as BatchVecInteractor, but envs run in worker processes and write step results into shared memory
+    '''
+    def __init__(self, cfg, policy = None, *args, **kwargs) -> None:
+        super().__init__(cfg, policy, *args, **kwargs)
+
+    def _create_envs(self):
+        env_fns = [partial(make_env, self.cfg.env_cfg) for _ in range(self.n_envs)]
+        self.envs = ShmSubprocVecEnv(env_fns, spaces = (self.cfg.obs_space, self.cfg.action_space))
+
+    def init(self):
+        obs, infos = self.envs.reset(seeds = self.seeds)
+        self.curr_obs, self.curr_infos = list(obs), infos
+        return self.curr_obs, self.curr_infos
+
+    def _step_envs(self, env_ids, actions):
+        self.envs.step_async(actions, env_idxs = env_ids)
+        obs, rewards, terminated, truncated, infos = self.envs.step_wait()
+        results = []
+        for j in range(len(env_ids)):
+            next_obs = infos[j].pop('final_observation') if terminated[j] or truncated[j] else obs[j]
+            results.append((next_obs, rewards[j], terminated[j], truncated[j], infos[j], obs[j]))
+        return results
+
+    def close_envs(self):
+        self.envs.close()
+
+class NumpyVecInteractor(SubprocVecInteractor):
+    ''' Same as BatchVecInteractor, but all envs are one batched numpy env registered in envs/vec_register.py
+    '''
+    def _create_envs(self):
+        from envs.vec_register import make_vec_env
+        self.envs = make_vec_env(self.cfg.env_cfg.id, self.n_envs)
+
+class ProcessVecInteractor(BaseVecInteractor):
+    ''' Run each interactor in its own process, interactors sample in parallel 
+        and pull params from the shared param store when its version changes,
+        the store is handed over once at start instead of being pickled with every request
+    '''
+    def __init__(self, cfg, policy = None, *args, **kwargs) -> None:
+        super().__init__(cfg, policy, *args, **kwargs)
+        dataserver = kwargs['dataserver'] # its counters are in shared memory, so each process gets a copy
+        self.param_store = kwargs['param_store']
+        self.actors = [ProcessActor(BaseInteractor, cfg, i, policy, dataserver = dataserver, logger = kwargs['logger'], param_store = self.param_store) for i in range(self.n_envs)]
+        self.interactors = [actor.connect() for actor in self.actors]
+        for actor in self.actors:
+            actor.start()
+
+    def _sample_data(self, model_params):
+        if model_params is self.param_store: # interactors already hold it
+            model_params = None
+        for interactor in self.interactors: # sample in parallel
+            interactor.send(Msg(type = MsgType.INTERACTOR_SAMPLE, data = model_params))
+        for interactor in self.interactors:
+            interactor.recv()
+        for interactor in self.interactors:
+            self.interact_outputs.append(interactor.pub_msg(Msg(type = MsgType.INTERACTOR_GET_SAMPLE_DATA)))
+        outputs = self.interact_outputs
+        self.reset_interact_outputs()
+        return outputs
+
+    def close_envs(self):
+        for actor in self.actors:
+            actor.close()
+
 class RayVecInteractor(BaseVecInteractor):
     def __init__(self, cfg) -> None:
         super().__init__(cfg)
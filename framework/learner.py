@@ -1,7 +1,6 @@
-import ray
-from ray.util.queue import Queue, Empty, Full
 from typing import Tuple
 from framework.message import Msg, MsgType
+from framework.perf import perf_timers, trace_msg
 
 class BaseLearner:
     def __init__(self, cfg, id = 0, policy = None, *args, **kwargs) -> None:
@@ -10,14 +9,17 @@ class BaseLearner:
         self.policy = policy
         self.collector = kwargs['collector']
         self.dataserver = kwargs['dataserver']
-        self.updated_model_params_queue = Queue(maxsize = 128)
+        self.param_store = kwargs.get('param_store', None) # shared param store of policy manager, written directly by a learner in its own process
+        self.updated_update_step = None # update step of the latest publish not fetched by trainer yet, only the latest one is kept
         self.global_update_step = 0
 
+    @trace_msg
     def pub_msg(self, msg: Msg):
         msg_type, msg_data = msg.type, msg.data
         if msg_type == MsgType.LEARNER_UPDATE_POLICY:
             model_params = msg_data
-            self._put_model_params(model_params)
+            if model_params is not None: # None means the learner owns the latest params
+                self._put_model_params(model_params)
             self._update_policy()
         elif msg_type == MsgType.LEARNER_GET_UPDATED_MODEL_PARAMS_QUEUE:
             return self._get_updated_model_params_queue()
@@ -28,13 +30,20 @@ class BaseLearner:
         return self.id
     
     def _put_updated_model_params_queue(self):
-        self.updated_model_params_queue.put((self.global_update_step, self._get_model_params()))
+        self.updated_update_step = self.global_update_step
 
     def _get_updated_model_params_queue(self):
-        res = Queue(maxsize = 128)
-        while not self.updated_model_params_queue.empty():
-            res.put(self.updated_model_params_queue.get())
-        return res
+        ''' (update_step, model_params) of the latest publish since last call as a list of at most one element,
+            with a param store the params are copied into it here and None is returned in their place,
+            so no params cross the pipe when the learner runs in its own process
+        '''
+        if self.updated_update_step is None:
+            return []
+        update_step, self.updated_update_step = self.updated_update_step, None
+        if self.param_store is not None:
+            self.param_store.publish(self._get_model_params(), update_step)
+            return [(update_step, None)]
+        return [(update_step, self._get_model_params())]
     
     def _get_model_params(self):
         ''' get model parameters
@@ -54,14 +63,18 @@ class SimpleLearner(BaseLearner):
         super().__init__(cfg, id, policy, *args, **kwargs)
 
     def _update_policy(self):
-        n_steps_per_learn = self.collector.get_buffer_length() if self.cfg.onpolicy_flag else self.cfg.n_steps_per_learn
+        drain_buffer = self.cfg.onpolicy_flag or self.cfg.n_steps_per_learn < 0 # -1 learns every buffered transition, e.g. for tabular methods
+        n_steps_per_learn = self.collector.pub_msg(Msg(type = MsgType.COLLECTOR_GET_BUFFER_LENGTH)) if drain_buffer else self.cfg.n_steps_per_learn
         for _ in range(n_steps_per_learn):
-            training_data = self.collector.get_training_data() # get training data
+            with perf_timers.timer('learner_get_training_data'):
+                training_data = self.collector.pub_msg(Msg(type = MsgType.COLLECTOR_GET_TRAINING_DATA)) # get training data
             if training_data is None: continue
-            self.dataserver.increase_update_step()
-            self.global_update_step = self.dataserver.get_update_step()
-            self.policy.learn(**training_data,update_step = self.global_update_step)
-            self._put_updated_model_params_queue()
+            self.global_update_step = self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_INCREASE_UPDATE_STEP)) # returns update step after increasing
+            with perf_timers.timer('policy_learn'):
+                self.policy.learn(**training_data,update_step = self.global_update_step)
+            perf_timers.count('update_steps')
+            if self.global_update_step % self.cfg.policy_publish_fre == 0: # publish params at a given cadence
+                self._put_updated_model_params_queue()
 
         # if training_data is None: return None
         # self.dataserver.increase_update_step()
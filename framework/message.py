@@ -1,4 +1,5 @@
 from enum import Enum
+from dataclasses import dataclass
 from typing import Optional, Any
 
 class MsgType(Enum):
@@ -8,6 +9,7 @@ class MsgType(Enum):
     DATASERVER_INCREASE_UPDATE_STEP = 2
     DATASERVER_GET_UPDATE_STEP = 3
     DATASERVER_CHECK_TASK_END = 4
+    DATASERVER_INCREASE_COUNTERS = 5
 
     # interactor
     INTERACTOR_SAMPLE = 10
@@ -24,10 +26,14 @@ class MsgType(Enum):
 
     # recorder
     STATS_RECORDER_PUT_INTERACT_SUMMARY = 40
+    STATS_RECORDER_PUT_PERF_SUMMARY = 41
+    STATS_RECORDER_PUT_POLICY_SUMMARY = 42
     # policy_mgr
     POLICY_MGR_PUT_MODEL_PARAMS = 70
     POLICY_MGR_GET_MODEL_PARAMS = 71
+    POLICY_MGR_GET_LATEST_MODEL_PARAMS = 72
 
+@dataclass
 class Msg(object):
     type: MsgType
     data: Optional[Any] = None
\ No newline at end of file
@@ -0,0 +1,194 @@
+import os
+import csv
+import threading
+import numpy as np
+from collections import deque
+from pathlib import Path
+
+STAT_KEYS = ('mean', 'min', 'max', 'count')
+
+class BaseMetricsSink:
+    ''' Destination of aggregated metrics, written from the flush thread
+    '''
+    def write(self, writter_type, tag, steps, stats):
+        ''' write aggregated records of one tag
+        Args:
+            steps (np.ndarray): last step of each window
+            stats (dict): mean, min, max and count of each window
+        '''
+        raise NotImplementedError
+    def flush(self):
+        pass
+    def close(self):
+        self.flush()
+
+class TensorBoardSink(BaseMetricsSink):
+    ''' write window means as scalars, one event file for each writter type
+    '''
+    def __init__(self, log_dir) -> None:
+        from torch.utils.tensorboard import SummaryWriter
+        self.log_dir = log_dir
+        self.writter_cls = SummaryWriter
+        self.writters = {}
+    def write(self, writter_type, tag, steps, stats):
+        if writter_type not in self.writters:
+            self.writters[writter_type] = self.writter_cls(log_dir = f"{self.log_dir}/{writter_type}")
+        for step, value in zip(steps, stats['mean']):
+            self.writters[writter_type].add_scalar(tag = tag, scalar_value = value, global_step = step)
+    def flush(self):
+        for writter in self.writters.values():
+            writter.flush()
+    def close(self):
+        for writter in self.writters.values():
+            writter.close()
+
+class CSVSink(BaseMetricsSink):
+    ''' append records as rows of metrics.csv
+    '''
+    def __init__(self, res_dir) -> None:
+        self.fpath = f"{res_dir}/metrics.csv"
+        self._f = open(self.fpath, 'w', newline = '')
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(('type', 'tag', 'step') + STAT_KEYS)
+    def write(self, writter_type, tag, steps, stats):
+        self._writer.writerows(zip([writter_type] * len(steps), [tag] * len(steps), steps, *[stats[k] for k in STAT_KEYS]))
+    def flush(self):
+        self._f.flush()
+    def close(self):
+        self._f.close()
+
+NPZ_DIRNAME = 'metrics' # chunks of NpzSink under res_dir
+
+class NpzSink(BaseMetricsSink):
+    ''' dump the records written since the last flush as one chunk file metrics/{n}.npz, so a flush only costs
+        the new records, load_metrics concatenates the chunks
+    '''
+    def __init__(self, res_dir) -> None:
+        self.chunk_dir = Path(res_dir) / NPZ_DIRNAME
+        self.chunk_dir.mkdir(parents = True, exist_ok = True)
+        self.n_chunks = 0
+        self.columns = {} # (writter_type, tag) -> list of record arrays since last flush
+    def write(self, writter_type, tag, steps, stats):
+        self.columns.setdefault((writter_type, tag), []).append(np.stack([steps] + [stats[k] for k in STAT_KEYS], axis = 1))
+    def flush(self):
+        if len(self.columns) == 0:
+            return
+        arrays = {f"{writter_type}.{tag}": np.concatenate(records, axis = 0) for (writter_type, tag), records in self.columns.items()}
+        self.columns = {}
+        fpath = self.chunk_dir / f"{self.n_chunks:06d}.npz"
+        tmp_fpath = self.chunk_dir / f"{self.n_chunks:06d}.tmp.npz"
+        np.savez(tmp_fpath, **arrays)
+        os.replace(tmp_fpath, fpath) # atomic, so load_metrics never reads a partial chunk
+        self.n_chunks += 1
+
+def load_metrics(fpath):
+    ''' load the metrics chunks of NpzSink back as arrays, fpath is the res_dir, its metrics dir or a single chunk
+    Returns:
+        metrics (dict): {writter_type: {tag: {'step', 'mean', 'min', 'max', 'count'}}}
+    '''
+    fpath = Path(fpath)
+    if fpath.is_dir() and (fpath / NPZ_DIRNAME).is_dir():
+        fpath = fpath / NPZ_DIRNAME
+    chunk_fpaths = sorted(p for p in fpath.glob('*.npz') if not p.name.endswith('.tmp.npz')) if fpath.is_dir() else [fpath]
+    columns = {} # key -> list of record arrays in chunk order
+    for chunk_fpath in chunk_fpaths:
+        with np.load(chunk_fpath) as data:
+            for key in data.files:
+                columns.setdefault(key, []).append(data[key])
+    metrics = {}
+    for key, records in columns.items():
+        writter_type, tag = key.split('.', 1)
+        records = np.concatenate(records, axis = 0)
+        metrics.setdefault(writter_type, {})[tag] = {k: records[:, i] for i, k in enumerate(('step',) + STAT_KEYS)}
+    return metrics
+
+def create_sinks(cfg):
+    ''' create metrics sinks by cfg.metrics_sinks
+    '''
+    sinks = []
+    for sink_type in cfg.metrics_sinks:
+        if sink_type == 'tensorboard':
+            sinks.append(TensorBoardSink(cfg.tb_dir))
+        elif sink_type == 'csv':
+            sinks.append(CSVSink(cfg.res_dir))
+        elif sink_type == 'npz':
+            sinks.append(NpzSink(cfg.res_dir))
+        else:
+            raise NotImplementedError(f"metrics sink {sink_type} is not supported")
+    return sinks
+
+class MetricsBuffer:
+    ''' Buffer scalars in memory and flush them periodically on a background thread,
+        scalars of each tag are aggregated over windows of `window` steps before being written to sinks
+    '''
+    def __init__(self, sinks, window = 1, flush_interval = 5.0) -> None:
+        self.sinks = sinks
+        self.window = window
+        self.flush_interval = flush_interval # seconds
+        self._scalars = deque() # (writter_type, tag, value, step), appended by the hot path
+        self._pending = {} # (writter_type, tag) -> (steps, values) of the latest, maybe incomplete window
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread_flush = threading.Thread(target = self._run, daemon = True)
+        self._thread_flush.start()
+
+    def add_scalar(self, writter_type, tag, value, step):
+        ''' O(1), only appends to the in-memory buffer
+        '''
+        self._scalars.append((writter_type, tag, value, step))
+
+    def flush(self, final = False):
+        ''' aggregate buffered scalars and write complete windows to sinks,
+            the latest window of each tag is held back until it completes unless final is True
+        '''
+        with self._flush_lock:
+            n_scalars = len(self._scalars)
+            grouped = {}
+            for _ in range(n_scalars):
+                writter_type, tag, value, step = self._scalars.popleft()
+                steps, values = grouped.setdefault((writter_type, tag), ([], []))
+                steps.append(step)
+                values.append(value)
+            for key in set(grouped) | set(self._pending):
+                steps, values = grouped.get(key, ([], []))
+                pending_steps, pending_values = self._pending.pop(key, ([], []))
+                steps, values = np.asarray(pending_steps + steps, dtype = np.int64), np.asarray(pending_values + values, dtype = np.float64)
+                if len(steps) == 0:
+                    continue
+                windows = steps // self.window
+                if not final and self.window > 1:
+                    in_latest = windows == windows.max()
+                    self._pending[key] = (steps[in_latest].tolist(), values[in_latest].tolist())
+                    steps, values, windows = steps[~in_latest], values[~in_latest], windows[~in_latest]
+                    if len(steps) == 0:
+                        continue
+                window_steps, stats = self._aggregate(steps, values, windows)
+                for sink in self.sinks:
+                    sink.write(key[0], key[1], window_steps, stats)
+            for sink in self.sinks:
+                sink.flush()
+
+    @staticmethod
+    def _aggregate(steps, values, windows):
+        uniq_windows, inv = np.unique(windows, return_inverse = True)
+        counts = np.bincount(inv)
+        means = np.bincount(inv, weights = values) / counts
+        mins, maxs = np.full(len(uniq_windows), np.inf), np.full(len(uniq_windows), -np.inf)
+        np.minimum.at(mins, inv, values)
+        np.maximum.at(maxs, inv, values)
+        window_steps = np.zeros(len(uniq_windows), dtype = np.int64)
+        np.maximum.at(window_steps, inv, steps)
+        return window_steps, {'mean': means, 'min': mins, 'max': maxs, 'count': counts}
+
+    def close(self):
+        ''' flush everything left and close sinks
+        '''
+        self._stop_event.set()
+        self._thread_flush.join()
+        self.flush(final = True)
+        for sink in self.sinks:
+            sink.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
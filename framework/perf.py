@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+import cProfile
+from collections import deque
+from functools import wraps
+
+class _NullTimer:
+    ''' returned when timers are disabled, does nothing
+    '''
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('timers', 'name', 's_t')
+    def __init__(self, timers, name) -> None:
+        self.timers = timers
+        self.name = name
+    def __enter__(self):
+        self.s_t = time.perf_counter()
+        return self
+    def __exit__(self, *args):
+        e_t = time.perf_counter()
+        if self.timers.enabled:
+            self.timers.add_time(self.name, e_t - self.s_t)
+        if tracer.enabled: # stage boundaries also go to the timeline
+            tracer.add_span(self.name, 'stage', self.s_t, e_t)
+        return False
+
+class _Span:
+    __slots__ = ('name', 'cat', 's_t')
+    def __init__(self, name, cat) -> None:
+        self.name = name
+        self.cat = cat
+    def __enter__(self):
+        self.s_t = time.perf_counter()
+        return self
+    def __exit__(self, *args):
+        tracer.add_span(self.name, self.cat, self.s_t, time.perf_counter())
+        return False
+
+class Tracer:
+    ''' Timeline of begin/end events kept in a ring buffer, exported as Chrome Trace Event json (chrome://tracing or Perfetto).
+        Events carry process and thread ids, timestamps are wall-clock so that events of different processes line up.
+    '''
+    def __init__(self) -> None:
+        self.enabled = False
+        self.buffer_size = 0
+        self.process_name = 'main'
+        self._events = deque()
+        self._remote_events = [] # events collected from other processes, e.g. process actors
+        self._clock_offset = time.time() - time.perf_counter() # perf_counter -> wall-clock seconds
+
+    def enable(self, buffer_size = 100000, process_name = None):
+        self.enabled = True
+        self.buffer_size = buffer_size
+        self._events = deque(self._events, maxlen = buffer_size) # oldest events are dropped when full
+        if process_name is not None:
+            self.process_name = process_name
+
+    def span(self, name, cat = 'stage'):
+        ''' context manager emitting a complete event, e.g. with tracer.span('wait_params'): ...
+        '''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Span(name, cat)
+
+    def add_span(self, name, cat, s_t, e_t):
+        ''' add an event from perf_counter begin and end times, deque.append is thread safe
+        '''
+        self._events.append((name, cat, s_t, e_t, threading.get_ident()))
+
+    def get_events(self):
+        ''' events of this process in Chrome Trace Event format
+        '''
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.process_name}}]
+        for name, cat, s_t, e_t, tid in list(self._events):
+            events.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': (s_t + self._clock_offset) * 1e6, 'dur': (e_t - s_t) * 1e6}) # microseconds
+        return events
+
+    def add_remote_events(self, events):
+        self._remote_events.extend(events)
+
+    def dump(self, fpath):
+        ''' write events of this process and collected remote events to a json file, can be called at any time
+        '''
+        trace = {'traceEvents': self.get_events() + self._remote_events, 'displayTimeUnit': 'ms'}
+        tmp_fpath = f"{fpath}.tmp"
+        with open(tmp_fpath, 'w') as f:
+            json.dump(trace, f)
+        os.replace(tmp_fpath, fpath)
+
+tracer = Tracer() # one per process, enabled by main and process actors
+
+def trace_msg(pub_msg):
+    ''' decorator of pub_msg handlers, emits one event per message named <component>.<message type>
+    '''
+    @wraps(pub_msg)
+    def wrapper(self, msg, *args, **kwargs):
+        if not tracer.enabled:
+            return pub_msg(self, msg, *args, **kwargs)
+        s_t = time.perf_counter()
+        try:
+            return pub_msg(self, msg, *args, **kwargs)
+        finally:
+            msg_name = msg.type.name if msg is not None else 'CLOSE'
+            tracer.add_span(f"{type(self).__name__}.{msg_name}", 'msg', s_t, time.perf_counter())
+    return wrapper
+
+class PerfTimers:
+    ''' Named timers and counters of training stages, aggregated until popped as a window summary.
+        Timing is skipped entirely when disabled, so they can stay in hot paths.
+    '''
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock() # stages may be timed from interactor and learner threads
+        self._reset()
+
+    def _reset(self):
+        self._times = {} # name -> (total seconds, number of calls)
+        self._counts = {} # name -> count
+
+    def enable(self, enabled = True):
+        self.enabled = enabled
+
+    def timer(self, name):
+        ''' context manager timing a stage, e.g. with perf_timers.timer('env_step'): ...
+        '''
+        if not self.enabled and not tracer.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            total, n_calls = self._times.get(name, (0.0, 0))
+            self._times[name] = (total + seconds, n_calls + 1)
+
+    def count(self, name, n = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def pop_summary(self):
+        ''' get perf scalars of the current window and start a new window, the recorder files them under the perf writter type
+        '''
+        with self._lock:
+            times, counts = self._times, self._counts
+            self._reset()
+        summary = {}
+        for name, (total, n_calls) in times.items():
+            summary[f"{name}_ms"] = total / n_calls * 1000 # mean time per call
+            summary[f"{name}_total_s"] = total
+        for name, count in counts.items():
+            summary[name] = count
+        return summary
+
+perf_timers = PerfTimers() # one per process, enabled by trainer
+
+class IterProfiler:
+    ''' Capture cProfile or torch.profiler traces of the first n iterations into out_dir
+    '''
+    def __init__(self, profiler_type, n_iters, out_dir) -> None:
+        self.profiler_type = profiler_type
+        self.n_iters = n_iters
+        self.out_dir = out_dir
+        self.i_iter = 0
+        self.profiler = None
+
+    def start(self):
+        if self.profiler_type == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profiler_type == 'torch':
+            import torch
+            self.profiler = torch.profiler.profile(activities = [torch.profiler.ProfilerActivity.CPU])
+            self.profiler.__enter__()
+        elif self.profiler_type is not None:
+            raise NotImplementedError(f"profiler {self.profiler_type} is not supported")
+
+    def step(self):
+        ''' call once per iteration, stops profiling and saves the trace after n iterations
+        '''
+        if self.profiler is None:
+            return
+        self.i_iter += 1
+        if self.i_iter >= self.n_iters:
+            self.stop()
+
+    def stop(self):
+        if self.profiler is None:
+            return
+        if self.profiler_type == 'cprofile':
+            self.profiler.disable()
+            self.profiler.dump_stats(f"{self.out_dir}/cprofile.prof")
+        else:
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(f"{self.out_dir}/torch_trace.json")
+        self.profiler = None
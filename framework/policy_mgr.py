@@ -1,17 +1,78 @@
 from framework.message import Msg, MsgType
+from framework.perf import trace_msg
 import time
-import threading
-from queue import Queue
+import torch
+from collections import OrderedDict
+
+class SharedParamStore:
+    ''' Latest model params kept in flat shared memory tensors (one per dtype) with a version number.
+        The version counter works as a seqlock for a single writer: it is odd while params are being written,
+        so readers in other threads or processes retry until they copy a stable version.
+    '''
+    def __init__(self, model_params) -> None:
+        numels = OrderedDict() # total numel of each dtype
+        specs = [] # (key, dtype, offset, shape) of each param
+        for key, value in model_params.items():
+            offset = numels.get(value.dtype, 0)
+            specs.append((key, value.dtype, offset, value.shape))
+            numels[value.dtype] = offset + value.numel()
+        self._flat_params = {dtype: torch.zeros(numel, dtype = dtype).share_memory_() for dtype, numel in numels.items()}
+        self._views = OrderedDict() # zero-copy views with the same keys and shapes as model_params
+        for key, dtype, offset, shape in specs:
+            self._views[key] = self._flat_params[dtype][offset: offset + shape.numel()].view(shape)
+        self._meta = torch.zeros(2, dtype = torch.int64).share_memory_() # [seq, update step]
+        self.publish(model_params, 0)
+
+    @property
+    def version(self):
+        return int(self._meta[0]) // 2
+
+    @property
+    def step(self):
+        return int(self._meta[1])
+
+    def publish(self, model_params, update_step):
+        ''' copy model params into the store and bump the version, only one writer is allowed
+        '''
+        self._meta[0] += 1 # odd while writing
+        for key, value in model_params.items():
+            self._views[key].copy_(value.detach())
+        self._meta[1] = update_step
+        self._meta[0] += 1
+
+    def pull(self, policy, last_version = -1):
+        ''' copy params into policy only if a newer version than last_version is published
+        Returns:
+            version (int): version of params the policy holds
+        '''
+        while True:
+            seq = int(self._meta[0])
+            if seq // 2 == last_version:
+                return last_version
+            if seq % 2 == 1: # writer is busy
+                time.sleep(0)
+                continue
+            policy.put_model_params(self._views)
+            if int(self._meta[0]) == seq: # not overwritten while copying
+                return seq // 2
+
+    def get_model_params(self):
+        ''' zero-copy views of the latest params for in-process consumers, they change in place when a new version is published
+        '''
+        return self._views
 
 class PolicyMgr:
     def __init__(self, cfg, policy, **kwargs) -> None:
         self.cfg = cfg
         self.dataserver = kwargs['dataserver']
-        self._latest_model_params_dict = {0: policy}
-        self._save_policy_queue = Queue(maxsize = 128)
-        self._thread_save_policy = threading.Thread(target=self._save_policy)
-        self._thread_save_policy.setDaemon(True)
+        self.policy = policy # learner policy, only used to snapshot optimizer state for checkpoints
+        self.checkpointer = kwargs.get('checkpointer', None)
+        self.param_store = kwargs.get('param_store', None) # only keep the latest model params
+        if self.param_store is None:
+            self.param_store = SharedParamStore(policy.get_model_params())
+        self._last_save_step = 0
 
+    @trace_msg
     def pub_msg(self, msg: Msg):
         ''' publish message
         '''
@@ -20,40 +81,31 @@ class PolicyMgr:
             self._put_model_params(msg_data)
         elif msg_type == MsgType.POLICY_MGR_GET_MODEL_PARAMS:
             return self._get_model_params()
+        elif msg_type == MsgType.POLICY_MGR_GET_LATEST_MODEL_PARAMS:
+            return self._get_latest_model_params()
         else:
             raise NotImplementedError
         
-    def start(self):
-        ''' start
-        '''
-        self._thread_save_policy.start()
-
     def _put_model_params(self, msg_data):
-        ''' put model params
+        ''' put model params, None means the learner has published them to the param store itself
         '''
         update_step, model_params = msg_data
-        if update_step >= self._latest_model_params_dict.keys()[-1]:
-            self._latest_model_params_dict[update_step] = model_params
-        while not self._save_policy_queue.full(): # if queue is full, wait for 0.01s
-            self._save_policy_queue.put((update_step, model_params))
-            time.sleep(0.01)
-            break
+        if model_params is None:
+            model_params = self.param_store.get_model_params()
+        elif update_step >= self.param_store.step:
+            self.param_store.publish(model_params, update_step)
+        if self.checkpointer is not None and update_step // self.cfg.model_save_fre > self._last_save_step // self.cfg.model_save_fre:
+            self._last_save_step = update_step
+            optimizer_params = self.policy.get_optimizer_params() if self.cfg.ckpt_save_optimizer else None
+            self.checkpointer.save(update_step, model_params, optimizer_params = optimizer_params) # written on checkpointer thread
 
     def _get_model_params(self):
-        ''' get policy
+        ''' get shared param store, consumers pull params from it when its version changes
         '''
-        self._latest_model_params_dict.values()[-1]
+        return self.param_store
 
-    def _save_policy(self):
-        ''' async run
+    def _get_latest_model_params(self):
+        ''' get update step of the latest params and the shared param store
         '''
-        while True:
-            while not self._save_policy_queue.empty():
-                policy_step, policy = self._save_policy_queue.get()
-                policy.save_model(f"{self.cfg.model_dir}/{policy_step}")
-            global_episode = self.dataserver.DATASERVER_GET_EPISODE()
-            if global_episode >= self.cfg.max_episode:
-                break
-            time.sleep(1)
-    
+        return self.param_store.step, self.param_store
 
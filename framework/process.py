@@ -0,0 +1,113 @@
+import threading
+import traceback
+import torch.multiprocessing as mp
+from multiprocessing.connection import wait
+from framework.message import Msg
+from framework.perf import tracer, trace_msg
+
+class RemoteError(Exception):
+    ''' error raised inside a process actor, carries the remote traceback
+    '''
+    pass
+
+def _serve(cls, args, kwargs, conns, trace_buffer_size = None):
+    ''' create the component in this process and answer pub_msg requests from all connections,
+        trace events of this process are sent back on close if tracing is enabled
+    '''
+    if trace_buffer_size is not None:
+        tracer.enable(trace_buffer_size, process_name = cls.__name__)
+    try:
+        component, init_error = cls(*args, **kwargs), None
+    except Exception:
+        component, init_error = None, RemoteError(traceback.format_exc())
+    conns = list(conns)
+    while len(conns) > 0:
+        for conn in wait(conns):
+            try:
+                msg = conn.recv()
+            except EOFError: # client is gone
+                conns.remove(conn)
+                continue
+            if msg is None: # close
+                conn.send(tracer.get_events() if tracer.enabled else None)
+                return
+            if init_error is not None:
+                conn.send(init_error)
+                continue
+            try:
+                result = component.pub_msg(msg)
+            except Exception:
+                result = RemoteError(traceback.format_exc())
+            try:
+                conn.send(result)
+            except Exception: # e.g. result can not be pickled, the message is pickled before anything is written
+                conn.send(RemoteError(traceback.format_exc()))
+
+class ProcessActorHandle:
+    ''' Client side of a process actor, has the same pub_msg interface as the component,
+        each client (process or component) should use its own handle from ProcessActor.connect
+    '''
+    def __init__(self, conn) -> None:
+        self._conn = conn
+        self._lock = threading.Lock() # allow threads in the same process to share one handle
+
+    def __getstate__(self):
+        return {'_conn': self._conn}
+
+    def __setstate__(self, state):
+        self._conn = state['_conn']
+        self._lock = threading.Lock()
+
+    def send(self, msg: Msg):
+        ''' send a request without waiting, must be followed by recv
+        '''
+        self._conn.send(msg)
+
+    def recv(self):
+        result = self._conn.recv()
+        if isinstance(result, RemoteError):
+            raise result
+        return result
+
+    @trace_msg
+    def pub_msg(self, msg: Msg):
+        with self._lock:
+            self.send(msg)
+            return self.recv()
+
+class ProcessActor:
+    ''' Run a framework component (anything with pub_msg) in a torch.multiprocessing process,
+        requests are served over one pipe per client, all clients must connect before start
+    '''
+    def __init__(self, cls, *args, **kwargs) -> None:
+        self._ctx = mp.get_context('spawn') # safe with threads and cuda in the parent
+        self._cls, self._args, self._kwargs = cls, args, kwargs
+        self._server_conns = []
+        self._process = None
+        self._control = self.connect() # used to close the actor
+
+    def connect(self):
+        ''' create a new client handle
+        '''
+        if self._process is not None:
+            raise RuntimeError(f"connect to {self._cls.__name__} actor before it starts")
+        server_conn, client_conn = self._ctx.Pipe()
+        self._server_conns.append(server_conn)
+        return ProcessActorHandle(client_conn)
+
+    def start(self):
+        trace_buffer_size = tracer.buffer_size if tracer.enabled else None # trace the actor process as well
+        self._process = self._ctx.Process(target = _serve, args = (self._cls, self._args, self._kwargs, self._server_conns, trace_buffer_size), daemon = True)
+        self._process.start()
+        for conn in self._server_conns: # owned by the actor process now
+            conn.close()
+
+    def close(self):
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            trace_events = self._control.pub_msg(None)
+            if trace_events is not None:
+                tracer.add_remote_events(trace_events)
+        self._process.join()
+        self._process = None
@@ -13,13 +13,15 @@ from ray.util.queue import Queue, Empty, Full
 from pathlib import Path
 import pickle
 import logging
-from torch.utils.tensorboard import SummaryWriter  
 from framework.message import Msg, MsgType
+from framework.perf import trace_msg
+from framework.metrics import MetricsBuffer, create_sinks
 
 class BaseStatsRecorder:
     def __init__(self, cfg) -> None:
         self.cfg = cfg
         self._init_writter()
+    @trace_msg
     def pub_msg(self, msg: Msg):
         ''' publish message
         '''
@@ -27,20 +29,31 @@ class BaseStatsRecorder:
         if msg_type == MsgType.STATS_RECORDER_PUT_INTERACT_SUMMARY:
             interact_summary_list = msg_data
             self._add_summary(interact_summary_list, writter_type = 'interact')
+        elif msg_type == MsgType.STATS_RECORDER_PUT_POLICY_SUMMARY:
+            policy_summary_list = msg_data
+            self._add_summary(policy_summary_list, writter_type = 'policy')
+        elif msg_type == MsgType.STATS_RECORDER_PUT_PERF_SUMMARY:
+            step, perf_summary = msg_data
+            for key, value in perf_summary.items():
+                self.metrics.add_scalar('perf', key, value, step)
         else:
             raise NotImplementedError
     def _init_writter(self):
-        self.writters = {}
-        self.writter_types = ['interact','policy']
-        for writter_type in self.writter_types:
-            self.writters[writter_type] = SummaryWriter(log_dir=f"{self.cfg.tb_dir}/{writter_type}")
+        ''' scalars are buffered and written to sinks (tensorboard, csv, npz) on a background thread
+        '''
+        self.metrics = MetricsBuffer(create_sinks(self.cfg), window = self.cfg.metrics_window, flush_interval = self.cfg.metrics_flush_interval)
     
     def _add_summary(self, summary_all_entities, writter_type = None):
         for summary_each_entity in summary_all_entities:
             for summary_data in summary_each_entity:
                 step, summary = summary_data
                 for key, value in summary.items():
-                    self.writters[writter_type].add_scalar(tag = f"{self.cfg.mode.lower()}_{key}", scalar_value=value, global_step = step)
+                    self.metrics.add_scalar(writter_type, f"{self.cfg.mode.lower()}_{key}", value, step)
+
+    def close(self):
+        ''' flush buffered metrics and close sinks
+        '''
+        self.metrics.close()
 
 class SimpleStatsRecorder(BaseStatsRecorder):
     def __init__(self, cfg) -> None:
@@ -57,6 +70,7 @@ class RayStatsRecorder(BaseStatsRecorder):
 class BaseLogger(object):
     def __init__(self, fpath = None) -> None:
         Path(fpath).mkdir(parents=True, exist_ok=True)
+        self.fpath = fpath
         self.logger = logging.getLogger(name="BaseLog")  
         self.logger.setLevel(logging.INFO) # default level is INFO
         self.formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s: - %(message)s',
@@ -68,6 +82,10 @@ class BaseLogger(object):
         self.logger.addHandler(fh)
     def info(self, msg):
         self.logger.info(msg)
+    def __reduce__(self):
+        ''' recreate handlers when sent to another process
+        '''
+        return (self.__class__, (self.fpath,))
 
 class SimpleLogger(BaseLogger):
     ''' Simple logger for print log to console
@@ -2,10 +2,19 @@ import ray
 class BaseTester:
     ''' Base class for online tester
     '''
-    def __init__(self, cfg, env = None) -> None:
+    def __init__(self, cfg, env = None, policy = None, checkpointer = None) -> None:
         self.cfg = cfg
         self.env = env
+        self.policy = policy # eval policy, params are pulled from the policy manager's shared store
+        self.checkpointer = checkpointer
         self.best_eval_reward = -float('inf')
+        self.params_version = -1 # version of params in eval policy
+        self._last_eval_step = 0
+
+    def get_checkpoints(self):
+        ''' checkpoints on disk, each with its update step and online eval reward if evaluated
+        '''
+        return self.checkpointer.inventory() if self.checkpointer is not None else []
     def run(self, policy, *args, **kwargs):
         ''' Run online tester
         '''
@@ -15,8 +24,8 @@ class BaseTester:
 class SimpleTester(BaseTester):
     ''' Simple online tester
     '''
-    def __init__(self, cfg, env = None) -> None:
-        super().__init__(cfg, env)
+    def __init__(self, cfg, env = None, policy = None, checkpointer = None) -> None:
+        super().__init__(cfg, env, policy, checkpointer)
     def eval(self, policy, global_update_step = 0, logger = None):
         sum_eval_reward = 0
         for _ in range(self.cfg.online_eval_episode):
@@ -33,20 +42,26 @@ class SimpleTester(BaseTester):
                     break
         mean_eval_reward = sum_eval_reward / self.cfg.online_eval_episode
         logger.info(f"update_step: {global_update_step}, online_eval_reward: {mean_eval_reward:.3f}")
+        if self.checkpointer is not None: # policy manager has saved this step, the checkpointer attaches the reward to it and keeps the best ones
+            self.checkpointer.put_eval_reward(global_update_step, mean_eval_reward)
         if mean_eval_reward >= self.best_eval_reward:
             logger.info(f"current update step obtain a better online_eval_reward: {mean_eval_reward:.3f}, save the best model!")
-            policy.save_model(f"{self.cfg.model_dir}/best")
+            if self.checkpointer is None:
+                policy.save_model(f"{self.cfg.model_dir}/best")
             self.best_eval_reward = mean_eval_reward
         summary_data = [(global_update_step,{"online_eval_reward": mean_eval_reward})]
         output = {"summary":summary_data}
         return output
-    def run(self, policy, *args, **kwargs):
-        ''' Run online tester
+    def run(self, param_store, *args, **kwargs):
+        ''' Run online tester on the latest published params, once every model_save_fre update steps
+            as policy manager saves checkpoints, so each eval reward belongs to a saved checkpoint
         '''
-        dataserver, logger = kwargs['dataserver'], kwargs['logger']
-        global_update_step = dataserver.get_update_step() # get global update step
-        if global_update_step % self.cfg.model_save_fre == 0 and self.cfg.online_eval == True:
-            return self.eval(policy, global_update_step = global_update_step, logger = logger)
+        update_step, logger = param_store.step, kwargs['logger']
+        if not self.cfg.online_eval or update_step // self.cfg.model_save_fre <= self._last_eval_step // self.cfg.model_save_fre:
+            return None
+        self._last_eval_step = update_step
+        self.params_version = param_store.pull(self.policy, self.params_version)
+        return self.eval(self.policy, global_update_step = update_step, logger = logger)
     
 @ray.remote
 class RayTester(BaseTester):
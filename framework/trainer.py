@@ -1,5 +1,8 @@
 import time
+import threading
+from queue import Queue, Empty, Full
 from framework.message import Msg, MsgType
+from framework.perf import perf_timers, IterProfiler
 class BaseTrainer:
     def __init__(self, cfg, *args,**kwargs) -> None:
         self.cfg = cfg
@@ -11,6 +14,18 @@ class BaseTrainer:
         self.dataserver = kwargs['dataserver']
         self.stats_recorder = kwargs['stats_recorder']
         self.logger = kwargs['logger']
+        perf_timers.enable(cfg.perf_timers)
+        self.profiler = IterProfiler(cfg.perf_profiler, cfg.perf_profile_iters, cfg.task_dir)
+        self.i_iter = 0 # number of trainer iterations
+
+    def _end_iter(self):
+        ''' record perf scalars per window and advance the profiler
+        '''
+        self.i_iter += 1
+        self.profiler.step()
+        if perf_timers.enabled and self.i_iter % self.cfg.perf_summary_fre == 0:
+            with perf_timers.timer('stats_record'):
+                self.stats_recorder.pub_msg(Msg(type = MsgType.STATS_RECORDER_PUT_PERF_SUMMARY, data = (self.i_iter, perf_timers.pop_summary())))
 
     def run(self):
         raise NotImplementedError
@@ -18,37 +33,137 @@ class BaseTrainer:
 class SimpleTrainer(BaseTrainer):
     def __init__(self, cfg, *args,**kwargs) -> None:
         super().__init__(cfg, *args, **kwargs)
+        self.published_step = 0 # update step of the latest params published to policy manager
+
+    def _put_interact_outputs(self, interact_outputs):
+        ''' put sampled exps to collector and interact summaries to stats recorder
+        '''
+        with perf_timers.timer('collector_put_exps'):
+            self.collector.pub_msg(Msg(type = MsgType.COLLECTOR_PUT_EXPS, data = [interact_output['exps'] for interact_output in interact_outputs]))
+        with perf_timers.timer('stats_record'):
+            self.stats_recorder.pub_msg(Msg(type = MsgType.STATS_RECORDER_PUT_INTERACT_SUMMARY, data = [interact_output['interact_summary'] for interact_output in interact_outputs]))
+
+    def _publish_updated_model_params(self):
+        ''' publish the latest params from learner to policy manager
+        Returns:
+            published (bool): whether learner has published new params since last call
+        '''
+        updated_model_params_list = self.learner.pub_msg(Msg(type = MsgType.LEARNER_GET_UPDATED_MODEL_PARAMS_QUEUE))
+        if len(updated_model_params_list) == 0:
+            return False
+        # only the latest params are needed, policy manager copies them into its shared store
+        self.policy_mgr.pub_msg(Msg(type = MsgType.POLICY_MGR_PUT_MODEL_PARAMS, data = updated_model_params_list[-1]))
+        self.published_step = updated_model_params_list[-1][0]
+        return True
+
+    def _online_test(self):
+        ''' evaluate the latest published params when policy manager has saved them as a checkpoint
+        '''
+        param_store = self.policy_mgr.pub_msg(Msg(type = MsgType.POLICY_MGR_GET_MODEL_PARAMS))
+        with perf_timers.timer('online_eval'):
+            online_tester_output = self.online_tester.run(param_store, logger = self.logger)
+        if online_tester_output is not None:
+            self.stats_recorder.pub_msg(Msg(type = MsgType.STATS_RECORDER_PUT_POLICY_SUMMARY, data = [online_tester_output['summary']]))
 
-    def learn(self):
-        n_steps_per_learn = self.collector.get_buffer_length() if self.cfg.onpolicy_flag else self.cfg.n_steps_per_learn
-        for _ in range(n_steps_per_learn):
-            training_data = self.collector.get_training_data() # get training data
-            learner_output = self.learner.run(training_data, dataserver = self.dataserver) # run learner
-            if learner_output is not None:
-                policy = self.learner.POLICY_MGR_GET_MODEL_PARAMS() # get policy from main learner
-                self.collector.handle_data_after_learn(learner_output['policy_data_after_learn']) # handle exps after update
-                self.stats_recorder.add_summary([learner_output['policy_summary']], writter_type = 'policy')
-                online_tester_output = self.online_tester.run(policy, dataserver = self.dataserver, logger = self.logger) # online evaluation
-                if online_tester_output is not None:
-                    self.stats_recorder.add_summary([online_tester_output['summary']], writter_type = 'policy')
     def run(self):
+        if self.cfg.async_train:
+            return self.run_async()
         self.logger.info(f"Start {self.cfg.mode}ing!") # print info
         s_t = time.time() # start time
+        # interactors share the policy with learner in serial mode, unless they run in other processes
+        share_policy = self.cfg.mp_backend != 'process'
+        self.profiler.start()
         while True:
-            # get model params
-            model_params = self.policy_mgr.pub_msg(Msg(type = MsgType.POLICY_MGR_GET_MODEL_PARAMS))
             # interact with env and sample data
-            interact_outputs = self.vec_interactor.pub_msg(Msg(type = MsgType.INTERACTOR_SAMPLE, data = model_params))
+            with perf_timers.timer('interact'):
+                model_params = None if share_policy else self.policy_mgr.pub_msg(Msg(type = MsgType.POLICY_MGR_GET_MODEL_PARAMS))
+                interact_outputs = self.vec_interactor.pub_msg(Msg(type = MsgType.INTERACTOR_SAMPLE, data = model_params))
             # deal with sampled data
-            self.collector.pub_msg(Msg(type = MsgType.COLLECTOR_PUT_EXPS, data = [interact_output['exps'] for interact_output in interact_outputs]))
-            self.stats_recorder.pub_msg(Msg(type = MsgType.STATS_RECORDER_PUT_INTERACT_SUMMARY, data = [interact_output['summary'] for interact_output in interact_outputs]))
+            self._put_interact_outputs(interact_outputs)
             if self.cfg.mode == "train": 
-                self.learner.pub_msg(Msg(type = MsgType.LEARNER_UPDATE_POLICY, data = model_params))
-                updated_model_params_queue = self.learner.pub_msg(Msg(type = MsgType.LEARNER_GET_UPDATED_MODEL_PARAMS_QUEUE))
-                while not updated_model_params_queue.empty():
-                    update_step, updated_model_params = updated_model_params_queue.get()
-                    self.policy_mgr.pub_msg(Msg(type = MsgType.POLICY_MGR_PUT_MODEL_PARAMS, data = (update_step, updated_model_params)))
-            if self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_GET_EPISODE)):
+                with perf_timers.timer('learner_update'):
+                    self.learner.pub_msg(Msg(type = MsgType.LEARNER_UPDATE_POLICY, data = None))
+                with perf_timers.timer('param_sync'):
+                    published = self._publish_updated_model_params()
+                if published:
+                    self._online_test()
+            self._end_iter()
+            if self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_CHECK_TASK_END)):
                 break    
+        self.profiler.stop()
         e_t = time.time() # end time
         self.logger.info(f"Finish {self.cfg.mode}ing! Time cost: {e_t - s_t:.3f} s") # print info      
+
+    def _interact_async(self, exps_queue: Queue, stop_event: threading.Event):
+        ''' keep sampling with the latest published params and feed exps to the bounded queue
+        '''
+        try:
+            while not stop_event.is_set():
+                with perf_timers.timer('interact'):
+                    update_step, param_store = self.policy_mgr.pub_msg(Msg(type = MsgType.POLICY_MGR_GET_LATEST_MODEL_PARAMS))
+                    interact_outputs = self.vec_interactor.pub_msg(Msg(type = MsgType.INTERACTOR_SAMPLE, data = param_store)) # interactors re-sync only if version changed
+                while not stop_event.is_set(): # block when queue is full (backpressure), but stay responsive to stop
+                    try:
+                        exps_queue.put((update_step, interact_outputs), timeout = 0.1)
+                        break
+                    except Full:
+                        continue
+                if self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_CHECK_TASK_END)):
+                    break
+        except Exception as e:
+            self._interact_error = e
+        finally:
+            stop_event.set()
+
+    def run_async(self):
+        ''' interactors sample on a background thread while the learner consumes exps on the main thread,
+            exps are passed through a bounded queue and params are published back through policy manager
+        '''
+        self.logger.info(f"Start {self.cfg.mode}ing asynchronously!") # print info
+        s_t = time.time() # start time
+        self._interact_error = None
+        exps_queue = Queue(maxsize = self.cfg.async_queue_size)
+        stop_event = threading.Event()
+        interact_thread = threading.Thread(target = self._interact_async, args = (exps_queue, stop_event), daemon = True)
+        interact_thread.start()
+        self.profiler.start() # only the learner thread is captured by cProfile
+        latest_exps_step = 0 # policy version (update step) of the latest consumed exps
+        learner_idle = True # nothing was learned last time, e.g. buffer is not ready
+        def too_stale(update_step):
+            # exps can only be as fresh as the latest published params, so the bound holds up to policy_publish_fre
+            return update_step - latest_exps_step >= self.cfg.async_max_staleness and latest_exps_step < self.published_step
+        while True:
+            update_step = self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_GET_UPDATE_STEP))
+            # block for new exps if the learner has nothing to do or runs too far ahead of the interactors
+            wait_exps = learner_idle or too_stale(update_step)
+            n_got = 0
+            while True:
+                try:
+                    exps_step, interact_outputs = exps_queue.get(timeout = 0.1) if wait_exps and n_got == 0 else exps_queue.get_nowait()
+                except Empty:
+                    if wait_exps and n_got == 0 and not stop_event.is_set():
+                        continue
+                    break
+                self._put_interact_outputs(interact_outputs)
+                latest_exps_step = max(latest_exps_step, exps_step)
+                n_got += 1
+            if stop_event.is_set() and exps_queue.empty():
+                break
+            if too_stale(update_step): # exps are still too old, wait for fresher ones instead of learning on them
+                self._end_iter()
+                continue
+            if self.cfg.mode == "train":
+                with perf_timers.timer('learner_update'):
+                    self.learner.pub_msg(Msg(type = MsgType.LEARNER_UPDATE_POLICY, data = None)) # learner owns the latest params
+                with perf_timers.timer('param_sync'):
+                    published = self._publish_updated_model_params()
+                if published:
+                    self._online_test()
+                learner_idle = self.dataserver.pub_msg(Msg(type = MsgType.DATASERVER_GET_UPDATE_STEP)) == update_step
+            self._end_iter()
+        self.profiler.stop()
+        interact_thread.join()
+        if self._interact_error is not None:
+            raise self._interact_error
+        e_t = time.time() # end time
+        self.logger.info(f"Finish {self.cfg.mode}ing! Time cost: {e_t - s_t:.3f} s") # print info
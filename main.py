@@ -3,27 +3,30 @@
 # curr_path = os.path.dirname(os.path.abspath(__file__))  # current path
 # parent_path = os.path.dirname(curr_path)  # parent path 
 # sys.path.append(parent_path)  # add path to system path
-import sys,os
+import sys,os,copy
 import argparse,datetime,importlib,yaml,time 
-import gymnasium as gym
 import torch.multiprocessing as mp
 from pathlib import Path
 from config.general_config import GeneralConfig, MergedConfig, DefaultConfig
 from framework.collector import SimpleCollector, RayCollector
 from framework.dataserver import SimpleDataServer, RayDataServer
-from framework.interactor import DummyVecInteractor
+from framework.interactor import DummyVecInteractor, BatchVecInteractor, SubprocVecInteractor, NumpyVecInteractor, ProcessVecInteractor
 from framework.learner import SimpleLearner
 from framework.recorder import SimpleStatsRecorder, RayStatsRecorder, SimpleLogger, RayLogger, SimpleTrajCollector
 from framework.tester import SimpleTester, RayTester
 from framework.trainer import SimpleTrainer
-from framework.policy_mgr import PolicyMgr
+from framework.policy_mgr import PolicyMgr, SharedParamStore
+from framework.process import ProcessActor
+from framework.checkpointer import Checkpointer, get_checkpoint_path
+from framework.perf import tracer
+from envs.base.utils import make_env, get_n_frame_stack
 
 from utils.utils import save_cfgs, merge_class_attrs, all_seed,save_frames_as_gif
 
 class Main(object):
-    def __init__(self) -> None:
+    def __init__(self, cfg_path = None) -> None:
         self.get_default_cfg()  # get default config
-        self.process_yaml_cfg()  # load yaml config
+        self.process_yaml_cfg(cfg_path)  # load yaml config
         self.merge_cfgs() # merge all configs
         self.create_dirs()  # create dirs
         all_seed(seed=self.general_cfg.seed)  # set seed == 0 means no seed
@@ -63,17 +66,19 @@ class Main(object):
         env_mod = importlib.import_module(f"envs.{self.env_name}.config") # import env config
         self.env_cfg = env_mod.EnvConfig()
 
-    def process_yaml_cfg(self):
-        ''' load yaml config
+    def process_yaml_cfg(self, cfg_path = None):
+        ''' load yaml config, from command line argument '-c' if cfg_path is not given
         '''
-        parser = argparse.ArgumentParser(description="hyperparameters")
-        parser.add_argument('-c', default=None, type=str,
+        if cfg_path is None:
+            parser = argparse.ArgumentParser(description="hyperparameters")
+            parser.add_argument('-c', default=None, type=str,
 
-                            help='the path of config file')
-        args = parser.parse_args()
+                                help='the path of config file')
+            args = parser.parse_args()
+            cfg_path = args.c
         # load config from yaml file
-        if args.c is not None:
-            with open(args.c) as f:
+        if cfg_path is not None:
+            with open(cfg_path) as f:
                 load_cfg = yaml.load(f, Loader=yaml.FullLoader)
                 # load general config
                 self.load_yaml_cfg(self.general_cfg,load_cfg,'general_cfg')
@@ -125,18 +130,12 @@ class Main(object):
             config_dir(v,name=k)
 
     def create_single_env(self):
-        ''' create single env
+        ''' create single env, spaces are taken after the wrapper is applied as interactors create the same env
         '''
-        env_cfg_dic = self.env_cfg.__dict__
-        kwargs = {k: v for k, v in env_cfg_dic.items() if k not in env_cfg_dic['ignore_params']}
-        env = gym.make(**kwargs)
+        env = make_env(self.env_cfg)
         setattr(self.cfg, 'obs_space', env.observation_space)
         setattr(self.cfg, 'action_space', env.action_space)
-        if self.env_cfg.wrapper is not None:
-            wrapper_class_path = self.env_cfg.wrapper.split('.')[:-1]
-            wrapper_class_name = self.env_cfg.wrapper.split('.')[-1]
-            env_wapper = __import__('.'.join(wrapper_class_path), fromlist=[wrapper_class_name])
-            env = getattr(env_wapper, wrapper_class_name)(env)
+        setattr(self.cfg, 'n_frame_stack', get_n_frame_stack(env)) # e.g. checked by REPLAY_FRAME buffer
         return env
     
     def policy_config(self, cfg):
@@ -147,10 +146,36 @@ class Main(object):
         data_handler_mod = importlib.import_module(f"algos.{cfg.algo_name}.data_handler")
         policy = policy_mod.Policy(cfg) 
         if cfg.load_checkpoint:
-            policy.load_model(f"tasks/{cfg.load_path}/models/{cfg.load_model_step}")
+            policy.load_model(get_checkpoint_path(f"tasks/{cfg.load_path}/models", cfg.load_model_step))
         data_handler = data_handler_mod.DataHandler(cfg)
         return policy, data_handler
 
+    def create_vec_interactor(self, policy, **kwargs):
+        ''' create vectorized interactor according to interactor mode
+        '''
+        if self.cfg.mp_backend == 'subproc':
+            return SubprocVecInteractor(self.cfg, policy = policy, **kwargs)
+        if self.cfg.interactor_mode == 'batch':
+            return BatchVecInteractor(self.cfg, policy = policy, **kwargs)
+        if self.cfg.interactor_mode == 'numpy':
+            return NumpyVecInteractor(self.cfg, policy = policy, **kwargs)
+        return DummyVecInteractor(self.cfg, policy = policy, **kwargs)
+
+    def create_process_components(self, policy, data_handler, param_store):
+        ''' run collector, learner and interactors in torch.multiprocessing processes,
+            the returned handles talk to them with pub_msg as the in-process components do,
+            params go from learner to interactors through the shared param store of policy manager
+        '''
+        dataserver = SimpleDataServer(self.cfg) # counters are in shared memory, every process reads them locally
+        collector_actor = ProcessActor(SimpleCollector, self.cfg, data_handler = data_handler)
+        learner_actor = ProcessActor(SimpleLearner, self.cfg, policy = policy, collector = collector_actor.connect(), dataserver = dataserver, param_store = param_store)
+        vec_interactor = ProcessVecInteractor(self.cfg, policy = policy, dataserver = dataserver, logger = self.logger, param_store = param_store)
+        collector, learner = collector_actor.connect(), learner_actor.connect()
+        actors = [collector_actor, learner_actor]
+        for actor in actors: # all handles are connected, start serving
+            actor.start()
+        return dataserver, vec_interactor, collector, learner, actors
+
     def check_sample_length(self,cfg):
         ''' check  sample length
         '''
@@ -161,6 +186,8 @@ class Main(object):
             setattr(self.cfg, 'batch_size', -1)
         if not hasattr(cfg, 'batch_episode'):
             setattr(self.cfg, 'batch_episode', -1)
+        if not hasattr(cfg, 'buffer_type'): # e.g. tabular algos keep transitions in their own data handler
+            setattr(self.cfg, 'buffer_type', 'NONE')
         if cfg.buffer_type.lower().startswith('onpolicy'): # on policy
             onpolicy_flag = True
             if cfg.batch_size > 0 and cfg.batch_episode > 0:
@@ -180,17 +207,28 @@ class Main(object):
         setattr(self.cfg, 'n_sample_steps', n_sample_steps)
         setattr(self.cfg, 'n_sample_episodes', n_sample_episodes)
 
-    def run(self) -> None:
+    def create_trainer(self):
+        ''' create all components and the trainer
+        '''
+        if self.cfg.trace_events: # enable before components are created, so process actors trace as well
+            tracer.enable(self.cfg.trace_buffer_size)
         test_env = self.create_single_env() # create single env
         policy, data_handler = self.policy_config(self.cfg) # configure policy and data_handler
-        vec_interactor = DummyVecInteractor(self.cfg)
-        learner = SimpleLearner(self.cfg, policy = policy)
-        online_tester = SimpleTester(self.cfg, test_env) # create online tester
-        collector = SimpleCollector(self.cfg, data_handler = data_handler)
-        dataserver = SimpleDataServer(self.cfg)
-        policy_mgr = PolicyMgr(self.cfg, policy, dataserver = dataserver)
-        stats_recorder = SimpleStatsRecorder(self.cfg) # create stats recorder
         self.logger = SimpleLogger(self.cfg.log_dir)
+        param_store = SharedParamStore(policy.get_model_params()) # latest params, kept by policy manager
+        if self.cfg.mp_backend == 'process':
+            dataserver, vec_interactor, collector, learner, actors = self.create_process_components(policy, data_handler, param_store)
+        else:
+            dataserver = SimpleDataServer(self.cfg)
+            interact_policy = copy.deepcopy(policy) if self.cfg.async_train else policy # interactors need their own policy when sampling concurrently with the learner
+            vec_interactor = self.create_vec_interactor(interact_policy, dataserver = dataserver, logger = self.logger)
+            collector = SimpleCollector(self.cfg, data_handler = data_handler)
+            learner = SimpleLearner(self.cfg, policy = policy, collector = collector, dataserver = dataserver)
+            actors = []
+        checkpointer = Checkpointer(self.cfg) # write checkpoints in background
+        online_tester = SimpleTester(self.cfg, test_env, policy = copy.deepcopy(policy), checkpointer = checkpointer) # create online tester with its own eval policy
+        policy_mgr = PolicyMgr(self.cfg, policy, dataserver = dataserver, checkpointer = checkpointer, param_store = param_store)
+        stats_recorder = SimpleStatsRecorder(self.cfg) # create stats recorder
         self.print_cfgs()  # print config
         trainer = SimpleTrainer(self.cfg, 
                                 policy_mgr = policy_mgr,
@@ -201,7 +239,32 @@ class Main(object):
                                 dataserver = dataserver,
                                 stats_recorder = stats_recorder, 
                                 logger = self.logger) # create trainer
+        self.vec_interactor, self.actors, self.checkpointer, self.stats_recorder = vec_interactor, actors, checkpointer, stats_recorder
+        return trainer
+
+    def close(self):
+        ''' stop processes and threads of components after running
+        '''
+        self.vec_interactor.close_envs()
+        for actor in self.actors:
+            actor.close()
+        self.checkpointer.close() # wait for pending checkpoints
+        self.stats_recorder.close() # flush buffered metrics
+        if tracer.enabled:
+            self.dump_trace()
+
+    def dump_trace(self, fpath = None):
+        ''' write the timeline of all processes as Chrome Trace Event json, viewable in Perfetto,
+            events of process actors are collected when they close
+        '''
+        fpath = f"{self.cfg.task_dir}/trace.json" if fpath is None else fpath
+        tracer.dump(fpath)
+        self.logger.info(f"Trace events saved to {fpath}")
+
+    def run(self) -> None:
+        trainer = self.create_trainer()
         trainer.run() # run trainer
+        self.close()
         save_cfgs(self.save_cfgs, self.cfg.task_dir)  # save config
 
 if __name__ == "__main__":
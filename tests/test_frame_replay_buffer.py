@@ -0,0 +1,76 @@
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from gymnasium.spaces import Box
+
+from algos.base.buffers import FrameReplayBuffer
+from algos.base.exps import Exp
+
+N_STACK = 4
+FRAME_SHAPE = (3, 2)
+
+def make_cfg(obs_shape = (N_STACK, *FRAME_SHAPE), n_frame_stack = N_STACK, buffer_size = 64, batch_size = 16, frame_buffer_margin = 8):
+    return SimpleNamespace(buffer_size = buffer_size, batch_size = batch_size, frame_buffer_margin = frame_buffer_margin,
+                           obs_space = Box(0, 255, shape = obs_shape, dtype = np.uint8), n_frame_stack = n_frame_stack)
+
+def push_streams(buffer, n_steps, n_streams = 3, seed = 0):
+    ''' push interleaved transitions of several FrameStack-like streams with short episodes,
+        actions are unique so each sampled transition can be looked up
+    '''
+    rng = np.random.default_rng(seed)
+    stacks, pushed = {}, {}
+    for action in range(n_steps):
+        stream_id = action % n_streams
+        if stream_id not in stacks: # reset repeats the first frame as FrameStack does
+            frame = rng.integers(0, 256, size = FRAME_SHAPE, dtype = np.uint8)
+            stacks[stream_id] = deque([frame] * N_STACK, maxlen = N_STACK)
+        state = np.stack(stacks[stream_id])
+        stacks[stream_id].append(rng.integers(0, 256, size = FRAME_SHAPE, dtype = np.uint8))
+        next_state = np.stack(stacks[stream_id])
+        done = bool(rng.random() < 0.2)
+        reward = float(rng.random())
+        buffer.push([Exp(state = state, action = action, reward = reward, next_state = next_state, done = done, interactor_id = stream_id)])
+        pushed[action] = (state, next_state, reward, done)
+        if done:
+            del stacks[stream_id]
+    return pushed
+
+def check_batch(batch, pushed):
+    for i, action in enumerate(batch['actions']):
+        state, next_state, reward, done = pushed[int(action)]
+        np.testing.assert_array_equal(batch['states'][i], state)
+        np.testing.assert_array_equal(batch['next_states'][i], next_state)
+        assert batch['rewards'][i] == np.float32(reward)
+        assert batch['dones'][i] == float(done)
+
+@pytest.mark.parametrize('sequential', [False, True])
+def test_sampled_transitions_match_pushed(sequential):
+    buffer = FrameReplayBuffer(make_cfg())
+    pushed = push_streams(buffer, n_steps = 500) # wraps around both the transition and frame arrays
+    for _ in range(50):
+        batch = buffer.sample(sequential = sequential)
+        assert batch['states'].shape == (16, N_STACK, *FRAME_SHAPE)
+        check_batch(batch, pushed)
+
+def test_sequential_sample_is_in_insertion_order():
+    buffer = FrameReplayBuffer(make_cfg())
+    push_streams(buffer, n_steps = 500)
+    for _ in range(50):
+        actions = buffer.sample(sequential = True)['actions']
+        np.testing.assert_array_equal(np.diff(actions), 1)
+
+def test_not_enough_transitions():
+    buffer = FrameReplayBuffer(make_cfg())
+    push_streams(buffer, n_steps = 10)
+    assert buffer.sample() is None
+
+@pytest.mark.parametrize('obs_shape, n_frame_stack', [
+    ((210, 160, 3), None), # raw Atari frames without a FrameStack wrapper
+    ((210, 160, 3), 4),
+    ((N_STACK,), N_STACK),
+])
+def test_rejects_obs_without_frame_stack(obs_shape, n_frame_stack):
+    with pytest.raises(ValueError):
+        FrameReplayBuffer(make_cfg(obs_shape = obs_shape, n_frame_stack = n_frame_stack))